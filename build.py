@@ -1,6 +1,6 @@
 #! /usr/bin/env python3
 # Requirements: Xcode, Xcode Command Line tools, npm, python3
-import argparse, pathlib
+import argparse, hashlib, json, pathlib, sys, time
 
 import scripts.python.upi_utility as utility
 import scripts.python.upi_unity_native_plugin_manager as plugin_manager
@@ -9,87 +9,228 @@ import scripts.python.upi_toolchain as toolchain
 from datetime import datetime
 from pathlib import Path
 
-from scripts.python.upi_cli_argument_options import PluginID, PlatformID, ConfigID, BuildActionID, CleanActionID, CodeSignActionID
-from scripts.python.upi_build_context import BuildContext
+from scripts.python.upi_cli_argument_options import PluginID, PlatformID, ConfigID, BuildActionID, CleanActionID, CodeSignActionID, BuildProfileID, CommandTypeID
+from scripts.python.upi_build_context import BuildContext, BUILD_PROFILE_TABLE
+from scripts.python.upi_build_api import BuildEnvironment, BuildResult
+from scripts.python.upi_build_history import BuildHistory
+from scripts.python.upi_build_journal import BuildJournal
+from scripts.python.upi_build_retention import OutputRetention, RetentionPolicy, DeduplicateTree
+from scripts.python.upi_change_selection import GetChangedPaths, GetChangedPluginIDs, GetReverseDependencyClosure, GetDependencyClosure, IsGlobalInputPath
+from scripts.python.upi_build_shards import BuildShard, ShardMerge, ParseShardSpec, GetJobWeights
+from scripts.python.upi_compiler_cache import CompilerCache
+from scripts.python.upi_library_cache import UnityLibraryCache
+from scripts.python.upi_test_cache import TestResultCache
+from scripts.python.upi_editmode_tests import PrintEditModeSummary
+from scripts.python.upi_unity_worker_pool import UnityWorkerPool
+from scripts.python.upi_host_locks import HostSemaphore, HostLockSet, HostLockModeID, DEFAULT_HOST_LOCK_ROOT
+from scripts.python.upi_job_scheduler import AdmissionController, JobExecutor, TaskStatusID, GIB
+from scripts.python.upi_parallel_gzip import ParallelGzip
+from scripts.python.upi_source_overlay import SourceOverlay
+from scripts.python.upi_native_manifest import NativeOutputManifest
 from scripts.python.upi_utility import PromptColor, Printer
 
 # Set a script version to track evolution
 build_script_version = "2.2.2"
 
-#---------------------
-# Create Build Context
-
-# Create context and configure default paths
-CTX = BuildContext(Path().resolve(__file__))
-
 # ------------------------
 # Handle command line args
 
-argument_parser = argparse.ArgumentParser(description="Builds all native libraries, packages plug-ins, and moves packages to build folder.")
-argument_parser.add_argument("-p", "--plugin-list", dest="plugin_list", nargs='*', default=[PluginID.ALL], help=f"Selects the plug-ins to process. Possible values are: {PluginID.ACCESSIBILITY}, {PluginID.CORE}, {PluginID.CORE_HAPTICS}, {PluginID.GAME_CONTROLLER}, {PluginID.SPATIAL_CONTROLLER}, {PluginID.GAME_KIT}, {PluginID.PHASE}, or {PluginID.ALL}. Default is: {PluginID.ALL}")
-argument_parser.add_argument("-m", "--platforms", dest="platform_list", nargs='*', default=[PlatformID.ALL], help=f"Selects the desired platforms to target when building native libraries. Possible values are: {PlatformID.IOS}, {PlatformID.IOS_SIMULATOR}, {PlatformID.MACOS}, {PlatformID.TVOS}, {PlatformID.TVOS_SIMULATOR}, {PlatformID.VISIONOS}, {PlatformID.VISIONOS_SIMULATOR}, {PlatformID.SIMULATORS}, {PlatformID.DEVICES} or {PlatformID.ALL}. Default is: {PlatformID.ALL}")
-argument_parser.add_argument("-b", "--build-action", dest="build_actions", nargs='*', default=[BuildActionID.BUILD, BuildActionID.PACK], help=f"Sets the build actions for the selected plug-ins. Possible values are: {BuildActionID.BUILD}, {BuildActionID.PACK}, {BuildActionID.NONE} or {BuildActionID.ALL}. Defaults are: {BuildActionID.BUILD}, {BuildActionID.PACK}")
-argument_parser.add_argument("-bc","--build-config", dest="build_config", default=ConfigID.ALL, help=f"Sets the build configuration to compile. Possible values are: {ConfigID.RELEASE}, {ConfigID.DEBUG}, or {ConfigID.ALL} which builds all other configs. Default is: {ConfigID.ALL}")
-argument_parser.add_argument("-c", "--codesign-identity", dest="codesign_identity", default=str(), help=f"Signs compiled native libraries with provided code signing identity hash or prompts the user to select from a list of identities on the system when {CodeSignActionID.PROMPT} is passed.")
-argument_parser.add_argument("-u", "--unity-installation-root", dest="unity_installation_root", default="", help="Root path to search for Unity installations when building tests. Note: performs a full recursive search of the given directory.")
-argument_parser.add_argument("-o", "--output-path", dest="output_path", default=CTX.build_output_path, help=f"Build result path for final packages. Default: {CTX.build_output_path}")
-argument_parser.add_argument("-k", "--clean-action", dest="clean_actions", nargs='*', default=[CleanActionID.NONE], help=f"Sets the clean actions for the selected plug-ins. Possible values are: {CleanActionID.NATIVE}, {CleanActionID.PACKAGES}, {CleanActionID.TESTS}, {CleanActionID.NONE}, or {CleanActionID.ALL}. Defaults to no clean action.")
-argument_parser.add_argument("-f", "--force", dest="force_clean", action="store_true", help="Setting this option will not prompt user on file deletion during clean operations.")
-argument_parser.add_argument("-t", "--test", dest="build_tests", action="store_true", help="Builds Unity tests for each plug-in.")
-argument_parser.add_argument("-to", "--test-output-path", dest="test_output_path", default=CTX.test_build_root, help=f"Output path for test build results. Default: {CTX.test_build_root}")
-argument_parser.add_argument("-nc", "--no-color", dest="no_color", action="store_true", help="Use no color in the terminal output. Default: terminal output is colorized.")
-
-build_args = argument_parser.parse_args()
+# Returns the parser for build.py's command line. Default paths are those of the checkout at 'root_path'.
+def CreateArgumentParser(root_path : Path) -> argparse.ArgumentParser:
+    # Default paths
+    CTX = BuildContext(root_path)
+
+    argument_parser = argparse.ArgumentParser(description="Builds all native libraries, packages plug-ins, and moves packages to build folder.")
+    argument_parser.add_argument("-p", "--plugin-list", dest="plugin_list", nargs='*', default=[PluginID.ALL], help=f"Selects the plug-ins to process. Possible values are: {PluginID.ACCESSIBILITY}, {PluginID.CORE}, {PluginID.CORE_HAPTICS}, {PluginID.GAME_CONTROLLER}, {PluginID.SPATIAL_CONTROLLER}, {PluginID.GAME_KIT}, {PluginID.PHASE}, or {PluginID.ALL}. Default is: {PluginID.ALL}")
+    argument_parser.add_argument("-m", "--platforms", dest="platform_list", nargs='*', default=[PlatformID.ALL], help=f"Selects the desired platforms to target when building native libraries. Possible values are: {PlatformID.IOS}, {PlatformID.IOS_SIMULATOR}, {PlatformID.MACOS}, {PlatformID.TVOS}, {PlatformID.TVOS_SIMULATOR}, {PlatformID.VISIONOS}, {PlatformID.VISIONOS_SIMULATOR}, {PlatformID.SIMULATORS}, {PlatformID.DEVICES} or {PlatformID.ALL}. Default is: {PlatformID.ALL}")
+    argument_parser.add_argument("-b", "--build-action", dest="build_actions", nargs='*', default=[BuildActionID.BUILD, BuildActionID.PACK], help=f"Sets the build actions for the selected plug-ins. Possible values are: {BuildActionID.BUILD}, {BuildActionID.PACK}, {BuildActionID.NONE} or {BuildActionID.ALL}. Defaults are: {BuildActionID.BUILD}, {BuildActionID.PACK}")
+    argument_parser.add_argument("-bc","--build-config", dest="build_config", default=ConfigID.ALL, help=f"Sets the build configuration to compile. Possible values are: {ConfigID.RELEASE}, {ConfigID.DEBUG}, or {ConfigID.ALL} which builds all other configs. Default is: {ConfigID.ALL}")
+    argument_parser.add_argument("--affected-since", dest="affected_since", default=None, help="Processes only the selected plug-ins with changes since the given git ref (e.g. origin/main), together with every plug-in whose package depends on them. Changes to build.py or scripts/ select every plug-in.")
+    argument_parser.add_argument("--all-tests", dest="all_tests", action="store_true", help="Runs every test assembly of the selected plug-ins. Default: with --affected-since, only the test assemblies which reference an assembly with changed C# files, directly or indirectly, are run.")
+    argument_parser.add_argument("-c", "--codesign-identity", dest="codesign_identity", default=str(), help=f"Signs compiled native libraries with provided code signing identity hash or prompts the user to select from a list of identities on the system when {CodeSignActionID.PROMPT} is passed.")
+    argument_parser.add_argument("-u", "--unity-installation-root", dest="unity_installation_root", default="", help="Root path to search for Unity installations when building tests. Note: performs a full recursive search of the given directory.")
+    argument_parser.add_argument("-o", "--output-path", dest="output_path", default=CTX.build_output_path, help=f"Build result path for final packages. Default: {CTX.build_output_path}")
+    argument_parser.add_argument("-k", "--clean-action", dest="clean_actions", nargs='*', default=[CleanActionID.NONE], help=f"Sets the clean actions for the selected plug-ins. Possible values are: {CleanActionID.NATIVE}, {CleanActionID.PACKAGES}, {CleanActionID.TESTS}, {CleanActionID.NONE}, or {CleanActionID.ALL}. Defaults to no clean action.")
+    argument_parser.add_argument("-f", "--force", dest="force_clean", action="store_true", help="Setting this option will not prompt user on file deletion during clean operations.")
+    argument_parser.add_argument("-t", "--test", dest="build_tests", action="store_true", help="Builds Unity tests for each plug-in.")
+    argument_parser.add_argument("-et", "--editmode-tests", dest="editmode_tests", action="store_true", help="Also runs each plug-in's EditMode tests, in a copy of its Unity project, while its test players build. Results are summarized at the end of the build. Requires -t.")
+    argument_parser.add_argument("-to", "--test-output-path", dest="test_output_path", default=CTX.test_build_root, help=f"Output path for test build results. Default: {CTX.test_build_root}")
+    argument_parser.add_argument("--keep-test-builds", dest="keep_test_builds", type=int, default=None, help="Number of TestBuild_<timestamp> folders, including this run's, to keep in the test output path. Older folders are deleted. Default: all are kept")
+    argument_parser.add_argument("--test-build-budget", dest="test_build_budget", type=float, default=None, help="Space, in GiB, the TestBuild_<timestamp> folders may take; the oldest are deleted beyond it. Default: no limit")
+    argument_parser.add_argument("--dedupe-test-builds", dest="dedupe_test_builds", action="store_true", help="Replaces files in this run's test builds which are identical to those in the previous test build with hard links to them.")
+    argument_parser.add_argument("--slice-packages", dest="slice_packages", action="store_true", help="Also packs a variant of each plug-in package per platform and config found in NativeLibraries~, holding only that platform's native libraries (plus macOS for the Editor), into Slices/<Platform>-<Config> in the output path, and reports their sizes.")
+    argument_parser.add_argument("--compression-level", dest="compression_level", type=int, choices=range(1, 10), default=6, metavar="{1-9}", help="gzip compression level of plug-in packages, from 1 (fastest) to 9 (smallest). Default: 6")
+    argument_parser.add_argument("--compression-jobs", dest="compression_jobs", type=int, default=None, help="Number of cores used to compress each plug-in package. 0 leaves compression to tar, on a single core. Default: all cores")
+    argument_parser.add_argument("--keep-packages", dest="keep_packages", type=int, default=None, help="Number of versions of each plug-in package to keep in the output path. Default: all are kept")
+    argument_parser.add_argument("--package-budget", dest="package_budget", type=float, default=None, help="Space, in GiB, the plug-in packages in the output path may take; the oldest are deleted beyond it. Default: no limit")
+    argument_parser.add_argument("--out-of-tree", dest="out_of_tree", default=None, help="Builds from a copy of the plug-ins in this folder and writes packages, test builds, caches and build history under it, leaving the checkout unchanged. The copy is updated incrementally on each run, so several configurations can build at once from one, possibly read-only, checkout. Paths given with other options are kept.")
+    argument_parser.add_argument("-nc", "--no-color", dest="no_color", action="store_true", help="Use no color in the terminal output. Default: terminal output is colorized.")
+    argument_parser.add_argument("-xb", "--batch-xcodebuild", dest="batch_xcodebuild", action="store_true", help="Builds every platform which shares an Xcode scheme (e.g. iOS and iPhoneSimulator) with a single xcodebuild invocation, then copies the products into NativeLibraries~. Default: one xcodebuild invocation per platform and config.")
+    argument_parser.add_argument("--profile", dest="build_profile", default=BuildProfileID.DEFAULT, help=f"Selects the build settings profile applied to every xcodebuild command. Possible values are: {BuildProfileID.DEFAULT}, {BuildProfileID.CI_FAST}, {BuildProfileID.DEV_LOCAL}, or {BuildProfileID.RELEASE}. Default is: {BuildProfileID.DEFAULT}")
+    argument_parser.add_argument("-cc", "--compiler-cache", dest="compiler_cache", action="store_true", help="Routes C, C++ and Objective-C compilation of native libraries through a compiler cache launcher such as ccache.")
+    argument_parser.add_argument("--compiler-cache-path", dest="compiler_cache_path", default=CTX.build_cache_root.joinpath("CompilerCache"), help=f"Local folder for compiler cache storage and wrapper scripts. Default: {CTX.build_cache_root.joinpath('CompilerCache')}")
+    argument_parser.add_argument("--compiler-cache-size", dest="compiler_cache_size", default="5G", help="Maximum size of the compiler cache, in ccache's size format. Default: 5G")
+    argument_parser.add_argument("--compiler-cache-launcher", dest="compiler_cache_launcher", default="ccache", help="Compiler cache launcher name or path. Default: ccache")
+    argument_parser.add_argument("--compiler-cache-compiler", dest="compiler_cache_compiler", default="", help="C compiler run by the compiler cache launcher; the C++ compiler is this path with '++' appended. Default: the clang selected by xcrun")
+    argument_parser.add_argument("-lc", "--library-cache", dest="library_cache", action="store_true", help="Restores the Library folder of Unity projects which have none from a local cache before Unity opens them, and saves it after each successful Unity command, so fresh checkouts skip the full asset import.")
+    argument_parser.add_argument("--library-cache-path", dest="library_cache_path", default=CTX.build_cache_root.joinpath("UnityLibrary"), help=f"Local folder for the Unity Library cache. Default: {CTX.build_cache_root.joinpath('UnityLibrary')}")
+    argument_parser.add_argument("--library-cache-size", dest="library_cache_size", type=float, default=20.0, help="Size budget, in GiB, of the Unity Library cache; least recently used entries are evicted beyond it. Default: 20")
+    argument_parser.add_argument("-tc", "--test-cache", dest="test_cache", action="store_true", help="Reports a test build as a cached pass, without running Unity, when a passing run with the same Unity version, test platform, script sources and native libraries is recorded in a local cache.")
+    argument_parser.add_argument("--test-cache-path", dest="test_cache_path", default=CTX.build_cache_root.joinpath("TestResults"), help=f"Local folder for the test result cache. Default: {CTX.build_cache_root.joinpath('TestResults')}")
+    argument_parser.add_argument("-uw", "--unity-workers", dest="unity_workers", action="store_true", help="Keeps one batch mode Unity Editor open per project and Unity version, and sends it the touch, platform switch and test build commands of the project, so the Editor starts once per project instead of once per command.")
+    argument_parser.add_argument("--unity-seats", dest="unity_seats", type=int, default=None, help="Number of Unity Editors which may run at once on this host, across every build.py run which passes this option, e.g. the number of license seats. Unity commands wait, in turn, for a free seat. Default: no limit")
+    argument_parser.add_argument("--host-lock-path", dest="host_lock_path", default=DEFAULT_HOST_LOCK_ROOT, help=f"Folder for the locks shared by the build.py runs on this host. Default: {DEFAULT_HOST_LOCK_ROOT}")
+    argument_parser.add_argument("--no-host-locks", dest="host_locks", action="store_false", help="Don't lock the plug-in projects and output folders this run uses. By default, runs which share a checkout or output folders wait for each other when they would write to the same folder.")
+    argument_parser.add_argument("--probe-timeout", dest="probe_timeout", type=float, default=60.0, help="Seconds each start-up query of the host (Xcode, SDKs, codesign identities, Unity versions) may take before the build goes on without its answer. Default: 60")
+    argument_parser.add_argument("--timeout", dest="timeouts", nargs='*', default=[], help=f"Overrides the maximum run time of a command type, as TYPE=SECONDS (0 disables the limit). Possible types are: {CommandTypeID.XCODEBUILD}, {CommandTypeID.UNITY}, {CommandTypeID.CODESIGN}, {CommandTypeID.PACK}. Defaults: " + ', '.join(f"{command_type}={limits.timeout:.0f}" for command_type, limits in CTX.command_limits.items()))
+    argument_parser.add_argument("--inactivity-timeout", dest="inactivity_timeouts", nargs='*', default=[], help="Overrides how long a command type may run without producing output before it is killed, as TYPE=SECONDS (0 disables the watchdog). Defaults: " + ', '.join(f"{command_type}={limits.inactivity_timeout:.0f}" for command_type, limits in CTX.command_limits.items()))
+    argument_parser.add_argument("--retries", dest="retries", type=int, default=None, help="Number of times a command killed by the watchdog is retried. Defaults: " + ', '.join(f"{command_type}={limits.retries}" for command_type, limits in CTX.command_limits.items()))
+    argument_parser.add_argument("--retry-backoff", dest="retry_backoff", type=float, default=None, help="Seconds to wait before the first retry; doubles for each further retry. Default: 30")
+    argument_parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1, help="Maximum number of plug-in jobs, and of heavy commands (xcodebuild, Unity, pack), to run at once. Fewer run when memory or load is high. Default: 1")
+    argument_parser.add_argument("--job-memory", dest="job_memory", nargs='*', default=[], help=f"Overrides the expected peak memory of a command type, as TYPE=GIB. Possible types are: {CommandTypeID.XCODEBUILD}, {CommandTypeID.UNITY}, {CommandTypeID.CODESIGN}, {CommandTypeID.PACK}. Default: learned from build history")
+    argument_parser.add_argument("--memory-reserve", dest="memory_reserve", type=float, default=2.0, help="Memory, in GiB, to keep free for the rest of the system when admitting concurrent jobs. Default: 2")
+    argument_parser.add_argument("--max-load", dest="max_load", type=float, default=1.5, help="Load average per CPU above which no further concurrent jobs are started. Default: 1.5")
+    argument_parser.add_argument("--history-path", dest="history_path", default=CTX.build_history_path, help=f"SQLite database used to record the duration, outcome and resource usage of each build step. Default: {CTX.build_history_path}")
+    argument_parser.add_argument("--resume", dest="resume", action="store_true", help="Continues the last run recorded in the build journal in the output path, skipping steps it completed whose inputs are unchanged and whose outputs are intact. The other options must match that run.")
+    argument_parser.add_argument("--shard", dest="shard", default=None, help="Builds only this machine's share of the native libraries of a build spread across N machines, as i/N (e.g. 2/4), and exports them to Shard_<i>of<N> in the output path. Every shard must be given the same options. Tests and packing are left to --merge.")
+    argument_parser.add_argument("--shard-weights", dest="shard_weights", default="", help=f"Expected native library build durations used to balance --shard plans, as written to {ShardMerge.WEIGHTS_FILE_NAME} by --merge. Default: every build weighs the same")
+    argument_parser.add_argument("--merge", dest="merge", nargs='+', default=[], help="Combines the Shard_<i>of<N> folders exported by every --shard run into each plug-in's NativeLibraries~ folder, after checking that they are complete and consistent, then continues with the remaining build actions without building native libraries.")
+    argument_parser.add_argument("--status", dest="status", action="store_true", help="Reports which native libraries of the selected plug-ins, platforms and configs are missing or out of date with their native sources, from the native output manifests in the output path, and exits without building. Exits with 1 when any are.")
+    argument_parser.add_argument("--report", dest="report", action="store_true", help="Compares the latest recorded run with a rolling baseline of previous runs, reports steps which regressed, and exits without building.")
+    argument_parser.add_argument("--report-window", dest="report_window", type=int, default=5, help="Number of previous runs used as the baseline for --report. Default: 5")
+    argument_parser.add_argument("--regression-threshold", dest="regression_threshold", type=float, default=20.0, help="Percent slow-down, relative to the baseline, beyond which --report flags a step as regressed. Default: 20")
+
+    return argument_parser
+
+# Parses build.py options for RunBuild from 'arguments', or from the command line when None. A build service can pass each request's command line arguments.
+def ParseBuildOptions(arguments : list[str] = None, root_path : Path = None) -> argparse.Namespace:
+    build_args = CreateArgumentParser(root_path if root_path is not None else Path().resolve()).parse_args(arguments)
+    build_args.command_line = sys.argv if arguments is None else ["build.py"] + arguments
+    return build_args
 
 # -----------------
 # Prompt Formatting
 
-prompt_theme = utility.PromptTheme()
-
-# Set to false to disable all colors in your terminal emulator.
-if build_args.no_color:
-    prompt_theme_enable = False
-else:
-    prompt_theme_enable = True
-
-# These colors control the colors that the script uses in your terminal emulator.
-if prompt_theme_enable:
-    # Control the color of standard messages
-    prompt_theme.standard_output_color = PromptColor.NONE
-
-    # Color for section headings in output
-    prompt_theme.section_heading_color = PromptColor.BRIGHT_BLUE
-
-    # Color used when the script reports status
-    prompt_theme.status_color = PromptColor.GREEN
-
-    # Color used when the script adds context, such as a file path or version number, to a message
-    prompt_theme.context_color = PromptColor.MAGENTA
-
-    # Error tags
-    prompt_theme.error_bg_color = PromptColor.BG_RED
-    prompt_theme.error_color = PromptColor.BRIGHT_WHITE
-
-    # Warning tags
-    prompt_theme.warning_bg_color = PromptColor.BG_BRIGHT_YELLOW
-    prompt_theme.warning_color = PromptColor.BLACK
-
-    # Info tags
-    prompt_theme.info_bg_color = PromptColor.BG_BLACK
-    prompt_theme.info_color = PromptColor.GREEN
-
-    # Colors used when user input is prompted
-    prompt_theme.user_input_bg_color = PromptColor.BG_BLUE
-    prompt_theme.user_input_color = PromptColor.BRIGHT_WHITE
-
-# This string represents a single level of indentation in the script output in your terminal emulator.
-prompt_theme.indent_string = '  '
-
-# Store prompt theme
-CTX.printer = Printer(prompt_theme)
-
-
-def Main():
+def CreatePromptTheme(no_color : bool) -> utility.PromptTheme:
+    prompt_theme = utility.PromptTheme()
+
+    # These colors control the colors that the script uses in your terminal emulator. 'no_color' (-nc) disables all of them.
+    if not no_color:
+        # Control the color of standard messages
+        prompt_theme.standard_output_color = PromptColor.NONE
+
+        # Color for section headings in output
+        prompt_theme.section_heading_color = PromptColor.BRIGHT_BLUE
+
+        # Color used when the script reports status
+        prompt_theme.status_color = PromptColor.GREEN
+
+        # Color used when the script adds context, such as a file path or version number, to a message
+        prompt_theme.context_color = PromptColor.MAGENTA
+
+        # Error tags
+        prompt_theme.error_bg_color = PromptColor.BG_RED
+        prompt_theme.error_color = PromptColor.BRIGHT_WHITE
+
+        # Warning tags
+        prompt_theme.warning_bg_color = PromptColor.BG_BRIGHT_YELLOW
+        prompt_theme.warning_color = PromptColor.BLACK
+
+        # Info tags
+        prompt_theme.info_bg_color = PromptColor.BG_BLACK
+        prompt_theme.info_color = PromptColor.GREEN
+
+        # Colors used when user input is prompted
+        prompt_theme.user_input_bg_color = PromptColor.BG_BLUE
+        prompt_theme.user_input_color = PromptColor.BRIGHT_WHITE
+
+    # This string represents a single level of indentation in the script output in your terminal emulator.
+    prompt_theme.indent_string = '  '
+
+    return prompt_theme
+
+# Evicts outputs under the retention's root only while no other run uses the folder, as the outputs of a run in progress look like old ones. Returns True if it evicted.
+def EnforceExclusively(CTX : BuildContext, retention : OutputRetention, protected_paths : list[Path]) -> bool:
+    if not CTX.host_locks.TryExclusive(retention.root, CTX.printer, CTX.printer.Indent(1)):
+        CTX.printer.MessageWithContext("Other build.py runs are using the folder. Skipping eviction from: ", f"{retention.root}", CTX.printer.Indent(1))
+        return False
+
+    retention.Enforce(protected_paths, CTX.printer)
+    retention.Wait()
+    return True
+
+# Runs a build with options from ParseBuildOptions, in the checkout at 'root_path' (Default: the working folder), and returns its outcome.
+#   Nothing is kept between builds except what is in 'environment': pass the same BuildEnvironment to each build of a process to probe the toolchain and Unity
+#   installations only once. The build's Unity workers, host locks, job threads and build history are released when it returns, even if it raises.
+def RunBuild(build_args : argparse.Namespace, environment : BuildEnvironment = None, root_path : Path = None) -> BuildResult:
+    CTX = BuildContext(root_path if root_path is not None else Path().resolve(), environment)
+    CTX.printer = Printer(CreatePromptTheme(build_args.no_color))
+
+    build_result = BuildResult()
+    try:
+        build_result.returncode = RunBuildSteps(CTX, build_args, build_result)
+    finally:
+        if CTX.unity_workers is not None:
+            CTX.unity_workers.Shutdown()
+        if CTX.host_locks is not None:
+            CTX.host_locks.ReleaseAll()
+        if CTX.executor is not None:
+            CTX.executor.Shutdown()
+        if CTX.history is not None:
+            build_result.steps = list(CTX.history.run_records)
+            CTX.history.Close()
+    return build_result
+
+# Moves the build's default output paths from the checkout to 'output_root', and builds from a copy of the plug-ins there (See: SourceOverlay)
+def ConfigureOutOfTree(CTX : BuildContext, build_args : argparse.Namespace, output_root : Path) -> None:
+    # Defaults are paths under the checkout; paths given on the command line are strings and are kept
+    for option_name in ["output_path", "test_output_path", "history_path", "compiler_cache_path", "library_cache_path", "test_cache_path"]:
+        option_value = getattr(build_args, option_name)
+        if isinstance(option_value, Path) and option_value.is_relative_to(CTX.script_root):
+            setattr(build_args, option_name, output_root.joinpath(option_value.relative_to(CTX.script_root)))
+
+    CTX.build_output_path = output_root.joinpath(CTX.build_output_path.relative_to(CTX.script_root))
+    CTX.test_build_root = output_root.joinpath(CTX.test_build_root.relative_to(CTX.script_root))
+    CTX.build_history_path = output_root.joinpath(CTX.build_history_path.relative_to(CTX.script_root))
+    CTX.derived_data_root = output_root.joinpath(CTX.derived_data_root.relative_to(CTX.script_root))
+    CTX.build_cache_root = output_root.joinpath(CTX.build_cache_root.relative_to(CTX.script_root))
+
+    CTX.source_overlay = SourceOverlay(CTX.script_root, output_root)
+    CTX.plugin_root = CTX.source_overlay.plugin_root
+    output_root.mkdir(parents=True, exist_ok=True)
+
+# Prints, for each selected plug-in, the native libraries a build with the selected platforms and configs would change, from the native output manifests in
+# 'output_path'. Only file sizes and modification times are read. Returns the exit code of build.py: 0 when every library is up to date.
+def PrintNativeOutputStatus(CTX : BuildContext, output_path : Path) -> int:
+    selected_outputs = [(platform, config) for platform, platform_selected in CTX.platforms.items() if platform_selected for config, config_selected in CTX.build_configs.items() if config_selected]
+    stale_plugin_ids = list()
+    for plugin_id in [plugin_id for plugin_id, selected in CTX.plugins.items() if selected]:
+        plugin_path = CTX.source_plugin_root.joinpath(f"Apple.{plugin_id}")
+        if not plugin_path.joinpath("Native").is_dir():
+            continue
+
+        native_manifest = NativeOutputManifest.Load(NativeOutputManifest.GetManifestPath(output_path, plugin_id))
+        if native_manifest is None:
+            CTX.printer.MessageWithContext(f"{plugin_id}: ", "not built into this output path", "\n")
+            stale_plugin_ids.append(plugin_id)
+            continue
+
+        stale_outputs = native_manifest.GetStaleOutputs(plugin_path, selected_outputs)
+        signed_count = sum(1 for artifact in native_manifest.artifacts if len(artifact.signed_identity) > 0)
+        CTX.printer.MessageWithContext(f"{plugin_id}: ", f"{'up to date' if len(stale_outputs) == 0 else f'{len(stale_outputs)} stale'} ({len(native_manifest.artifacts)} libraries, {signed_count} signed, built {datetime.fromtimestamp(native_manifest.updated).strftime('%Y-%m-%d %H:%M:%S')})", "\n")
+        for output, reason in stale_outputs:
+            CTX.printer.MessageWithContext(f"{output}: ", reason, CTX.printer.Indent(1))
+        if len(stale_outputs) > 0:
+            stale_plugin_ids.append(plugin_id)
+
+    if len(stale_plugin_ids) == 0:
+        CTX.printer.StatusMessage("Every selected native library is up to date.", "\n")
+        return 0
+    CTX.printer.MessageWithContext("Plug-ins to rebuild: ", ' '.join(stale_plugin_ids), "\n")
+    return 1
+
+# Runs each step of a build for RunBuild, recording its outcome in 'build_result'. Returns the exit code of build.py.
+def RunBuildSteps(CTX : BuildContext, build_args : argparse.Namespace, build_result : BuildResult) -> int:
     # Store the time of invocation for later use
     invocation_time = datetime.now()
     invocation_time_string = invocation_time.strftime("%Y-%m-%d_%H-%M-%S")
@@ -98,6 +239,22 @@ def Main():
           f"\n\n{Printer.Bold('Unity Plug-In Build Script'):^80s}"
           f"\n\n{CTX.printer.Context(build_script_version):^80}"
           f"\n\n{Printer.Bold('*'*80)}")
+
+    if build_args.out_of_tree is not None:
+        output_root = Path(build_args.out_of_tree).resolve()
+        if output_root.is_relative_to(CTX.source_plugin_root) or CTX.source_plugin_root.is_relative_to(output_root):
+            CTX.printer.ErrorMessage(f"The out-of-tree output root {output_root} can't hold or be inside the plug-ins folder {CTX.source_plugin_root}.")
+            return 1
+        ConfigureOutOfTree(CTX, build_args, output_root)
+
+    CTX.history = BuildHistory(pathlib.Path(build_args.history_path))
+
+    if build_args.report:
+        CTX.printer.SectionHeading("Build History Regression Report")
+        no_regressions = CTX.history.PrintRegressionReport(CTX.printer, build_args.report_window, build_args.regression_threshold / 100.0)
+        return 0 if no_regressions else 1
+
+    build_result.run_id = CTX.history.BeginRun(build_script_version, build_args.command_line)
     
     # Filter platform list for proxy values (device and simulator platforms)
     filtered_user_platforms = build_args.platform_list
@@ -109,19 +266,54 @@ def Main():
         filtered_user_platforms[:] = [value for value in build_args.platform_list if value != PlatformID.SIMULATORS]
         filtered_user_platforms += BuildContext.SIMULATOR_PLATFORMS
 
-    supported_platforms = toolchain.GetSupportedPlatformList()
+    # Query the toolchain, SDKs, codesign identities and Unity editors this run will need all at once, rather than one after the other as each is first needed
+    CTX.printer.SectionHeading("Probe Host")
+    # Test builds search the -u root, or the default Unity installation root, for Unity editors (See: NativeUnityPluginManager.ScanUnityInstallRoot)
+    probe_unity_install_root = None
+    if build_args.build_tests and not build_args.status:
+        probe_unity_install_root = Path(build_args.unity_installation_root) if len(build_args.unity_installation_root) > 0 else CTX.unity_install_root
+    probe_start_time = time.monotonic()
+    probe_results = CTX.environment.Probe(toolchain_versions=any(action in (BuildActionID.BUILD, BuildActionID.ALL) for action in build_args.build_actions) and not build_args.status,
+                                          codesign_identities=build_args.codesign_identity == CodeSignActionID.PROMPT and not build_args.status,
+                                          unity_install_root=probe_unity_install_root, timeout=build_args.probe_timeout, fallbacks=CTX.probe_fallbacks)
+    probe_wall_time = time.monotonic() - probe_start_time
+    for probe in probe_results:
+        CTX.printer.MessageWithContext(f"{probe.name}: ", f"{probe.duration:.2f}s", "\n" if probe is probe_results[0] else "")
+        if len(probe.timed_out) > 0:
+            CTX.printer.WarningMessage(f"{' '.join(probe.command)} {probe.timed_out}; continuing without its answer.")
+        elif probe.returncode != 0:
+            CTX.printer.WarningMessage(f"{' '.join(probe.command)} exited with code {probe.returncode}.")
+    if len(probe_results) > 0:
+        CTX.printer.MessageWithContext("Probe time: ", f"{probe_wall_time:.2f}s ({sum(probe.duration for probe in probe_results):.2f}s if run one after the other)", "\n")
+    else:
+        CTX.printer.StatusMessage("Every answer is already known to this process.", "\n")
+
+    supported_platforms = CTX.environment.GetSupportedPlatformList(CTX.probe_fallbacks)
 
     CTX.printer.SectionHeading("Command Line Option Summary")
     
     print(f"\n            Build Actions({Printer.Bold('-b')}): {CTX.printer.Context(' '.join(build_args.build_actions))}"
-          f"\n       Selected Platforms({Printer.Bold('-m')}): {CTX.printer.Context(' '.join(filtered_user_platforms))} (Build System Support: {Printer.MultiDecorate(', '.join(supported_platforms), prompt_theme.info_bg_color, prompt_theme.info_color)})"
+          f"\n       Selected Platforms({Printer.Bold('-m')}): {CTX.printer.Context(' '.join(filtered_user_platforms))} (Build System Support: {Printer.MultiDecorate(', '.join(supported_platforms), CTX.printer.theme.info_bg_color, CTX.printer.theme.info_color)})"
           f"\n            Build Config({Printer.Bold('-bc')}): {CTX.printer.Context(build_args.build_config)}"
           f"\n      Package Output Path({Printer.Bold('-o')}): {CTX.printer.Context(build_args.output_path)}"
           f"\n        Selected Plug-Ins({Printer.Bold('-p')}): {CTX.printer.Context(' '.join(build_args.plugin_list))}"
           f"\n            Clean Actions({Printer.Bold('-k')}): {CTX.printer.Context(' '.join(build_args.clean_actions))}"
           f"\n              Force Clean({Printer.Bold('-f')}): {CTX.printer.Context('Yes (-f set)' if build_args.force_clean else 'No (-f not set)')}"
           f"\n              Build Tests({Printer.Bold('-t')}): {CTX.printer.Context('Yes (-t set)' if build_args.build_tests else 'No (-t not set)')}"
-          f"\n     Codesigning Identity({Printer.Bold('-c')}): {CTX.printer.Context(build_args.codesign_identity if len(build_args.codesign_identity) > 0 else 'None supplied.')}")
+          f"\n     Codesigning Identity({Printer.Bold('-c')}): {CTX.printer.Context(build_args.codesign_identity if len(build_args.codesign_identity) > 0 else 'None supplied.')}"
+          f"\n        Batch xcodebuild({Printer.Bold('-xb')}): {CTX.printer.Context('Yes (-xb set)' if build_args.batch_xcodebuild else 'No (-xb not set)')}"
+          f"\n     Build Profile({Printer.Bold('--profile')}): {CTX.printer.Context(build_args.build_profile)}"
+          f"\n          Concurrent Jobs({Printer.Bold('-j')}): {CTX.printer.Context(build_args.jobs)}"
+          f"\n            Resume({Printer.Bold('--resume')}): {CTX.printer.Context('Yes (--resume set)' if build_args.resume else 'No (--resume not set)')}")
+
+    if build_args.affected_since is not None:
+        print(f"  Affected Since({Printer.Bold('--affected-since')}): {CTX.printer.Context(build_args.affected_since)}")
+
+    if build_args.shard is not None:
+        print(f"              Shard({Printer.Bold('--shard')}): {CTX.printer.Context(build_args.shard)}")
+
+    if len(build_args.merge) > 0:
+        print(f"        Merge Shards({Printer.Bold('--merge')}): {CTX.printer.Context(' '.join(build_args.merge))}")
     
     if len(build_args.unity_installation_root) > 0:
         print(f"  Unity Installation Root({Printer.Bold('-u')}): {CTX.printer.Context(build_args.unity_installation_root)}")
@@ -191,7 +383,7 @@ def Main():
             else:
                 CTX.printer.WarningMessage(f"Valid platform '{platform_id}' selected, but no {platform_id} SDK is installed.\nPlease add the SDK:\n  {Printer.Bold('1.')} Open {Printer.Bold('Xcode')}\n  {Printer.Bold('2.')} Open {Printer.Bold('Settings')} (Xcode > Settings...) or (⌘ + ,) \n  {Printer.Bold('3.')} Go to the {Printer.Bold('Platforms')} tab\n  {Printer.Bold('4.')} Install the {platform_id} SDK.")
                 if not utility.BooleanPrompt(CTX.printer, f"Would you like to continue building without {platform_id} support?"):
-                    exit()
+                    return 0
         else:
             CTX.printer.WarningMessage(f"Ignoring unknown platform '{platform_id}'. Valid options are {PlatformID.IOS}, {PlatformID.IOS_SIMULATOR}, {PlatformID.MACOS}, {PlatformID.TVOS}, {PlatformID.TVOS_SIMULATOR}, {PlatformID.VISIONOS}, {PlatformID.VISIONOS_SIMULATOR}, {PlatformID.SIMULATORS}, {PlatformID.DEVICES}, or {PlatformID.ALL} (default).")
 
@@ -254,6 +446,112 @@ def Main():
     # -------------------------------------------------------------------------
 
     CTX.build_tests = build_args.build_tests
+    CTX.batch_xcodebuild = build_args.batch_xcodebuild
+    CTX.slice_packages = build_args.slice_packages
+    if build_args.compression_jobs != 0:
+        CTX.package_compressor = ParallelGzip(build_args.compression_level, build_args.compression_jobs or 0)
+
+    # -------------------------------------------------------------------------
+
+    shard_spec = None
+    if build_args.shard is not None:
+        try:
+            shard_spec = ParseShardSpec(build_args.shard)
+        except ValueError:
+            CTX.printer.ErrorMessage(f"Invalid shard '{build_args.shard}'. Expected i/N, where i is between 1 and N.")
+            return 1
+
+        if len(build_args.merge) > 0:
+            CTX.printer.ErrorMessage(f"{Printer.Bold('--shard')} and {Printer.Bold('--merge')} cannot be combined. Build each shard, then merge them in a separate run.")
+            return 1
+
+        if not CTX.build_actions[BuildActionID.BUILD]:
+            CTX.printer.WarningMessage(f"--shard only applies to runs which include the '{BuildActionID.BUILD}' action. Ignoring.")
+            shard_spec = None
+        elif CTX.build_tests or CTX.build_actions[BuildActionID.PACK]:
+            CTX.printer.WarningMessage("Test builds and packing need the native libraries of every shard. They are skipped on this shard; run them with --merge.")
+            CTX.build_tests = False
+            CTX.build_actions[BuildActionID.PACK] = False
+
+    if len(build_args.merge) > 0 and not CTX.build_actions[BuildActionID.BUILD]:
+        CTX.printer.WarningMessage(f"--merge takes the place of native library builds in the '{BuildActionID.BUILD}' action, which was not selected. Ignoring.")
+        build_args.merge = list()
+
+    # -------------------------------------------------------------------------
+
+    if build_args.build_profile in BUILD_PROFILE_TABLE:
+        CTX.build_profile = build_args.build_profile
+    else:
+        CTX.printer.WarningMessage(f"Invalid build profile \"{build_args.build_profile}\" passed to build script. Using default argument: {BuildProfileID.DEFAULT}")
+        CTX.build_profile = BuildProfileID.DEFAULT
+
+    CTX.history.build_profile = CTX.GetBuildProfileKey()
+
+    # -------------------------------------------------------------------------
+
+    for limit_attribute, limit_arguments in [("timeout", build_args.timeouts), ("inactivity_timeout", build_args.inactivity_timeouts)]:
+        for limit_argument in limit_arguments:
+            command_type, _, seconds = limit_argument.partition('=')
+            try:
+                if command_type not in CTX.command_limits:
+                    raise ValueError
+                setattr(CTX.command_limits[command_type], limit_attribute, float(seconds) if float(seconds) > 0 else None)
+            except ValueError:
+                CTX.printer.WarningMessage(f"Ignoring invalid command limit '{limit_argument}'. Expected TYPE=SECONDS where TYPE is {CommandTypeID.XCODEBUILD}, {CommandTypeID.UNITY}, {CommandTypeID.CODESIGN}, or {CommandTypeID.PACK}.")
+
+    for command_limits in CTX.command_limits.values():
+        if build_args.retries is not None:
+            command_limits.retries = max(0, build_args.retries)
+        if build_args.retry_backoff is not None:
+            command_limits.retry_backoff = max(0.0, build_args.retry_backoff)
+
+    # -------------------------------------------------------------------------
+
+    configured_memory_estimates = dict()
+    for job_memory_argument in build_args.job_memory:
+        command_type, _, gibibytes = job_memory_argument.partition('=')
+        try:
+            if command_type not in CTX.command_limits:
+                raise ValueError
+            configured_memory_estimates[command_type] = int(float(gibibytes) * GIB)
+        except ValueError:
+            CTX.printer.WarningMessage(f"Ignoring invalid job memory estimate '{job_memory_argument}'. Expected TYPE=GIB where TYPE is {CommandTypeID.XCODEBUILD}, {CommandTypeID.UNITY}, {CommandTypeID.CODESIGN}, or {CommandTypeID.PACK}.")
+
+    CTX.admission = AdmissionController(build_args.jobs, int(build_args.memory_reserve * GIB), build_args.max_load)
+    CTX.admission.printer = CTX.printer
+    CTX.admission.ConfigureEstimates(configured_memory_estimates, CTX.history)
+    CTX.executor = JobExecutor(build_args.jobs)
+
+    if not valid_plugin_found:
+        CTX.printer.WarningMessage(f"No valid plug-in passed to build script. Using default argument: {PluginID.ALL}")
+        for selected_plugin_key in CTX.plugins.keys():
+            CTX.plugins[selected_plugin_key] = True
+
+    # Narrow the selection to the plug-ins changed since the given ref and every plug-in which depends on them
+    if build_args.affected_since is not None:
+        CTX.printer.StatusMessageWithContext("Selecting plug-ins affected by changes since: ", build_args.affected_since, "\n")
+        changed_paths = GetChangedPaths(CTX.script_root, build_args.affected_since)
+        if changed_paths is None:
+            CTX.printer.WarningMessage(f"Couldn't list the changes since '{build_args.affected_since}'. Processing every selected plug-in.")
+        else:
+            plugin_paths = sorted(path for path in CTX.source_plugin_root.glob("Apple.*") if path.is_dir())
+            changed_plugin_ids = GetChangedPluginIDs(changed_paths, list(CTX.plugins.keys()), CTX.plugin_root.name)
+            affected_plugin_ids = GetReverseDependencyClosure(changed_plugin_ids, plugin_manager.GetPluginPackageDependencies(plugin_paths))
+
+            CTX.printer.MessageWithContext("Changed paths: ", f"{len(changed_paths)}", CTX.printer.Indent(1))
+            CTX.printer.MessageWithContext("Changed plug-ins: ", ', '.join(changed_plugin_ids) if len(changed_plugin_ids) > 0 else "None", CTX.printer.Indent(1))
+            CTX.printer.MessageWithContext("Affected plug-ins, with dependents: ", ', '.join(affected_plugin_ids) if len(affected_plugin_ids) > 0 else "None", CTX.printer.Indent(1))
+
+            for plugin_id in CTX.plugins.keys():
+                CTX.plugins[plugin_id] = CTX.plugins[plugin_id] and plugin_id in affected_plugin_ids
+
+            if not any(CTX.plugins.values()):
+                CTX.printer.StatusMessage("No selected plug-in is affected by the changes. Nothing to do.", "\n")
+                return 0
+
+            # Changes to the build scripts can affect any test, so they leave every test assembly selected
+            if not build_args.all_tests and not any(IsGlobalInputPath(changed_path) for changed_path in changed_paths):
+                CTX.changed_paths = [CTX.plugin_root.parent.joinpath(changed_path) for changed_path in changed_paths]
 
     # If user has opted to build tests, Apple.Core must also be selected as all plug-ins are dependent upon Apple.Core
     if CTX.build_tests and not CTX.plugins[PluginID.CORE]:
@@ -262,10 +560,9 @@ def Main():
         CTX.printer.StatusMessage("Adding Apple.Core to selected plug-ins.", "\n")
         CTX.plugins[PluginID.CORE] = True
 
-    if not valid_plugin_found:
-        CTX.printer.WarningMessage(f"No valid plug-in passed to build script. Using default argument: {PluginID.ALL}")
-        for selected_plugin_key in CTX.plugins.keys():
-            CTX.plugins[selected_plugin_key] = True
+    if build_args.status:
+        CTX.printer.SectionHeading("Native Output Status")
+        return PrintNativeOutputStatus(CTX, Path(build_args.output_path))
 
     # -------------------------------------------------------------------------
 
@@ -304,15 +601,68 @@ def Main():
         CTX.printer.WarningMessage("Unity installation root provided, but no tests being built. Argument ignored.")
     else:
         unity_install_root = Path(build_args.unity_installation_root)
-        if unity_install_root != "" and unity_install_root.is_dir():
+        if len(build_args.unity_installation_root) > 0 and unity_install_root.is_dir():
             CTX.unity_install_root = unity_install_root
 
     # -------------------------------------------------------------------------
 
+    # Configure build paths for packages and test builds
+    CTX.build_path = pathlib.Path(build_args.output_path)
+    test_build_root_path = pathlib.Path(build_args.test_output_path)
+
+    # Runs which share this checkout or its output folders can overlap while they use different plug-ins, and queue when one would write to a folder another uses.
+    #   The plug-ins this run processes are locked exclusively, the plug-ins their tests import and the output folders are shared, and folders about to be cleaned are
+    #   exclusive until they have been. Every lock is taken here, in one ordered pass, so that runs cannot deadlock.
+    plugin_lock_paths = list()
+    if build_args.host_locks:
+        CTX.printer.SectionHeading("Lock Build Folders")
+
+        all_plugin_paths = sorted(path for path in CTX.source_plugin_root.glob("Apple.*") if path.is_dir())
+        selected_plugin_ids = [plugin_path.name[len("Apple."):] for plugin_path in all_plugin_paths if CTX.plugins.get(plugin_path.name[len("Apple."):], False)]
+        run_lock_modes = dict()
+        if CTX.build_actions[BuildActionID.BUILD]:
+            for plugin_id in selected_plugin_ids:
+                run_lock_modes[CTX.plugin_root.joinpath(f"Apple.{plugin_id}")] = HostLockModeID.EXCLUSIVE
+            if CTX.build_tests:
+                for dependency_id in GetDependencyClosure(selected_plugin_ids, plugin_manager.GetPluginPackageDependencies(all_plugin_paths)):
+                    run_lock_modes.setdefault(CTX.plugin_root.joinpath(f"Apple.{dependency_id}"), HostLockModeID.SHARED)
+        plugin_lock_paths = list(run_lock_modes.keys())
+
+        if CTX.build_actions[BuildActionID.BUILD] or CTX.build_actions[BuildActionID.PACK]:
+            run_lock_modes[CTX.build_path] = HostLockModeID.SHARED
+        # Packages, package slices and their staging folders are written to the build output folder, which package retention evicts from
+        if CTX.build_actions[BuildActionID.PACK] or build_args.keep_packages is not None or build_args.package_budget is not None:
+            run_lock_modes[CTX.build_output_path] = HostLockModeID.SHARED
+        if CTX.build_tests or build_args.keep_test_builds is not None or build_args.test_build_budget is not None:
+            run_lock_modes[CTX.test_build_root] = HostLockModeID.SHARED
+
+        # Cleaning test builds also removes the test players of every plug-in project
+        clean_lock_modes = dict()
+        if CTX.clean_actions[CleanActionID.PACKAGES]:
+            clean_lock_modes[CTX.build_path] = HostLockModeID.EXCLUSIVE
+        if CTX.clean_actions[CleanActionID.TESTS]:
+            clean_lock_modes[test_build_root_path] = HostLockModeID.EXCLUSIVE
+            for plugin_path in all_plugin_paths:
+                clean_lock_modes[CTX.plugin_root.joinpath(plugin_path.name)] = HostLockModeID.EXCLUSIVE
+
+        # Syncing the out-of-tree copy writes every plug-in in it, so runs which share an output root take turns
+        if CTX.source_overlay is not None:
+            run_lock_modes[CTX.source_overlay.work_root] = HostLockModeID.EXCLUSIVE
+
+        CTX.host_locks = HostLockSet(pathlib.Path(build_args.host_lock_path), f"build.py run started {invocation_time_string} ({', '.join(selected_plugin_ids)})")
+        CTX.host_locks.Acquire(run_lock_modes | clean_lock_modes, CTX.printer, CTX.printer.Indent(1))
+        CTX.printer.StatusMessage("Locked build folders.", "\n")
+        CTX.host_locks.PrintConfiguration(CTX.printer)
+
+    if CTX.source_overlay is not None:
+        CTX.printer.SectionHeading("Sync Out-of-Tree Sources")
+        CTX.source_overlay.PrintConfiguration(CTX.printer)
+        CTX.printer.StatusMessage("Copying changed plug-in sources from the checkout.", "\n")
+        CTX.source_overlay.Sync()
+        CTX.source_overlay.PrintSync(CTX.printer)
+
     CTX.printer.SectionHeading("Configure Build Paths")
 
-    # Configure build paths for packages
-    CTX.build_path = pathlib.Path(build_args.output_path)
 
     if CTX.clean_actions[CleanActionID.PACKAGES] and CTX.build_path.exists():
         CTX.printer.StatusMessage("Cleaning packages.", "\n")
@@ -321,12 +671,11 @@ def Main():
 
     if CTX.build_actions[BuildActionID.BUILD] or CTX.build_actions[BuildActionID.PACK]:
         if not CTX.build_path.exists():
-            CTX.printer.Message(f"Build output path not found.", "\n")
+            CTX.printer.Message("Build output path not found.", "\n")
             CTX.printer.StatusMessageWithContext("Creating: ", f"{CTX.build_path}")
             CTX.build_path.mkdir()
 
-    # Configure and optionally clean paths for test builds
-    test_build_root_path = pathlib.Path(build_args.test_output_path)
+    # Optionally clean paths for test builds
     if CTX.clean_actions[CleanActionID.TESTS] and test_build_root_path.exists():
         CTX.printer.StatusMessage(f"Clean tests option '{CleanActionID.TESTS}' set.", "\n")
         utility.RemoveFolder(test_build_root_path, prompt= not build_args.force_clean, printer= CTX.printer)
@@ -341,6 +690,14 @@ def Main():
             if curr_unity_project_path.is_dir() and curr_test_player_path.is_dir():
                 utility.RemoveFolder(curr_test_player_path, prompt= not build_args.force_clean, printer= CTX.printer)
 
+    # Cleaned folders go back to the locks the rest of the run needs
+    if CTX.host_locks is not None:
+        for clean_lock_path in clean_lock_modes.keys():
+            if clean_lock_path.resolve() not in [run_lock_path.resolve() for run_lock_path in run_lock_modes.keys()]:
+                CTX.host_locks.Release(clean_lock_path)
+            elif run_lock_modes.get(clean_lock_path, HostLockModeID.SHARED) == HostLockModeID.SHARED:
+                CTX.host_locks.Downgrade(clean_lock_path, CTX.printer, CTX.printer.Indent(1))
+
     if CTX.build_tests:
         if not CTX.test_build_root.exists():
             CTX.printer.StatusMessage("Test build output root not found.", "\n")
@@ -349,20 +706,67 @@ def Main():
 
         # Each set of test builds for an invocation will store output in a newly time-stamped folder
         CTX.test_build_output_path = CTX.test_build_root.joinpath(f"TestBuild_{invocation_time_string}")
-        CTX.test_build_output_path.mkdir()
+
+    # Completed pipeline steps are journaled in the build output folder so that an interrupted run can be resumed
+    if CTX.build_actions[BuildActionID.BUILD]:
+        CTX.journal = BuildJournal(CTX.build_path.joinpath(BuildJournal.FILE_NAME))
+        build_options = {
+            "build_actions" : CTX.build_actions,
+            "platforms" : CTX.platforms,
+            "build_configs" : CTX.build_configs,
+            "build_tests" : CTX.build_tests,
+            "build_profile" : CTX.GetBuildProfileKey(),
+            "batch_xcodebuild" : CTX.batch_xcodebuild,
+            "codesign_identity" : build_args.codesign_identity,
+            "shard" : build_args.shard if shard_spec is not None else "",
+            "merge" : build_args.merge,
+            "slice_packages" : CTX.slice_packages,
+            "compression_level" : CTX.package_compressor.level if CTX.package_compressor is not None else 0
+        }
+        options_hash = hashlib.sha256(json.dumps(build_options, sort_keys=True).encode()).hexdigest()
+        run_data = CTX.journal.BeginRun(options_hash, {"test_build_output_path" : f"{CTX.test_build_output_path}" if CTX.build_tests else ""}, build_args.resume, CTX.printer)
+        CTX.printer.MessageWithContext("Build journal: ", f"{CTX.journal.journal_path}", "\n")
+
+        if CTX.build_tests and len(run_data["test_build_output_path"]) > 0:
+            CTX.test_build_output_path = Path(run_data["test_build_output_path"])
+    elif build_args.resume:
+        CTX.printer.WarningMessage(f"--resume only applies to runs which include the '{BuildActionID.BUILD}' action. Ignoring.")
+
+    if CTX.build_tests:
+        CTX.test_build_output_path.mkdir(parents=True, exist_ok=True)
+
+    # Earlier test builds and packages are evicted before this run adds its own, to leave room for them, and again once it has
+    test_build_retention = OutputRetention(CTX.test_build_root, "TestBuild_*", RetentionPolicy(build_args.keep_test_builds, int(build_args.test_build_budget * GIB) if build_args.test_build_budget is not None else None))
+    package_retention = OutputRetention(CTX.build_output_path, "**/*.tgz", RetentionPolicy(build_args.keep_packages, int(build_args.package_budget * GIB) if build_args.package_budget is not None else None), get_group=lambda path: f"{path.parent}/{path.name.rsplit('-', 1)[0]}")
+    output_retentions = [retention for retention in [test_build_retention, package_retention] if retention.policy.IsSet()]
+
+    if len(output_retentions) > 0:
+        CTX.printer.SectionHeading("Apply Output Retention")
+        for retention in output_retentions:
+            if CTX.host_locks is None:
+                retention.Enforce([CTX.test_build_output_path if CTX.build_tests else None], CTX.printer)
+            elif EnforceExclusively(CTX, retention, [CTX.test_build_output_path if CTX.build_tests else None]):
+                CTX.host_locks.Downgrade(retention.root, CTX.printer, CTX.printer.Indent(1))
 
     # -------------------------------------------------------------------------
 
     if CTX.build_actions[BuildActionID.BUILD]:
         CTX.printer.SectionHeading("Configure Native Library Build Options")
 
-        xcode_version, xcode_build_number = toolchain.GetToolchainVersions()
+        xcode_version, xcode_build_number = CTX.environment.GetToolchainVersions(CTX.probe_fallbacks)
+        CTX.history.xcode_version = f"{xcode_version} ({xcode_build_number})"
         CTX.printer.MessageWithContext("Native library build using: ", f"Xcode {xcode_version} ({xcode_build_number})", "\n")
         CTX.printer.InfoMessage(f"If this is incorrect, please update your environment with {Printer.Bold('xcode-select')}. (Call \'{Printer.Bold('xcode-select -h')}\' from the command line for more info.)")
 
+        if build_args.compiler_cache:
+            CTX.printer.StatusMessage("Configuring compiler cache.", "\n")
+            compiler_cache = CompilerCache(pathlib.Path(build_args.compiler_cache_path), build_args.compiler_cache_size, build_args.compiler_cache_launcher, build_args.compiler_cache_compiler)
+            if compiler_cache.Configure(CTX.printer):
+                CTX.compiler_cache = compiler_cache
+
         if len(build_args.codesign_identity) > 0:
             if build_args.codesign_identity == CodeSignActionID.PROMPT:
-                CTX.codesign_hash = toolchain.PromptForCodesignIdentity(CTX.printer)
+                CTX.codesign_hash = toolchain.PromptForCodesignIdentity(CTX.printer, CTX.environment.GetCodesignIdentities(CTX.probe_fallbacks))
             else:
                 CTX.codesign_hash = build_args.codesign_identity
 
@@ -372,7 +776,36 @@ def Main():
         if (CTX.build_tests):
             unity_plugin_manager.ScanForUnityInstallations()
 
-        CTX.printer.SectionHeading("Process Plug-Ins")
+            if build_args.library_cache:
+                CTX.printer.StatusMessage("Configuring Unity Library cache.", "\n")
+                CTX.library_cache = UnityLibraryCache(pathlib.Path(build_args.library_cache_path), int(build_args.library_cache_size * GIB))
+                CTX.library_cache.PrintConfiguration(CTX.printer)
+
+            if build_args.test_cache:
+                CTX.printer.StatusMessage("Configuring test result cache.", "\n")
+                CTX.test_cache = TestResultCache(pathlib.Path(build_args.test_cache_path))
+                CTX.test_cache.PrintConfiguration(CTX.printer)
+
+            if build_args.unity_seats is not None:
+                CTX.printer.StatusMessage("Configuring Unity license seats.", "\n")
+                CTX.unity_seats = HostSemaphore(pathlib.Path(build_args.host_lock_path), "unity_license_seats", build_args.unity_seats)
+                CTX.unity_seats.PrintConfiguration(CTX.printer)
+
+            if build_args.unity_workers:
+                CTX.printer.StatusMessage("Configuring Unity worker pool.", "\n")
+                CTX.unity_workers = UnityWorkerPool(CTX.command_limits[CommandTypeID.UNITY], CTX.unity_seats)
+                CTX.unity_workers.PrintConfiguration(CTX.printer)
+        else:
+            if build_args.library_cache:
+                CTX.printer.WarningMessage(f"Unity Library cache({Printer.Bold('-lc')}) set, but no tests being built. Argument ignored.")
+            if build_args.test_cache:
+                CTX.printer.WarningMessage(f"Test result cache({Printer.Bold('-tc')}) set, but no tests being built. Argument ignored.")
+            if build_args.editmode_tests:
+                CTX.printer.WarningMessage(f"EditMode tests({Printer.Bold('-et')}) set, but no tests being built. Argument ignored.")
+            if build_args.unity_workers:
+                CTX.printer.WarningMessage(f"Unity worker pool({Printer.Bold('-uw')}) set, but no tests being built. Argument ignored.")
+            if build_args.unity_seats is not None:
+                CTX.printer.WarningMessage(f"Unity license seats({Printer.Bold('--unity-seats')}) set, but no tests being built. Argument ignored.")
 
         # Sort plug-in build order so that Apple.Core always comes first
         plugin_path_list = list()
@@ -385,18 +818,138 @@ def Main():
             else:
                 plugin_path_list.append(curr_plugin_path)
 
-        for plugin_path in plugin_path_list:
-            unity_plugin_manager.ProcessNativeUnityPlugin(plugin_path)
+        if shard_spec is not None:
+            CTX.printer.SectionHeading("Plan Build Shard")
 
-    if CTX.build_tests:
-        CTX.printer.SectionHeading("Build Unity Tests")
-        unity_plugin_manager.BuildTests()
+            shard_weights_path = Path(build_args.shard_weights) if len(build_args.shard_weights) > 0 else None
+            if shard_weights_path is not None and not shard_weights_path.is_file():
+                CTX.printer.ErrorMessage(f"Cannot find shard weights file at path: {shard_weights_path}")
+                return 1
+            elif shard_weights_path is None:
+                CTX.printer.InfoMessage(f"No {Printer.Bold('--shard-weights')} file given; every native library build is weighted the same.")
 
-    if CTX.build_actions[BuildActionID.PACK]:
-        CTX.printer.SectionHeading("Create Plug-In Packages")
-        unity_plugin_manager.GeneratePlugInPackages()
+            native_build_jobs = unity_plugin_manager.GetNativeBuildJobs(plugin_path_list)
+            CTX.shard = BuildShard(*shard_spec, native_build_jobs, GetJobWeights(native_build_jobs, shard_weights_path))
+            CTX.shard.PrintPlan(CTX.printer)
+
+        if len(build_args.merge) > 0:
+            CTX.printer.SectionHeading("Merge Build Shards")
+
+            shard_merge = ShardMerge([Path(shard_path) for shard_path in build_args.merge])
+            if not shard_merge.Load(CTX.printer) or not shard_merge.Validate(unity_plugin_manager.GetNativeBuildJobs(plugin_path_list), CTX.printer):
+                CTX.printer.ErrorMessage("Build shards cannot be merged. No native libraries were changed.")
+                return 1
+
+            shard_merge.Apply(CTX.plugin_root, CTX.printer)
+            shard_merge.WriteWeights(CTX.build_path.joinpath(ShardMerge.WEIGHTS_FILE_NAME), CTX.printer)
+
+        CTX.printer.SectionHeading("Process Plug-Ins")
+
+        if CTX.executor.max_workers > 1:
+            CTX.printer.StatusMessage("Configuring concurrent jobs.", "\n")
+            CTX.admission.PrintConfiguration(CTX.printer)
+
+        # Each plug-in moves through build, touch, test and pack as soon as its own earlier stages and the packages it depends on are ready
+        unity_plugin_manager.RunPipeline(plugin_path_list, CTX.build_tests, CTX.build_actions[BuildActionID.PACK], build_native_libraries=len(build_args.merge) == 0, editmode_tests=build_args.editmode_tests)
+        build_result.stage_status = unity_plugin_manager.stage_status
+        build_result.package_paths = {plugin_id : native_plugin.package_path for plugin_id, native_plugin in unity_plugin_manager.native_unity_plugin_table.items() if native_plugin.package_path is not None}
+        build_result.editmode_results = unity_plugin_manager.editmode_results
+        build_result.test_build_output_path = CTX.test_build_output_path if CTX.build_tests else None
+
+        if CTX.unity_workers is not None:
+            CTX.unity_workers.Shutdown()
+
+        if CTX.host_locks is not None:
+            for plugin_lock_path in plugin_lock_paths:
+                CTX.host_locks.Release(plugin_lock_path)
+
+        if CTX.shard is not None:
+            CTX.printer.SectionHeading("Export Build Shard")
+            CTX.shard.Export(CTX.build_path, CTX.plugin_root, {plugin_id : native_plugin.unity_project.native_library_path for plugin_id, native_plugin in unity_plugin_manager.native_unity_plugin_table.items()}, CTX.history, CTX.printer)
+
+        if CTX.slice_packages and CTX.build_actions[BuildActionID.PACK]:
+            CTX.printer.SectionHeading("Package Size Report")
+            unity_plugin_manager.PrintPackageSizeReport()
+
+        if len(unity_plugin_manager.editmode_results) > 0:
+            CTX.printer.SectionHeading("EditMode Test Summary")
+            PrintEditModeSummary(unity_plugin_manager.editmode_results, CTX.printer)
+            editmode_summary_path = CTX.test_build_output_path.joinpath("EditModeTestSummary.json")
+            editmode_summary_path.write_text(json.dumps({plugin_id : result.ToDict() for plugin_id, result in unity_plugin_manager.editmode_results.items()}, indent=2))
+            CTX.printer.MessageWithContext("Summary written to: ", f"{editmode_summary_path}", "\n")
+    elif CTX.build_actions[BuildActionID.PACK] or CTX.build_tests:
+        CTX.printer.WarningMessage(f"Test builds and packing use the plug-ins processed by the '{BuildActionID.BUILD}' action, which was not selected. Nothing to do.")
+
+    if CTX.compiler_cache is not None:
+        CTX.printer.SectionHeading("Compiler Cache Summary")
+        CTX.compiler_cache.PrintSummary(CTX.printer)
+
+    if CTX.build_tests and build_args.dedupe_test_builds:
+        CTX.printer.SectionHeading("Deduplicate Test Builds")
+        previous_test_build_paths = [path for path in test_build_retention.ListOutputs() if path.resolve() != CTX.test_build_output_path.resolve()]
+        if len(previous_test_build_paths) > 0:
+            linked_count, saved_bytes = DeduplicateTree(CTX.test_build_output_path, previous_test_build_paths[0])
+            CTX.printer.MessageWithContext("Files linked to the previous test build: ", f"{linked_count} ({saved_bytes / (1024 * 1024):.1f} MiB saved, from {previous_test_build_paths[0].name})", "\n")
+        else:
+            CTX.printer.Message("No previous test build to deduplicate against.", "\n")
+
+    if len(output_retentions) > 0:
+        CTX.printer.SectionHeading("Output Retention Summary")
+        for retention in output_retentions:
+            outputs_of_this_run = [path for path in retention.ListOutputs() if path.stat().st_mtime >= invocation_time.timestamp()]
+            if CTX.host_locks is None:
+                retention.Enforce([CTX.test_build_output_path if CTX.build_tests else None] + outputs_of_this_run, CTX.printer)
+            else:
+                EnforceExclusively(CTX, retention, [CTX.test_build_output_path if CTX.build_tests else None] + outputs_of_this_run)
+            retention.Wait()
+            CTX.printer.MessageWithContext("Evicted: ", f"{retention.evicted_count} ({retention.evicted_bytes / (1024 * 1024):.1f} MiB) from {retention.root}", CTX.printer.Indent(1))
+
+    if CTX.library_cache is not None:
+        CTX.printer.SectionHeading("Unity Library Cache Summary")
+        CTX.library_cache.PrintSummary(CTX.printer)
+
+    if CTX.test_cache is not None:
+        CTX.printer.SectionHeading("Test Result Cache Summary")
+        CTX.test_cache.PrintSummary(CTX.printer)
+
+    if CTX.unity_workers is not None:
+        CTX.printer.SectionHeading("Unity Worker Pool Summary")
+        CTX.unity_workers.PrintSummary(CTX.printer)
+
+    if CTX.unity_seats is not None:
+        CTX.printer.SectionHeading("Unity License Seat Summary")
+        CTX.unity_seats.PrintSummary(CTX.printer)
+
+    if CTX.host_locks is not None:
+        CTX.host_locks.ReleaseAll()
+        CTX.printer.SectionHeading("Host Lock Summary")
+        CTX.host_locks.PrintSummary(CTX.printer)
+
+    CTX.executor.Shutdown()
+    if CTX.executor.max_workers > 1:
+        CTX.printer.SectionHeading("Job Scheduling Summary")
+        CTX.admission.PrintSummary(CTX.printer)
+
+    CTX.printer.SectionHeading("Resource Usage Summary")
+    CTX.history.PrintResourceSummary(CTX.printer)
+
+    CTX.printer.MessageWithContext("Build step history recorded to: ", f"{CTX.history.database_path}", "\n")
+
+    failed_stages = [f"{plugin_id} {stage}" for (plugin_id, stage), status in build_result.stage_status.items() if status != TaskStatusID.SUCCEEDED]
+    failed_editmode_plugin_ids = [plugin_id for plugin_id, result in build_result.editmode_results.items() if not result.Succeeded()]
+    if len(failed_stages) > 0 or len(failed_editmode_plugin_ids) > 0:
+        if len(failed_stages) > 0:
+            CTX.printer.ErrorMessage(f"Failed or skipped plug-in stages: {', '.join(failed_stages)}")
+        if len(failed_editmode_plugin_ids) > 0:
+            CTX.printer.ErrorMessage(f"EditMode tests failed for: {', '.join(failed_editmode_plugin_ids)}")
+        CTX.printer.Message("Finished running Unity plug-in build script.", "\n")
+        return 1
 
     CTX.printer.Message("Finished running Unity plug-in build script.", "\n")
+    return 0
+
+def Main():
+    exit(RunBuild(ParseBuildOptions()).returncode)
 
 # Entry point
 if __name__ == '__main__':
@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+# Requirements: python3
+#
+# Compares single-core gzip (as run by tar --auto-compress) against the multi-core package compressor (build.py --compression-jobs, --compression-level) on the
+# plug-in package folders in the repository, reporting throughput and compression ratio for each level.
+#   Each package folder is archived to a temporary tar file first, so only compression is timed. Every compressed package is checked to decompress to the original archive.
+#
+# Usage (from the repository root):
+#   python3 -m scripts.benchmarks.pack_compression [-p Core GameKit PHASE] [--levels 1 6 9] [--jobs 1 4 8]
+
+import argparse, gzip, os, shutil, subprocess, tarfile, tempfile, time
+
+from pathlib import Path
+
+from scripts.python.upi_parallel_gzip import ParallelGzip
+from scripts.python.upi_unity_native_plugin_manager import GetPluginPackageJsonPath
+
+REPOSITORY_ROOT = Path(__file__).resolve().parents[2]
+
+# Archives a plug-in's package folder, as the pack step does, to 'tar_path'.
+# Returns the archive size
+def ArchivePlugin(plugin_id : str, tar_path : Path) -> int:
+    package_json_path = GetPluginPackageJsonPath(REPOSITORY_ROOT.joinpath("plug-ins", f"Apple.{plugin_id}", f"Apple.{plugin_id}_Unity"))
+    with tarfile.open(tar_path, "w") as tar_file:
+        tar_file.add(package_json_path.parent, arcname="package")
+    return tar_path.stat().st_size
+
+# Compresses 'tar_path' with the gzip command on a single core.
+# Returns (compressed bytes, seconds taken)
+def RunSingleCoreGzip(tar_path : Path, gzip_path : Path, level : int) -> tuple[int, float]:
+    start_time = time.perf_counter()
+    with open(gzip_path, "wb") as gzip_file:
+        subprocess.run(["gzip", f"-{level}", "--no-name", "--stdout", f"{tar_path}"], stdout=gzip_file, check=True)
+    return gzip_path.stat().st_size, time.perf_counter() - start_time
+
+def Main() -> None:
+    argument_parser = argparse.ArgumentParser(description="Benchmarks single-core gzip against the multi-core package compressor on the plug-in packages.")
+    argument_parser.add_argument("-p", "--plugin-list", dest="plugin_list", nargs='*', default=["Core", "GameKit", "PHASE"], help="Plug-ins to archive. Default: Core GameKit PHASE")
+    argument_parser.add_argument("--levels", dest="levels", type=int, nargs='*', default=[1, 6, 9], help="Compression levels to measure. Default: 1 6 9")
+    argument_parser.add_argument("--jobs", dest="jobs", type=int, nargs='*', default=sorted({1, 2, 4, os.cpu_count() or 1}), help="Numbers of compression jobs to measure. Default: 1, 2, 4 and the number of cores")
+    benchmark_args = argument_parser.parse_args()
+
+    has_gzip = shutil.which("gzip") is not None
+
+    with tempfile.TemporaryDirectory() as benchmark_root:
+        for plugin_id in benchmark_args.plugin_list:
+            tar_path = Path(benchmark_root, f"{plugin_id}.tar")
+            tar_size = ArchivePlugin(plugin_id, tar_path)
+            tar_data = tar_path.read_bytes()
+            gzip_path = Path(benchmark_root, f"{plugin_id}.tgz")
+
+            print(f"\n{plugin_id}: {tar_size / (1024 * 1024):.1f} MiB archive ({os.cpu_count()} cores)")
+            for level in benchmark_args.levels:
+                if has_gzip:
+                    compressed_size, elapsed_time = RunSingleCoreGzip(tar_path, gzip_path, level)
+                    print(f"  Level {level} gzip:          {tar_size / (1024 * 1024) / elapsed_time:7.1f} MiB/s, ratio {compressed_size / tar_size:.3f}")
+                for jobs in benchmark_args.jobs:
+                    _, compressed_size, elapsed_time = ParallelGzip(level, jobs).CompressFile(tar_path, gzip_path)
+                    matches = gzip.decompress(gzip_path.read_bytes()) == tar_data
+                    print(f"  Level {level} {jobs:2d} job(s):     {tar_size / (1024 * 1024) / elapsed_time:7.1f} MiB/s, ratio {compressed_size / tar_size:.3f}{'' if matches else ' (DECOMPRESSED OUTPUT DIFFERS)'}")
+
+if __name__ == '__main__':
+    Main()
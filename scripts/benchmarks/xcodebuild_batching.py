@@ -0,0 +1,91 @@
+#! /usr/bin/env python3
+# Requirements: python3
+#
+# Compares per-platform xcodebuild invocations against batched invocations (build.py --batch-xcodebuild) using the stand-in toolchain in scripts/stand-ins.
+#   Each selected plug-in's native project layout is mirrored into a temporary folder so the repository is left untouched.
+#
+# Usage (from the repository root):
+#   python3 -m scripts.benchmarks.xcodebuild_batching [-p Core GameKit] [--startup-seconds 1.0] [--destination-seconds 0.5]
+
+import argparse, os, shutil, tempfile, time
+
+import scripts.python.upi_utility as utility
+
+from pathlib import Path
+
+from scripts.python.upi_build_context import BuildContext
+from scripts.python.upi_cli_argument_options import PlatformID, ConfigID
+from scripts.python.upi_unity_native_plugin_manager import NativeUnityPluginManager, NativeUnityPlugin, GetNativeLibraryRootFolderName
+from scripts.python.upi_utility import Printer, PromptTheme
+
+REPOSITORY_ROOT = Path(__file__).resolve().parents[2]
+
+# Copies the parts of a plug-in the stand-in toolchain reads (xcconfig files, the .xcodeproj name, the native library root folder) into 'mirror_root'
+def MirrorPlugin(plugin_path : Path, mirror_root : Path) -> NativeUnityPlugin:
+    native_project_path = mirror_root.joinpath(plugin_path.name, "Native")
+    native_project_path.mkdir(parents=True)
+    for xcconfig_path in plugin_path.joinpath("Native").glob("*.xcconfig"):
+        shutil.copy2(xcconfig_path, native_project_path)
+    for xcodeproj_path in plugin_path.joinpath("Native").glob("*.xcodeproj"):
+        native_project_path.joinpath(xcodeproj_path.name).mkdir()
+
+    native_plugin = NativeUnityPlugin(mirror_root.joinpath(plugin_path.name), native_project_path)
+    native_plugin.unity_project.path = mirror_root.joinpath(plugin_path.name, f"{plugin_path.name}_Unity")
+    native_plugin.unity_project.path.joinpath("Assets", GetNativeLibraryRootFolderName(native_project_path)).mkdir(parents=True)
+    return native_plugin
+
+# Runs every generated command for each plug-in and returns (invocation count, elapsed seconds, set of produced NativeLibraries~ paths)
+def RunMode(ctx : BuildContext, manager : NativeUnityPluginManager, native_plugins : dict[str, NativeUnityPlugin]) -> tuple[int, float, set[str]]:
+    invocation_count = 0
+    start_time = time.perf_counter()
+    for plugin_id, native_plugin in native_plugins.items():
+        for platform, command_set in ctx.GenerateXcodeBuildCommands(plugin_id).items():
+            for config, command in command_set.items():
+                command_output = utility.RunCommand(command, cwd=native_plugin.native_project_path)
+                invocation_count += 1
+                if command_output.returncode != 0:
+                    ctx.printer.ErrorMessage(f"Stand-in build failed:\n{command_output.stdout}")
+                elif ctx.batch_xcodebuild:
+                    manager.CopyBatchedBuildProducts(plugin_id, native_plugin, platform.split(BuildContext.BATCHED_PLATFORM_SEPARATOR), config)
+    elapsed_time = time.perf_counter() - start_time
+
+    produced_paths = set()
+    for plugin_id, native_plugin in native_plugins.items():
+        for native_library_path in native_plugin.unity_project.path.glob("Assets/**/NativeLibraries~/*/*/*"):
+            produced_paths.add(f"{plugin_id}/{native_library_path.relative_to(native_library_path.parents[2])}")
+    return (invocation_count, elapsed_time, produced_paths)
+
+def Main() -> None:
+    argument_parser = argparse.ArgumentParser(description="Benchmarks batched against per-platform xcodebuild invocations with the stand-in toolchain.")
+    argument_parser.add_argument("-p", "--plugin-list", dest="plugin_list", nargs='*', default=["Core", "GameKit", "PHASE"], help="Plug-ins to mirror. Default: Core GameKit PHASE")
+    argument_parser.add_argument("--startup-seconds", dest="startup_seconds", default="1.0", help="Stand-in xcodebuild fixed cost per invocation. Default: 1.0")
+    argument_parser.add_argument("--destination-seconds", dest="destination_seconds", default="0.5", help="Stand-in xcodebuild cost per destination. Default: 0.5")
+    benchmark_args = argument_parser.parse_args()
+
+    os.environ["PATH"] = f"{REPOSITORY_ROOT.joinpath('scripts', 'stand-ins')}{os.pathsep}{os.environ['PATH']}"
+    os.environ["STANDIN_XCODEBUILD_STARTUP_SECONDS"] = benchmark_args.startup_seconds
+    os.environ["STANDIN_XCODEBUILD_DESTINATION_SECONDS"] = benchmark_args.destination_seconds
+
+    results = dict()
+    for batch_xcodebuild in [False, True]:
+        with tempfile.TemporaryDirectory() as mirror_root:
+            ctx = BuildContext(Path(mirror_root))
+            ctx.printer = Printer(PromptTheme())
+            ctx.platforms = {platform : True for platform in [PlatformID.IOS, PlatformID.IOS_SIMULATOR, PlatformID.TVOS, PlatformID.TVOS_SIMULATOR, PlatformID.MACOS, PlatformID.VISIONOS, PlatformID.VISIONOS_SIMULATOR]}
+            ctx.build_configs = {ConfigID.RELEASE : True, ConfigID.DEBUG : True}
+            ctx.batch_xcodebuild = batch_xcodebuild
+
+            manager = NativeUnityPluginManager(ctx)
+            native_plugins = {plugin_id : MirrorPlugin(REPOSITORY_ROOT.joinpath("plug-ins", f"Apple.{plugin_id}"), Path(mirror_root)) for plugin_id in benchmark_args.plugin_list}
+            results[batch_xcodebuild] = RunMode(ctx, manager, native_plugins)
+
+    per_platform_count, per_platform_time, per_platform_outputs = results[False]
+    batched_count, batched_time, batched_outputs = results[True]
+
+    print(f"\nPlug-ins: {' '.join(benchmark_args.plugin_list)} (7 platforms, 2 configs)")
+    print(f"  Per-platform: {per_platform_count:3d} invocations, {per_platform_time:7.2f}s")
+    print(f"  Batched:      {batched_count:3d} invocations, {batched_time:7.2f}s ({per_platform_time / batched_time:.2f}x)")
+    print(f"  NativeLibraries~ layouts match: {'yes' if per_platform_outputs == batched_outputs else 'NO'}")
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,159 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import json, os
+
+from pathlib import Path
+
+from scripts.python.upi_unity_worker_pool import WORKER_FOLDER_NAME
+
+# Files which Unity compiles into assemblies, or which change how it compiles them
+SCRIPT_FILE_SUFFIXES = (".cs", ".asmdef", ".asmref", ".rsp")
+
+# Assembly which holds scripts outside every .asmdef folder
+DEFAULT_ASSEMBLY_NAME = "Assembly-CSharp"
+
+# Returns True for a folder whose scripts belong to the project: Unity does not import folders whose names end in '~' or start with '.', and the Unity worker's
+# scripts are only installed in the project while a worker has it open (See: UnityWorker.GetInstallPath)
+def IsSourceFolderName(folder_name : str) -> bool:
+    return not folder_name.endswith('~') and not folder_name.startswith('.') and folder_name != WORKER_FOLDER_NAME
+
+# Returns True for a file of a source folder which belongs to the project: hidden files and the .meta file of the worker's folder are left out
+def IsSourceFileName(file_name : str) -> bool:
+    return not file_name.startswith('.') and file_name != f"{WORKER_FOLDER_NAME}.meta"
+
+# Returns every file under 'root' which Unity imports into the project, in a stable order: scripts, assets and their .meta files (See: IsSourceFolderName)
+def GetProjectFilePaths(root : Path) -> list[Path]:
+    file_paths = list()
+    for folder_path, folder_names, file_names in os.walk(root):
+        folder_names[:] = sorted(name for name in folder_names if IsSourceFolderName(name))
+        file_paths += [Path(folder_path, file_name) for file_name in sorted(file_names) if IsSourceFileName(file_name)]
+    return [file_path for file_path in file_paths if file_path.is_file()]
+
+# Returns the GUID Unity assigned to an asset, from the .meta file beside it, or an empty string
+def ReadAssetGuid(asset_path : Path) -> str:
+    meta_path = asset_path.with_name(f"{asset_path.name}.meta")
+    if not meta_path.is_file():
+        return ""
+    for line in meta_path.read_text().splitlines():
+        if line.startswith("guid:"):
+            return line[len("guid:"):].strip()
+    return ""
+
+# Returns the name of the assembly which the scripts directly in 'folder_path' compile into: the .asmdef in the folder, the assembly named by an .asmref in
+# the folder, or 'inherited_name', the assembly of the folder above. An .asmref which refers to its assembly by GUID gives 'GUID:<guid>'.
+def GetFolderAssemblyName(folder_path : Path, inherited_name : str) -> str:
+    file_paths = sorted(path for path in folder_path.iterdir() if path.is_file()) if folder_path.is_dir() else list()
+    for asmdef_path in [path for path in file_paths if path.suffix == ".asmdef"][:1]:
+        try:
+            return json.loads(asmdef_path.read_text(encoding="utf-8-sig")).get("name", asmdef_path.stem)
+        except ValueError:
+            return asmdef_path.stem
+    for asmref_path in [path for path in file_paths if path.suffix == ".asmref"][:1]:
+        try:
+            return json.loads(asmref_path.read_text(encoding="utf-8-sig")).get("reference", inherited_name)
+        except ValueError:
+            pass
+    return inherited_name
+
+# Returns the script files under 'root' grouped by the assembly they compile into: {assembly name: [script paths]}.
+#   A script belongs to the .asmdef in its folder or the nearest folder above it; .asmref files add their folder to the assembly they name. Scripts outside
+#   every .asmdef folder belong to Assembly-CSharp. Folders which are not project sources are left out (See: IsSourceFolderName).
+def GetAssemblySources(root : Path) -> dict[str, list[Path]]:
+    assembly_sources : dict[str, list[Path]] = dict()
+
+    def Walk(folder_path : Path, assembly_name : str) -> None:
+        assembly_name = GetFolderAssemblyName(folder_path, assembly_name)
+        child_paths = sorted(folder_path.iterdir())
+        assembly_sources.setdefault(assembly_name, list()).extend(path for path in child_paths if path.is_file() and path.suffix in SCRIPT_FILE_SUFFIXES)
+        for child_path in [path for path in child_paths if path.is_dir() and IsSourceFolderName(path.name)]:
+            Walk(child_path, assembly_name)
+
+    if root.is_dir():
+        Walk(root, DEFAULT_ASSEMBLY_NAME)
+    return {assembly_name : source_paths for assembly_name, source_paths in assembly_sources.items() if len(source_paths) > 0}
+
+# An assembly defined by an .asmdef file
+class AssemblyDefinition:
+    def __init__(self, name : str, asmdef_path : Path, guid : str, references : list[str], auto_referenced : bool) -> None:
+        self.name = name
+        self.asmdef_path = asmdef_path
+        self.guid = guid
+        self.references = references # Assembly names, or 'GUID:<guid>'
+        self.auto_referenced = auto_referenced
+
+# The assemblies of a Unity project, read from the .asmdef files under its source roots (its Assets folder and local packages), and the references between them.
+#   Used to find which test assemblies can be affected by a set of changed files: those which reference, directly or through other assemblies, an assembly whose
+#   scripts or definition changed.
+class AssemblyGraph:
+    def __init__(self, source_roots : list[Path]) -> None:
+        self.source_roots = [source_root.resolve() for source_root in source_roots if source_root.is_dir()]
+        self.assemblies : dict[str, AssemblyDefinition] = dict()
+
+        for source_root in self.source_roots:
+            for asmdef_path in sorted(source_root.glob("**/*.asmdef")):
+                if not all(IsSourceFolderName(part) for part in asmdef_path.relative_to(source_root).parts[:-1]):
+                    continue
+                try:
+                    asmdef_data = json.loads(asmdef_path.read_text(encoding="utf-8-sig"))
+                except ValueError:
+                    continue
+                name = asmdef_data.get("name", asmdef_path.stem)
+                self.assemblies[name] = AssemblyDefinition(name, asmdef_path, ReadAssetGuid(asmdef_path), asmdef_data.get("references", list()), asmdef_data.get("autoReferenced", True))
+
+        # Resolve GUID references to names, and collect the assemblies which reference each assembly
+        names_by_guid = {f"GUID:{assembly.guid}" : name for name, assembly in self.assemblies.items() if len(assembly.guid) > 0}
+        self.dependents : dict[str, set[str]] = {name : set() for name in self.assemblies}
+        self.dependents[DEFAULT_ASSEMBLY_NAME] = set()
+        for name, assembly in self.assemblies.items():
+            assembly.references = [names_by_guid.get(reference, reference) for reference in assembly.references]
+            for reference in assembly.references:
+                self.dependents.setdefault(reference, set()).add(name)
+            # Scripts outside every .asmdef compile against each auto-referenced assembly
+            if assembly.auto_referenced:
+                self.dependents[name].add(DEFAULT_ASSEMBLY_NAME)
+        self.names_by_guid = names_by_guid
+
+    # Returns the assembly a file under one of the source roots compiles into, or None for a file outside them
+    def GetAssemblyName(self, file_path : Path) -> str:
+        file_path = file_path.resolve()
+        source_root = next((source_root for source_root in self.source_roots if file_path.is_relative_to(source_root)), None)
+        if source_root is None:
+            return None
+
+        folder_paths = [source_root] + [source_root.joinpath(*file_path.relative_to(source_root).parts[:index]) for index in range(1, len(file_path.relative_to(source_root).parts))]
+        assembly_name = DEFAULT_ASSEMBLY_NAME
+        for folder_path in folder_paths:
+            assembly_name = GetFolderAssemblyName(folder_path, assembly_name)
+        return self.names_by_guid.get(assembly_name, assembly_name)
+
+    # Returns 'assembly_names' together with every assembly which references one of them, directly or indirectly
+    def GetDependentClosure(self, assembly_names : set[str]) -> set[str]:
+        closure = set(assembly_names)
+        pending = list(assembly_names)
+        while len(pending) > 0:
+            for dependent_name in self.dependents.get(pending.pop(), set()):
+                if dependent_name not in closure:
+                    closure.add(dependent_name)
+                    pending.append(dependent_name)
+        return closure
+
+    # Returns the test assemblies, of 'test_assemblies', which the changed files can affect, or None when a change cannot be attributed to an assembly
+    # (e.g. a native library source, package manifest or asset) and every test assembly has to run.
+    #   The .meta file of a script is attributed to the script's assembly.
+    def GetAffectedTestAssemblies(self, changed_paths : list[Path], test_assemblies : list[str]) -> list[str]:
+        changed_assemblies = set()
+        for changed_path in changed_paths:
+            script_path = changed_path.with_suffix("") if changed_path.suffix == ".meta" else changed_path
+            if script_path.suffix not in SCRIPT_FILE_SUFFIXES:
+                return None
+
+            assembly_name = self.GetAssemblyName(script_path)
+            if assembly_name is None:
+                return None
+            changed_assemblies.add(assembly_name)
+
+        # Test assemblies are listed by the name of their .asmdef file, which is usually, but not necessarily, the assembly name
+        affected_assemblies = self.GetDependentClosure(changed_assemblies)
+        names_by_file_name = {assembly.asmdef_path.stem : name for name, assembly in self.assemblies.items()}
+        return [test_assembly for test_assembly in test_assemblies if names_by_file_name.get(test_assembly, test_assembly) in affected_assemblies]
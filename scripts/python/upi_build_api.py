@@ -0,0 +1,177 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import threading, time
+
+import scripts.python.upi_toolchain as toolchain
+import scripts.python.upi_utility as utility
+
+from pathlib import Path
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+from scripts.python.upi_build_history import StepRecord
+from scripts.python.upi_job_scheduler import TaskStatusID
+
+# Timing and outcome of one start-up probe (See: BuildEnvironment.Probe)
+class ProbeResult:
+    def __init__(self, name : str, command : list[str]) -> None:
+        self.name = name
+        self.command = command
+        self.duration = 0.0
+        self.returncode = 0
+        self.timed_out = ""
+
+    def Succeeded(self) -> bool:
+        return self.returncode == 0 and len(self.timed_out) == 0
+
+# Facts about the host which hold from one build to the next: the Xcode toolchain, its SDKs, and the Unity installations found under each search root.
+#   A build probes them through its context's environment (See: BuildContext.environment). A process which runs many builds, e.g. a build service, creates one
+#   environment and passes it to every RunBuild, so each fact is probed once rather than once per build. Invalidate() forgets them, e.g. after Xcode or Unity is updated.
+class BuildEnvironment:
+    MAX_CONCURRENT_PROBES = 16
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.toolchain_versions : tuple[str, str] = None
+        self.supported_platforms : list[str] = None
+        self.unity_installations : dict[Path, dict] = dict() # {resolved search root: {Unity version: UnityInstallation}}
+        self.codesign_identities : dict[str, str] = None
+        self.unity_versions : dict[Path, str] = dict() # {Unity executable path: version reported by 'Unity -version'}
+
+        # Probes answered from the cache rather than by running a command, for the build summary
+        self.cache_hits = 0
+
+    # Returns the answer to a toolchain query kept in the attribute 'attribute_name', running 'command' and parsing its output with 'parse' when it is not known.
+    #   Only the answers of commands which succeeded are kept. A failed start-up probe leaves an empty answer in the build's 'fallbacks' (See: Probe), which is
+    #   returned instead of running the command again in the same build; the next build asks again.
+    def GetToolchainAnswer(self, attribute_name : str, command : list[str], parse : Callable[[str], object], fallbacks : dict) -> object:
+        with self.lock:
+            answer = getattr(self, attribute_name)
+            if answer is not None:
+                self.cache_hits += 1
+                return answer
+            if fallbacks is not None and attribute_name in fallbacks:
+                return fallbacks[attribute_name]
+
+            command_output = utility.RunCommand(command)
+            answer = parse(command_output.stdout)
+            if command_output.returncode == 0:
+                setattr(self, attribute_name, answer)
+            return answer
+
+    # Returns the Xcode version and build number selected by xcode-select (See: toolchain.GetToolchainVersions)
+    def GetToolchainVersions(self, fallbacks : dict = None) -> tuple[str, str]:
+        return self.GetToolchainAnswer("toolchain_versions", toolchain.TOOLCHAIN_VERSION_COMMAND, toolchain.ParseToolchainVersions, fallbacks)
+
+    # Returns the platforms with an installed SDK (See: toolchain.GetSupportedPlatformList)
+    def GetSupportedPlatformList(self, fallbacks : dict = None) -> list[str]:
+        return list(self.GetToolchainAnswer("supported_platforms", toolchain.SDK_VERSION_COMMAND, toolchain.ParseSupportedPlatformList, fallbacks))
+
+    # Returns the Unity installations found under 'search_root' by an earlier build, or None if it has not been scanned
+    def GetUnityInstallations(self, search_root : Path) -> dict:
+        with self.lock:
+            installations = self.unity_installations.get(search_root.resolve())
+            if installations is not None:
+                self.cache_hits += 1
+            return dict(installations) if installations is not None else None
+
+    def SetUnityInstallations(self, search_root : Path, installations : dict) -> None:
+        with self.lock:
+            self.unity_installations[search_root.resolve()] = dict(installations)
+
+    # Returns the codesigning identities on the system (See: toolchain.GetCodesignIdentities)
+    def GetCodesignIdentities(self, fallbacks : dict = None) -> dict[str, str]:
+        return dict(self.GetToolchainAnswer("codesign_identities", toolchain.CODESIGN_IDENTITY_COMMAND, toolchain.ParseCodesignIdentities, fallbacks))
+
+    # Returns the version reported by a Unity executable's -version option, or an empty string if it cannot be read. Only versions which were read are kept.
+    def GetUnityVersion(self, executable_path : Path, fallbacks : dict = None) -> str:
+        with self.lock:
+            if executable_path in self.unity_versions:
+                self.cache_hits += 1
+                return self.unity_versions[executable_path]
+            if fallbacks is not None and executable_path in fallbacks:
+                return fallbacks[executable_path]
+
+            command_output = utility.RunCommand([executable_path, "-version"])
+            unity_version = command_output.stdout.rstrip("\n")
+            if command_output.returncode == 0 and len(unity_version) > 0:
+                self.unity_versions[executable_path] = unity_version
+            return unity_version
+
+    # Runs the start-up queries a build needs all at once, rather than one after the other as each answer is first needed, so that start-up takes as long as the
+    # slowest query rather than all of them together. Answers already known are not queried again. Later Get calls return the answers from the cache.
+    #   Each query is stopped after 'timeout' seconds. A query which fails or is stopped is not kept in the environment, so the next build asks again; its empty
+    #   answer is recorded in the build's 'fallbacks' instead, so the build goes on without it rather than waiting again.
+    #   Returns the timing and outcome of each query that ran.
+    def Probe(self, toolchain_versions : bool, codesign_identities : bool, unity_install_root : Path, timeout : float, fallbacks : dict) -> list[ProbeResult]:
+        # (probe, answer key, output parser, store for a successful answer)
+        probes : list[tuple[ProbeResult, object, Callable[[str], object], Callable[[object], None]]] = list()
+        with self.lock:
+            if self.supported_platforms is None:
+                probes.append((ProbeResult("Installed SDKs", toolchain.SDK_VERSION_COMMAND), "supported_platforms", toolchain.ParseSupportedPlatformList, lambda answer: setattr(self, "supported_platforms", answer)))
+            if toolchain_versions and self.toolchain_versions is None:
+                probes.append((ProbeResult("Xcode version", toolchain.TOOLCHAIN_VERSION_COMMAND), "toolchain_versions", toolchain.ParseToolchainVersions, lambda answer: setattr(self, "toolchain_versions", answer)))
+            if codesign_identities and self.codesign_identities is None:
+                probes.append((ProbeResult("Codesign identities", toolchain.CODESIGN_IDENTITY_COMMAND), "codesign_identities", toolchain.ParseCodesignIdentities, lambda answer: setattr(self, "codesign_identities", answer)))
+            if unity_install_root is not None and unity_install_root.resolve() in self.unity_installations:
+                unity_install_root = None
+
+        def RunProbe(probe : ProbeResult, answer_key : object, parse : Callable[[str], object], store : Callable[[object], None]) -> ProbeResult:
+            start_time = time.monotonic()
+            command_output = utility.RunCommand(probe.command, limits=utility.CommandLimits(timeout=timeout))
+            probe.duration = time.monotonic() - start_time
+            probe.returncode = command_output.returncode
+            probe.timed_out = command_output.timed_out
+            with self.lock:
+                if probe.Succeeded():
+                    store(parse(command_output.stdout))
+                else:
+                    fallbacks[answer_key] = parse("")
+            return probe
+
+        # The Unity installation root is searched alongside the toolchain queries, and each Unity executable found is queried as soon as the search ends
+        with ThreadPoolExecutor(max_workers=BuildEnvironment.MAX_CONCURRENT_PROBES) as executor:
+            futures = [executor.submit(RunProbe, *probe) for probe in probes]
+            if unity_install_root is not None and unity_install_root.is_dir():
+                for executable_path in executor.submit(lambda: sorted(app_path.joinpath("Contents/MacOS/Unity") for app_path in unity_install_root.glob('**/Unity.app'))).result():
+                    if executable_path.exists() and executable_path not in self.unity_versions:
+                        futures.append(executor.submit(RunProbe, ProbeResult(f"Unity at {executable_path.parents[2]}", [f"{executable_path}", "-version"]), executable_path,
+                                                       lambda output: output.rstrip("\n"), lambda answer, executable_path=executable_path: self.unity_versions.__setitem__(executable_path, answer)))
+            return [future.result() for future in futures]
+
+    def Invalidate(self) -> None:
+        with self.lock:
+            self.toolchain_versions = None
+            self.supported_platforms = None
+            self.codesign_identities = None
+            self.unity_installations.clear()
+            self.unity_versions.clear()
+
+# What RunBuild returns to its caller. 'returncode' is the exit code build.py exits with; it is non-zero when the build stopped before processing the plug-ins,
+# e.g. on invalid options. The outcome of each plug-in is in 'stage_status' and 'steps'.
+class BuildResult:
+    def __init__(self) -> None:
+        self.returncode = 0
+        self.run_id : int = None # Build history run (See: BuildHistory)
+        self.stage_status : dict[tuple[str, str], str] = dict() # {(plug-in id, PipelineStageID): TaskStatusID}
+        self.steps : list[StepRecord] = list()
+        self.package_paths : dict[str, Path] = dict() # {plug-in id: package path}
+        self.test_build_output_path : Path = None
+        self.editmode_results : dict = dict() # {plug-in id: EditModeTestResult}
+
+    def Succeeded(self) -> bool:
+        return self.returncode == 0 and all(status == TaskStatusID.SUCCEEDED for status in self.stage_status.values()) and all(result.Succeeded() for result in self.editmode_results.values())
+
+    def ToDict(self) -> dict:
+        return {
+            "returncode" : self.returncode,
+            "succeeded" : self.Succeeded(),
+            "run_id" : self.run_id,
+            "stages" : [{"plugin_id" : plugin_id, "stage" : stage, "status" : status} for (plugin_id, stage), status in self.stage_status.items()],
+            "steps" : [{"step" : step.step, "plugin_id" : step.plugin_id, "platform" : step.platform, "config" : step.config, "unity_version" : step.unity_version,
+                        "duration" : step.duration, "succeeded" : step.succeeded} for step in self.steps],
+            "packages" : {plugin_id : f"{package_path}" for plugin_id, package_path in self.package_paths.items()},
+            "test_build_output_path" : f"{self.test_build_output_path}" if self.test_build_output_path is not None else None,
+            "editmode_tests" : {plugin_id : result.ToDict() for plugin_id, result in self.editmode_results.items()}
+        }
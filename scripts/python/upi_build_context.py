@@ -1,24 +1,68 @@
 #! /usr/bin/env python3
 # Requirements: python3
 
+import hashlib, json
+
 from pathlib import Path
-from scripts.python.upi_utility import Printer
-from scripts.python.upi_cli_argument_options import PlatformID
+from scripts.python.upi_utility import Printer, CommandLimits
+from scripts.python.upi_cli_argument_options import PlatformID, BuildProfileID, CommandTypeID
+from scripts.python.upi_build_history import BuildHistory
+from scripts.python.upi_compiler_cache import CompilerCache
+from scripts.python.upi_library_cache import UnityLibraryCache
+from scripts.python.upi_test_cache import TestResultCache
+from scripts.python.upi_unity_worker_pool import UnityWorkerPool
+from scripts.python.upi_host_locks import HostSemaphore, HostLockSet
+from scripts.python.upi_job_scheduler import AdmissionController, JobExecutor
+from scripts.python.upi_build_journal import BuildJournal
+from scripts.python.upi_build_shards import BuildShard
+from scripts.python.upi_parallel_gzip import ParallelGzip
+from scripts.python.upi_build_api import BuildEnvironment
+from scripts.python.upi_source_overlay import SourceOverlay
 
 # --
 class BuildInfo:
-    def __init__(self, platform_root : str, build_destination : str) -> None:
+    def __init__(self, platform_root : str, build_destination : str, products_folder_suffix : str) -> None:
         self.platform_root = platform_root
         self.build_destination = build_destination
 
+        # Xcode places build products under 'Build/Products/<Config><suffix>' within the derived data folder
+        self.products_folder_suffix = products_folder_suffix
+
 BUILD_INFO_TABLE = {
-    PlatformID.IOS : BuildInfo("iOS", "generic/platform=iOS"),
-    PlatformID.IOS_SIMULATOR : BuildInfo("iOS", "generic/platform=iOS Simulator"),
-    PlatformID.TVOS : BuildInfo("tvOS", "generic/platform=tvOS"),
-    PlatformID.TVOS_SIMULATOR : BuildInfo("tvOS", "generic/platform=tvOS Simulator"),
-    PlatformID.MACOS : BuildInfo("macOS", "generic/platform=macOS"),
-    PlatformID.VISIONOS : BuildInfo("visionOS", "generic/platform=visionOS"),
-    PlatformID.VISIONOS_SIMULATOR : BuildInfo("visionOS", "generic/platform=visionOS Simulator")
+    PlatformID.IOS : BuildInfo("iOS", "generic/platform=iOS", "-iphoneos"),
+    PlatformID.IOS_SIMULATOR : BuildInfo("iOS", "generic/platform=iOS Simulator", "-iphonesimulator"),
+    PlatformID.TVOS : BuildInfo("tvOS", "generic/platform=tvOS", "-appletvos"),
+    PlatformID.TVOS_SIMULATOR : BuildInfo("tvOS", "generic/platform=tvOS Simulator", "-appletvsimulator"),
+    PlatformID.MACOS : BuildInfo("macOS", "generic/platform=macOS", ""),
+    PlatformID.VISIONOS : BuildInfo("visionOS", "generic/platform=visionOS", "-xros"),
+    PlatformID.VISIONOS_SIMULATOR : BuildInfo("visionOS", "generic/platform=visionOS Simulator", "-xrsimulator")
+}
+
+# --
+class BuildProfile:
+    def __init__(self, build_settings : dict[str, str], platform_build_settings : dict[str, dict[str, str]] = None, use_derived_data_path : bool = False, use_shared_module_cache : bool = False) -> None:
+        # Build settings passed to xcodebuild as KEY=VALUE for every platform
+        self.build_settings = build_settings
+
+        # Additional build settings for specific platforms, e.g. {PlatformID.MACOS: {"ONLY_ACTIVE_ARCH": "YES"}}
+        self.platform_build_settings = platform_build_settings if platform_build_settings is not None else dict()
+
+        # When set, each plug-in builds into its own folder under DerivedData/<profile>/ rather than Xcode's default location
+        self.use_derived_data_path = use_derived_data_path
+
+        # When set, all plug-ins share one clang module cache under DerivedData/
+        self.use_shared_module_cache = use_shared_module_cache
+
+    # Returns a short, stable hash of everything in the profile which can affect build output. Include this in any cache key derived from native build output.
+    def CacheKey(self) -> str:
+        profile_description = json.dumps([self.build_settings, self.platform_build_settings, self.use_derived_data_path, self.use_shared_module_cache], sort_keys=True)
+        return hashlib.sha256(profile_description.encode()).hexdigest()[:12]
+
+BUILD_PROFILE_TABLE = {
+    BuildProfileID.DEFAULT : BuildProfile(dict()),
+    BuildProfileID.CI_FAST : BuildProfile({"COMPILER_INDEX_STORE_ENABLE" : "NO", "DEBUG_INFORMATION_FORMAT" : "dwarf"}, use_derived_data_path=True, use_shared_module_cache=True),
+    BuildProfileID.DEV_LOCAL : BuildProfile({"COMPILER_INDEX_STORE_ENABLE" : "NO", "DEBUG_INFORMATION_FORMAT" : "dwarf"}, {PlatformID.MACOS : {"ONLY_ACTIVE_ARCH" : "YES"}}, use_derived_data_path=True, use_shared_module_cache=True),
+    BuildProfileID.RELEASE : BuildProfile({"COMPILER_INDEX_STORE_ENABLE" : "NO", "DEBUG_INFORMATION_FORMAT" : "dwarf-with-dsym", "ONLY_ACTIVE_ARCH" : "NO"}, use_derived_data_path=True)
 }
 
 # Common context data for building the plug-ins.
@@ -26,13 +70,29 @@ class BuildContext:
     SIMULATOR_PLATFORMS = [PlatformID.IOS_SIMULATOR, PlatformID.TVOS_SIMULATOR, PlatformID.VISIONOS_SIMULATOR]
     DEVICE_PLATFORMS = [PlatformID.IOS, PlatformID.TVOS, PlatformID.MACOS, PlatformID.VISIONOS]
 
-    def __init__(self, root_path : Path) -> None:
+    # Joins the platforms covered by a single batched xcodebuild invocation into one command table key, e.g. "iOS+iPhoneSimulator"
+    BATCHED_PLATFORM_SEPARATOR = "+"
+
+    def __init__(self, root_path : Path, environment : BuildEnvironment = None) -> None:
+        # Toolchain and Unity installation facts, shared with the other builds of the process when given (See: RunBuild in build.py)
+        self.environment = environment if environment is not None else BuildEnvironment()
+
+        # Empty answers of start-up probes which failed or timed out in this build; the environment does not keep them (See: BuildEnvironment.Probe)
+        self.probe_fallbacks : dict = dict()
+
         # Required Paths
         self.script_root = root_path
         self.build_output_path = root_path.joinpath("Build")
         self.plugin_root = root_path.joinpath("plug-ins")
         self.test_build_root = root_path.joinpath("TestBuilds")
         self.unity_install_root = Path("/Applications/Unity")
+        self.build_history_path = root_path.joinpath("BuildHistory.sqlite")
+        self.derived_data_root = root_path.joinpath("DerivedData")
+        self.build_cache_root = root_path.joinpath("BuildCache")
+
+        # The plug-ins are read from source_plugin_root. With --out-of-tree, plugin_root is a copy of them under the output root, which the build writes to instead.
+        self.source_plugin_root = self.plugin_root
+        self.source_overlay : SourceOverlay = None
 
         # Build options
         self.build_actions : dict[str, bool] = dict()
@@ -42,13 +102,84 @@ class BuildContext:
         self.build_tests = False
         self.build_configs : dict[str, bool] = dict()
         self.codesign_hash = ""
+        self.batch_xcodebuild = False
+        self.build_profile = BuildProfileID.DEFAULT
+        self.compiler_cache : CompilerCache = None
+        self.library_cache : UnityLibraryCache = None
+        self.test_cache : TestResultCache = None
+        self.unity_workers : UnityWorkerPool = None
+        self.unity_seats : HostSemaphore = None
+        self.host_locks : HostLockSet = None
+
+        # Watchdog limits for each type of external command. Every command the build runs with these limits is idempotent and safe to retry after a hang.
+        self.command_limits : dict[str, CommandLimits] = {
+            CommandTypeID.XCODEBUILD : CommandLimits(timeout=3600, inactivity_timeout=900, retries=1),
+            CommandTypeID.UNITY : CommandLimits(timeout=5400, inactivity_timeout=900, retries=2),
+            CommandTypeID.CODESIGN : CommandLimits(timeout=300, inactivity_timeout=120, retries=2),
+            CommandTypeID.PACK : CommandLimits(timeout=900, inactivity_timeout=300, retries=1)
+        }
+
+        # Build step history
+        self.history : BuildHistory = None
+
+        # Concurrency: the executor runs per plug-in jobs, the admission controller gates the heavy commands within them. Both default to one at a time.
+        self.admission = AdmissionController()
+        self.executor = JobExecutor()
+
+        # Journal of completed pipeline steps, used to resume interrupted runs; None when steps are not journaled
+        self.journal : BuildJournal = None
+
+        # The shard of a build spread across several machines which this run builds; None when this run builds every native library
+        self.shard : BuildShard = None
+
+        # When set, each plug-in is also packed as one variant package per platform and config (See: NativeUnityPluginManager.GeneratePlugInPackageSlices)
+        self.slice_packages = False
+
+        # Files changed since --affected-since, used to select the test assemblies to run; None when every test assembly runs
+        self.changed_paths : list[Path] = None
+
+        # Multi-core gzip used to compress packages; None leaves compression to tar
+        self.package_compressor : ParallelGzip = None
         
         # Output formatting
         self.printer : Printer = None
 
+    # Returns the derived data folder used for a plug-in's xcodebuild invocations when the build profile or batched mode requires an explicit -derivedDataPath
+    def GetDerivedDataPath(self, plugin_id : str) -> Path:
+        return self.derived_data_root.joinpath(self.build_profile, plugin_id)
+
+    # Returns an identifier for the selected build profile, such as 'ci-fast:0123456789ab', suitable for inclusion in cache keys.
+    def GetBuildProfileKey(self) -> str:
+        return f"{self.build_profile}:{BUILD_PROFILE_TABLE[self.build_profile].CacheKey()}"
+
+    # Returns the derived data path and KEY=VALUE build setting arguments which the selected build profile and compiler cache add to an xcodebuild command building 'platforms'
+    def GenerateBuildSettingArguments(self, plugin_id : str, platforms : list[str]) -> list[str]:
+        profile = BUILD_PROFILE_TABLE[self.build_profile]
+        arguments = list()
+
+        if profile.use_derived_data_path or self.batch_xcodebuild:
+            arguments += ["-derivedDataPath", f"{self.GetDerivedDataPath(plugin_id)}"]
+
+        build_settings = dict(profile.build_settings)
+        for platform in platforms:
+            build_settings.update(profile.platform_build_settings.get(platform, dict()))
+
+        if profile.use_shared_module_cache:
+            build_settings["CLANG_MODULE_CACHE_PATH"] = f"{self.derived_data_root.joinpath('ModuleCache.noindex')}"
+
+        if self.compiler_cache is not None:
+            build_settings.update(self.compiler_cache.GetBuildSettings())
+
+        arguments += [f"{key}={value}" for key, value in build_settings.items()]
+        return arguments
+
     # Helper method creates an xcodebuild command for each target platform
     # Returns as a dictionary mapping a supported platform string to a list of strings ready to pass to subprocess.run()
-    def GenerateXcodeBuildCommands(self) -> dict[str, dict[str, list[str]]]:        
+    #   When 'batch_xcodebuild' is set, see GenerateBatchedXcodeBuildCommands
+    def GenerateXcodeBuildCommands(self, plugin_id : str = "") -> dict[str, dict[str, list[str]]]:
+        if self.batch_xcodebuild:
+            return self.GenerateBatchedXcodeBuildCommands(plugin_id)
+
         build_commands = dict()
         for platform, platform_enabled in self.platforms.items():
             if platform_enabled:
@@ -56,6 +187,35 @@ class BuildContext:
                 currBuildInfo = BUILD_INFO_TABLE[platform]
                 for config, config_enabled in self.build_configs.items():
                     if config_enabled:
-                        command = ["xcodebuild", "-scheme", f"{currBuildInfo.platform_root} - {config}", "-destination", f"{currBuildInfo.build_destination}", "clean", "build"]
+                        command = ["xcodebuild", "-scheme", f"{currBuildInfo.platform_root} - {config}", "-destination", f"{currBuildInfo.build_destination}"]
+                        command += self.GenerateBuildSettingArguments(plugin_id, [platform])
+                        command += ["clean", "build"]
                         build_commands[platform][config] = command
         return build_commands
+
+    # Groups every enabled platform which shares an Xcode scheme (e.g. iOS and iPhoneSimulator share "iOS - <Config>") into a single xcodebuild invocation with one -destination per platform.
+    # Returns the same shape as GenerateXcodeBuildCommands, but keyed by the platforms in each group joined with BATCHED_PLATFORM_SEPARATOR.
+    #   Scheme post-actions only run once per invocation, so products are always written to a per plug-in derived data folder and must be copied to NativeLibraries~ afterwards. (See: GetBatchedProductsPath)
+    def GenerateBatchedXcodeBuildCommands(self, plugin_id : str) -> dict[str, dict[str, list[str]]]:
+        platform_groups : dict[str, list[str]] = dict()
+        for platform, platform_enabled in self.platforms.items():
+            if platform_enabled:
+                platform_groups.setdefault(BUILD_INFO_TABLE[platform].platform_root, list()).append(platform)
+
+        build_commands = dict()
+        for platform_root, platforms in platform_groups.items():
+            group_key = BuildContext.BATCHED_PLATFORM_SEPARATOR.join(platforms)
+            build_commands[group_key] = dict()
+            for config, config_enabled in self.build_configs.items():
+                if config_enabled:
+                    command = ["xcodebuild", "-scheme", f"{platform_root} - {config}"]
+                    for platform in platforms:
+                        command += ["-destination", f"{BUILD_INFO_TABLE[platform].build_destination}"]
+                    command += self.GenerateBuildSettingArguments(plugin_id, platforms)
+                    command += ["clean", "build"]
+                    build_commands[group_key][config] = command
+        return build_commands
+
+    # Returns the folder where a batched xcodebuild invocation leaves the products for the given platform and config.
+    def GetBatchedProductsPath(self, plugin_id : str, platform : str, config : str) -> Path:
+        return self.GetDerivedDataPath(plugin_id).joinpath("Build", "Products", f"{config}{BUILD_INFO_TABLE[platform].products_folder_suffix}")
@@ -0,0 +1,264 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import sqlite3, threading, time, statistics
+
+from datetime import datetime
+from pathlib import Path
+
+from scripts.python.upi_utility import Printer, ResourceUsage, ResourceUsageCollector
+
+# Identifiers for each kind of step recorded in the build history database
+class BuildStepID:
+    NATIVE_BUILD = "native_build"
+    CODESIGN = "codesign"
+    TOUCH_PROJECT = "touch_project"
+    TEST_BUILD = "test_build"
+    EDIT_MODE_TEST = "edit_mode_test"
+    PACK = "pack"
+
+# Timing, outcome and resource usage for a single build step.
+#   Resource usage is the sum over every command RunCommand reaped on this thread while the step ran, as reported by wait4 for each child.
+#   max_rss_bytes is the largest peak of any single command rather than a sum.
+class StepRecord:
+    def __init__(self, step : str, plugin_id : str, platform : str = "", config : str = "", xcode_version : str = "", unity_version : str = "", build_profile : str = "") -> None:
+        self.step = step
+        self.plugin_id = plugin_id
+        self.platform = platform
+        self.config = config
+        self.xcode_version = xcode_version
+        self.unity_version = unity_version
+        self.build_profile = build_profile
+
+        self.start_time = time.time()
+        self.duration = 0.0
+        self.succeeded = False
+        self.usage = ResourceUsage()
+        self.command_count = 0
+
+        self._start_counter = time.perf_counter()
+        self._collector = ResourceUsageCollector()
+        self._collector.Start()
+
+    # Stops the step timer and captures the resource usage of the commands run since the step began.
+    def Finish(self, succeeded : bool) -> None:
+        self._collector.Stop()
+
+        self.duration = time.perf_counter() - self._start_counter
+        self.succeeded = succeeded
+        self.usage = self._collector.usage
+        self.command_count = self._collector.command_count
+
+# A step from the latest run whose duration exceeded its rolling baseline by more than the report threshold.
+class StepRegression:
+    def __init__(self, step : str, plugin_id : str, platform : str, config : str, latest_duration : float, baseline_duration : float, sample_count : int) -> None:
+        self.step = step
+        self.plugin_id = plugin_id
+        self.platform = platform
+        self.config = config
+        self.latest_duration = latest_duration
+        self.baseline_duration = baseline_duration
+        self.sample_count = sample_count
+
+    # Fractional slow-down relative to the baseline, e.g. 0.25 for a step that took 25% longer
+    def Change(self) -> float:
+        return (self.latest_duration - self.baseline_duration) / self.baseline_duration if self.baseline_duration > 0 else 0.0
+
+    def Identifier(self) -> str:
+        return '/'.join(part for part in [self.plugin_id, self.step, self.platform, self.config] if len(part) > 0)
+
+# Persistent record of every build step, stored in a local SQLite database.
+#   Each invocation of the build script is a 'run'; each run contains any number of step records.
+#   Steps are keyed by step type, plug-in, platform, config, Xcode version, Unity version and build profile so that durations can be compared like-for-like.
+class BuildHistory:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            start_time TEXT NOT NULL,
+            script_version TEXT NOT NULL,
+            command_line TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS steps (
+            step_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL REFERENCES runs(run_id),
+            step TEXT NOT NULL,
+            plugin_id TEXT NOT NULL,
+            platform TEXT NOT NULL,
+            config TEXT NOT NULL,
+            xcode_version TEXT NOT NULL,
+            unity_version TEXT NOT NULL,
+            build_profile TEXT NOT NULL DEFAULT '',
+            start_time REAL NOT NULL,
+            duration REAL NOT NULL,
+            succeeded INTEGER NOT NULL,
+            user_cpu_time REAL NOT NULL,
+            system_cpu_time REAL NOT NULL,
+            max_rss_bytes INTEGER NOT NULL,
+            block_input_ops INTEGER NOT NULL,
+            block_output_ops INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS steps_by_key ON steps(step, plugin_id, platform, config, xcode_version, unity_version);
+    """
+
+    # Columns added after the initial schema, applied to existing databases on open
+    SCHEMA_MIGRATIONS = {
+        "build_profile" : "ALTER TABLE steps ADD COLUMN build_profile TEXT NOT NULL DEFAULT ''"
+    }
+
+    def __init__(self, database_path : Path) -> None:
+        self.database_path = database_path
+        # Steps may finish on job executor threads; writes are serialized with 'lock'
+        self.connection = sqlite3.connect(database_path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.executescript(BuildHistory.SCHEMA)
+
+        step_columns = [row[1] for row in self.connection.execute("PRAGMA table_info(steps)").fetchall()]
+        for column, migration in BuildHistory.SCHEMA_MIGRATIONS.items():
+            if column not in step_columns:
+                self.connection.execute(migration)
+        self.connection.commit()
+
+        self.run_id : int = None
+
+        # Set once the toolchain and build options are known; stamped onto each subsequent step record
+        self.xcode_version = ""
+        self.build_profile = ""
+
+        # Steps finished during this invocation, for the end of run resource summary
+        self.run_records : list[StepRecord] = list()
+
+    # Creates a new run entry; all steps recorded afterwards belong to this run.
+    def BeginRun(self, script_version : str, command_line : list[str]) -> int:
+        cursor = self.connection.execute("INSERT INTO runs (start_time, script_version, command_line) VALUES (?, ?, ?)",
+                                         (datetime.now().isoformat(timespec="seconds"), script_version, ' '.join(command_line)))
+        self.connection.commit()
+        self.run_id = cursor.lastrowid
+        return self.run_id
+
+    # Starts timing a step. Pass the returned record to EndStep once the step completes.
+    def BeginStep(self, step : str, plugin_id : str, platform : str = "", config : str = "", unity_version : str = "") -> StepRecord:
+        return StepRecord(step, plugin_id, platform, config, self.xcode_version, unity_version, self.build_profile)
+
+    # Finishes timing a step and writes it to the database.
+    def EndStep(self, record : StepRecord, succeeded : bool) -> None:
+        record.Finish(succeeded)
+
+        with self.lock:
+            self.run_records.append(record)
+
+            if self.run_id is None:
+                return
+
+            self.connection.execute("INSERT INTO steps (run_id, step, plugin_id, platform, config, xcode_version, unity_version, build_profile, start_time, duration, succeeded,"
+                                    " user_cpu_time, system_cpu_time, max_rss_bytes, block_input_ops, block_output_ops) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (self.run_id, record.step, record.plugin_id, record.platform, record.config, record.xcode_version, record.unity_version,
+                                     record.build_profile, record.start_time, record.duration, int(record.succeeded), record.usage.user_cpu_time, record.usage.system_cpu_time,
+                                     record.usage.max_rss_bytes, record.usage.block_input_ops, record.usage.block_output_ops))
+            self.connection.commit()
+
+    # Returns the median duration, in seconds, of the most recent successful runs of a step, or None if the step has never succeeded.
+    #   Only runs with the current Xcode version and build profile are compared, as in GetRegressions.
+    #   Intended for schedulers which need to order or partition work by expected cost.
+    def GetDurationEstimate(self, step : str, plugin_id : str, platform : str = "", config : str = "", unity_version : str = "", sample_count : int = 5) -> float:
+        with self.lock:
+            rows = self.connection.execute("SELECT duration FROM steps WHERE step = ? AND plugin_id = ? AND platform = ? AND config = ? AND xcode_version = ? AND unity_version = ?"
+                                           " AND build_profile = ? AND succeeded = 1 ORDER BY step_id DESC LIMIT ?",
+                                           (step, plugin_id, platform, config, self.xcode_version, unity_version, self.build_profile, sample_count)).fetchall()
+        return statistics.median([row[0] for row in rows]) if len(rows) > 0 else None
+
+    # Returns the largest peak RSS, in bytes, of the most recent successful runs of a step type across all plug-ins, or None if the step has never succeeded.
+    #   Used to estimate how much memory a command of that type will need before it is started.
+    def GetPeakMemoryEstimate(self, step : str, sample_count : int = 10) -> int:
+        with self.lock:
+            rows = self.connection.execute("SELECT max_rss_bytes FROM steps WHERE step = ? AND succeeded = 1 ORDER BY step_id DESC LIMIT ?", (step, sample_count)).fetchall()
+        return max(row[0] for row in rows) if len(rows) > 0 else None
+
+    # Returns the id of the most recent run which recorded at least one step, or None if the database is empty.
+    def GetLatestRunId(self) -> int:
+        row = self.connection.execute("SELECT MAX(run_id) FROM steps").fetchone()
+        return row[0] if row is not None else None
+
+    # Compares each successful step of the latest run against the median of the same step over the previous 'window' runs.
+    # Returns a list of StepRegression for every step which slowed down by more than 'threshold' (a fraction, e.g. 0.2 for 20%).
+    def GetRegressions(self, window : int = 5, threshold : float = 0.2) -> list[StepRegression]:
+        latest_run_id = self.GetLatestRunId()
+        if latest_run_id is None:
+            return list()
+
+        baseline_run_ids = [row[0] for row in self.connection.execute("SELECT DISTINCT run_id FROM steps WHERE run_id < ? ORDER BY run_id DESC LIMIT ?", (latest_run_id, window)).fetchall()]
+        if len(baseline_run_ids) == 0:
+            return list()
+
+        regressions = list()
+        run_id_placeholders = ','.join('?' * len(baseline_run_ids))
+        latest_steps = self.connection.execute("SELECT step, plugin_id, platform, config, xcode_version, unity_version, build_profile, duration FROM steps WHERE run_id = ? AND succeeded = 1", (latest_run_id,)).fetchall()
+
+        for step, plugin_id, platform, config, xcode_version, unity_version, build_profile, duration in latest_steps:
+            baseline_rows = self.connection.execute(f"SELECT duration FROM steps WHERE run_id IN ({run_id_placeholders}) AND succeeded = 1"
+                                                    " AND step = ? AND plugin_id = ? AND platform = ? AND config = ? AND xcode_version = ? AND unity_version = ? AND build_profile = ?",
+                                                    (*baseline_run_ids, step, plugin_id, platform, config, xcode_version, unity_version, build_profile)).fetchall()
+            if len(baseline_rows) == 0:
+                continue
+
+            regression = StepRegression(step, plugin_id, platform, config, duration, statistics.median([row[0] for row in baseline_rows]), len(baseline_rows))
+            if regression.Change() > threshold:
+                regressions.append(regression)
+
+        return sorted(regressions, key=lambda r: r.Change(), reverse=True)
+
+    # Prints a regression report for the latest run. Returns True when no regressions were found.
+    def PrintRegressionReport(self, printer : Printer, window : int = 5, threshold : float = 0.2) -> bool:
+        latest_run_id = self.GetLatestRunId()
+        if latest_run_id is None:
+            printer.WarningMessage(f"No build steps recorded in {self.database_path}")
+            return True
+
+        printer.MessageWithContext("Build history: ", f"{self.database_path}", "\n")
+        printer.MessageWithContext("Latest run: ", f"{latest_run_id}")
+        printer.MessageWithContext("Baseline: ", f"median of up to {window} previous run(s)")
+        printer.MessageWithContext("Regression threshold: ", f"{threshold:.0%}")
+
+        regressions = self.GetRegressions(window, threshold)
+        if len(regressions) == 0:
+            printer.StatusMessage("No regressions found.", "\n")
+            return True
+
+        printer.WarningMessage(f"{len(regressions)} step(s) regressed beyond the threshold:")
+        for regression in regressions:
+            printer.MessageWithContext(f"{regression.Identifier()}: ", f"{regression.latest_duration:.1f}s vs. {regression.baseline_duration:.1f}s baseline (+{regression.Change():.0%}, {regression.sample_count} sample(s))", printer.Indent(1))
+
+        return False
+
+    # Prints the wall time and resource usage of this run's steps, totalled per plug-in and per step type within each plug-in.
+    #   CPU times and block I/O are sums; peak RSS is the largest of any single command, which is the figure to size agents and parallelism limits by.
+    def PrintResourceSummary(self, printer : Printer) -> None:
+        if len(self.run_records) == 0:
+            printer.InfoMessage("No build steps were run.")
+            return
+
+        def FormatUsage(duration : float, usage : ResourceUsage, command_count : int) -> str:
+            return (f"wall {duration:.1f}s, user {usage.user_cpu_time:.1f}s, sys {usage.system_cpu_time:.1f}s, peak RSS {usage.max_rss_bytes / (1024 * 1024):.0f} MiB,"
+                    f" block I/O {usage.block_input_ops} in / {usage.block_output_ops} out, {command_count} command(s)")
+
+        plugin_ids = list(dict.fromkeys(record.plugin_id for record in self.run_records))
+        for plugin_id in plugin_ids:
+            plugin_usage = ResourceUsage()
+            plugin_duration = 0.0
+            plugin_command_count = 0
+            step_totals : dict[str, tuple[float, ResourceUsage, int]] = dict()
+
+            for record in (record for record in self.run_records if record.plugin_id == plugin_id):
+                plugin_usage.Add(record.usage)
+                plugin_duration += record.duration
+                plugin_command_count += record.command_count
+
+                step_duration, step_usage, step_command_count = step_totals.get(record.step, (0.0, ResourceUsage(), 0))
+                step_usage.Add(record.usage)
+                step_totals[record.step] = (step_duration + record.duration, step_usage, step_command_count + record.command_count)
+
+            printer.MessageWithContext(f"{plugin_id}: ", FormatUsage(plugin_duration, plugin_usage, plugin_command_count), printer.Indent(1))
+            for step, (step_duration, step_usage, step_command_count) in step_totals.items():
+                printer.MessageWithContext(f"{step}: ", FormatUsage(step_duration, step_usage, step_command_count), printer.Indent(2))
+
+    def Close(self) -> None:
+        self.connection.close()
@@ -0,0 +1,141 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import hashlib, json, os, threading, time
+
+from pathlib import Path
+
+from scripts.python.upi_utility import Printer
+
+# Kinds of entry written to the build journal
+class JournalEntryID:
+    RUN = "run"
+    RESUME = "resume"
+    STEP = "step"
+
+# Returns a hash of the relative path, size and modification time of every file under 'root'.
+#   Cheap enough to compute for whole Unity projects, and sensitive to any edit. Folders named in 'excluded_names' and files ending in 'excluded_suffixes' are skipped.
+def FingerprintTree(root : Path, excluded_names : list[str] = None, excluded_suffixes : list[str] = None) -> str:
+    excluded_names = excluded_names if excluded_names is not None else list()
+    excluded_suffixes = tuple(excluded_suffixes) if excluded_suffixes is not None else tuple()
+
+    fingerprint = hashlib.sha256()
+    if not root.exists():
+        return fingerprint.hexdigest()
+
+    for folder_path, folder_names, file_names in os.walk(root):
+        folder_names[:] = sorted(name for name in folder_names if name not in excluded_names)
+        for file_name in sorted(file_names):
+            if len(excluded_suffixes) > 0 and file_name.endswith(excluded_suffixes):
+                continue
+            file_path = Path(folder_path, file_name)
+            file_stat = file_path.lstat()
+            fingerprint.update(f"{file_path.relative_to(root)}\0{file_stat.st_size}\0{file_stat.st_mtime_ns}\n".encode())
+    return fingerprint.hexdigest()
+
+# Returns the sha256 of a file's contents
+def HashFile(file_path : Path) -> str:
+    file_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+# Append-only record of the build steps completed by a run, kept in the build output folder.
+#   Each line is a JSON object. A 'run' entry starts a run and records the hash of the options which affect its output; 'step' entries record a completed
+#   (plug-in, stage) with the hash of its inputs and the size and sha256 of every file it produced. Entries are flushed and synced as they are written, so the
+#   journal survives the build being killed at any point.
+#
+#   When a run is resumed, a step is skipped only if the journal holds an entry for it from the resumed run with the same inputs hash, and every artifact
+#   it recorded still exists with the same size and contents.
+class BuildJournal:
+    FILE_NAME = "BuildJournal.jsonl"
+
+    def __init__(self, journal_path : Path) -> None:
+        self.journal_path = journal_path
+        self.run_id = ""
+        self.run_entry : dict = dict()
+        self.completed_steps : dict[str, dict] = dict() # {step key: step entry} for the current run
+        self.lock = threading.Lock()
+
+    # Returns every entry in the journal, ignoring a partially written last line
+    def Load(self) -> list[dict]:
+        if not self.journal_path.exists():
+            return list()
+
+        entries = list()
+        for line in self.journal_path.read_text().splitlines():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+        return entries
+
+    def Append(self, entry : dict) -> None:
+        with self.lock:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_path, "a") as journal_file:
+                journal_file.write(json.dumps(entry, sort_keys=True) + "\n")
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    # Starts a new run, or with 'resume' set, continues the most recent run in the journal if it was started with the same options.
+    #   'run_data' holds values, such as the test build output folder, which a resumed run must reuse. It is stored with a new run; a resumed run returns the stored copy.
+    # Returns the run data in effect.
+    def BeginRun(self, options_hash : str, run_data : dict, resume : bool, printer : Printer) -> dict:
+        if resume:
+            entries = self.Load()
+            run_entries = [entry for entry in entries if entry.get("type") == JournalEntryID.RUN]
+
+            if len(run_entries) == 0:
+                printer.WarningMessage(f"No previous run found in {self.journal_path}. Starting a new run.")
+            elif run_entries[-1]["options_hash"] != options_hash:
+                printer.WarningMessage(f"The last run in {self.journal_path} used different build options. Starting a new run.")
+            else:
+                self.run_entry = run_entries[-1]
+                self.run_id = self.run_entry["run_id"]
+                self.completed_steps = {entry["key"] : entry for entry in entries if entry.get("type") == JournalEntryID.STEP and entry.get("run_id") == self.run_id}
+                self.Append({"type" : JournalEntryID.RESUME, "run_id" : self.run_id, "time" : time.time()})
+
+                printer.MessageWithContext("Resuming run: ", f"{self.run_id} ({len(self.completed_steps)} completed step(s) recorded)", "\n")
+                return self.run_entry["run_data"]
+
+        self.run_id = f"{time.strftime('%Y-%m-%d_%H-%M-%S')}_{os.getpid()}"
+        self.run_entry = {"type" : JournalEntryID.RUN, "run_id" : self.run_id, "options_hash" : options_hash, "run_data" : run_data, "time" : time.time()}
+        self.completed_steps = dict()
+        self.Append(self.run_entry)
+        return run_data
+
+    # Returns True if the step was completed by this run with the same inputs and its artifacts are intact.
+    # 'printer' receives the reason a recorded step has to be run again.
+    def IsStepComplete(self, key : str, inputs_hash : str, printer : Printer = None) -> bool:
+        entry = self.completed_steps.get(key)
+        if entry is None:
+            return False
+
+        if entry["inputs_hash"] != inputs_hash:
+            if printer is not None:
+                printer.MessageWithContext(f"Inputs changed since {key} completed; ", "running it again.", printer.Indent(1))
+            return False
+
+        for artifact_path_string, (size, content_hash) in entry["artifacts"].items():
+            artifact_path = Path(artifact_path_string)
+            if not artifact_path.is_file() or artifact_path.stat().st_size != size or HashFile(artifact_path) != content_hash:
+                if printer is not None:
+                    printer.MessageWithContext(f"Artifact of {key} is missing or modified; ", f"running it again. ({artifact_path})", printer.Indent(1))
+                return False
+
+        return True
+
+    # Records a completed step with the hash of its inputs and the files it produced. Folders in 'artifact_paths' are recorded file by file.
+    def RecordStep(self, key : str, inputs_hash : str, artifact_paths : list[Path]) -> None:
+        artifacts = dict()
+        for artifact_path in artifact_paths:
+            file_paths = [artifact_path] if artifact_path.is_file() else sorted(path for path in artifact_path.rglob('*') if path.is_file() and not path.is_symlink())
+            for file_path in file_paths:
+                artifacts[f"{file_path.resolve()}"] = [file_path.stat().st_size, HashFile(file_path)]
+
+        entry = {"type" : JournalEntryID.STEP, "run_id" : self.run_id, "key" : key, "inputs_hash" : inputs_hash, "artifacts" : artifacts, "time" : time.time()}
+        self.Append(entry)
+        with self.lock:
+            self.completed_steps[key] = entry
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import os, shutil, threading
+
+from pathlib import Path
+from collections.abc import Callable
+
+from scripts.python.upi_build_journal import HashFile
+from scripts.python.upi_utility import Printer
+
+# How many outputs of one kind to keep, and how much space they may take. None leaves that limit off.
+class RetentionPolicy:
+    def __init__(self, keep_count : int = None, max_size_bytes : int = None) -> None:
+        self.keep_count = keep_count
+        self.max_size_bytes = max_size_bytes
+
+    def IsSet(self) -> bool:
+        return self.keep_count is not None or self.max_size_bytes is not None
+
+# Returns the size, in bytes, of the files at or under 'path', leaving out files whose inode is already in 'counted_inodes', which is updated.
+#   Hard linked files are shared between outputs, so they are counted once, against the newest output which holds them.
+def GetUncountedSize(path : Path, counted_inodes : set[tuple[int, int]]) -> int:
+    file_paths = [path] if path.is_file() else [Path(folder_path, file_name) for folder_path, _, file_names in os.walk(path) for file_name in file_names]
+
+    size = 0
+    for file_path in file_paths:
+        if file_path.is_symlink():
+            continue
+        file_stat = file_path.stat()
+        inode = (file_stat.st_dev, file_stat.st_ino)
+        if inode not in counted_inodes:
+            counted_inodes.add(inode)
+            size += file_stat.st_size
+    return size
+
+# Replaces each file in 'current_path' which has an identical file at the same relative path in 'previous_path' with a hard link to that file.
+#   Consecutive test builds of the same plug-ins are mostly identical, so this removes most of the space taken by each new build.
+#   Linked files share their contents; they must not be modified in place.
+# Returns (number of files linked, bytes saved)
+def DeduplicateTree(current_path : Path, previous_path : Path) -> tuple[int, int]:
+    linked_count = 0
+    saved_bytes = 0
+
+    for folder_path, _, file_names in os.walk(current_path):
+        for file_name in file_names:
+            current_file_path = Path(folder_path, file_name)
+            previous_file_path = previous_path.joinpath(current_file_path.relative_to(current_path))
+            if current_file_path.is_symlink() or previous_file_path.is_symlink() or not previous_file_path.is_file():
+                continue
+
+            current_stat, previous_stat = current_file_path.stat(), previous_file_path.stat()
+            if current_stat.st_size != previous_stat.st_size or current_stat.st_size == 0 or (current_stat.st_dev, current_stat.st_ino) == (previous_stat.st_dev, previous_stat.st_ino):
+                continue
+            if HashFile(current_file_path) != HashFile(previous_file_path):
+                continue
+
+            # Link beside the file, then replace it, so the file is never missing
+            link_path = current_file_path.with_name(f".{file_name}.link")
+            try:
+                os.link(previous_file_path, link_path)
+                shutil.copymode(current_file_path, link_path)
+                os.replace(link_path, current_file_path)
+            except OSError:
+                link_path.unlink(missing_ok=True)
+                continue
+
+            linked_count += 1
+            saved_bytes += current_stat.st_size
+
+    return linked_count, saved_bytes
+
+# Applies a retention policy to the outputs matching 'pattern' in 'root' (e.g. TestBuild_* folders, or .tgz packages) so that earlier runs don't fill the disk.
+#   Outputs are ranked newest first by modification time. 'keep_count' outputs are kept in each group returned by 'get_group' (e.g. each package name),
+#   and the oldest outputs are evicted until the rest fit in 'max_size_bytes'. Outputs of the current run are passed as protected and never evicted.
+#
+#   Evicted outputs are renamed into a hidden folder at once, then deleted on a background thread so that the build does not wait for large folders to be removed.
+#   Call Wait before exiting. Folders left behind by an interrupted deletion are removed by the next Enforce.
+class OutputRetention:
+    TRASH_PREFIX = ".deleting-"
+
+    def __init__(self, root : Path, pattern : str, policy : RetentionPolicy, get_group : Callable[[Path], str] = lambda path: "") -> None:
+        self.root = root
+        self.pattern = pattern
+        self.policy = policy
+        self.get_group = get_group
+
+        self.delete_threads : list[threading.Thread] = list()
+        self.evicted_count = 0
+        self.evicted_bytes = 0
+
+    # Returns the outputs in 'root' matching the pattern, newest first
+    def ListOutputs(self) -> list[Path]:
+        if not self.root.is_dir():
+            return list()
+        output_paths = [path for path in self.root.glob(self.pattern) if not path.name.startswith(OutputRetention.TRASH_PREFIX)]
+        return sorted(output_paths, key=lambda path: (path.stat().st_mtime, path.name), reverse=True)
+
+    # Evicts the outputs which the policy does not keep.
+    # Returns the evicted outputs.
+    def Enforce(self, protected_paths : list[Path], printer : Printer) -> list[Path]:
+        for trash_path in self.root.glob(f"{OutputRetention.TRASH_PREFIX}*") if self.root.is_dir() else list():
+            self.DeleteAsync(trash_path)
+
+        protected_paths = [path.resolve() for path in protected_paths if path is not None]
+        counted_inodes = set()
+        group_counts : dict[str, int] = dict()
+        total_size = 0
+
+        evicted_paths = list()
+        for output_path in self.ListOutputs():
+            output_size = GetUncountedSize(output_path, counted_inodes)
+            group = self.get_group(output_path)
+            group_counts[group] = group_counts.get(group, 0) + 1
+
+            protected = output_path.resolve() in protected_paths
+            over_count = self.policy.keep_count is not None and group_counts[group] > self.policy.keep_count
+            over_size = self.policy.max_size_bytes is not None and total_size + output_size > self.policy.max_size_bytes
+
+            if not protected and (over_count or over_size):
+                reason = f"more than {self.policy.keep_count} kept" if over_count else f"over {self.policy.max_size_bytes / (1024 ** 3):.1f} GiB budget"
+                printer.MessageWithContext("Evicting: ", f"{output_path} ({output_size / (1024 * 1024):.1f} MiB, {reason})", printer.Indent(1))
+
+                trash_path = output_path.with_name(f"{OutputRetention.TRASH_PREFIX}{output_path.name}")
+                output_path.rename(trash_path)
+                self.DeleteAsync(trash_path)
+
+                evicted_paths.append(output_path)
+                self.evicted_count += 1
+                self.evicted_bytes += output_size
+            else:
+                total_size += output_size
+
+        printer.MessageWithContext("Kept: ", f"{len(self.ListOutputs())} matching '{self.pattern}' in {self.root} ({total_size / (1024 * 1024):.1f} MiB)", printer.Indent(1))
+        return evicted_paths
+
+    def DeleteAsync(self, path : Path) -> None:
+        delete_thread = threading.Thread(target=lambda: shutil.rmtree(path, ignore_errors=True) if path.is_dir() else path.unlink(missing_ok=True), name=f"Delete {path.name}")
+        delete_thread.start()
+        self.delete_threads.append(delete_thread)
+
+    # Waits for background deletions to finish
+    def Wait(self) -> None:
+        for delete_thread in self.delete_threads:
+            delete_thread.join()
+        self.delete_threads.clear()
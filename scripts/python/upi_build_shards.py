@@ -0,0 +1,281 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import hashlib, json, os, shutil
+
+from pathlib import Path
+
+from scripts.python.upi_build_history import BuildHistory, BuildStepID
+from scripts.python.upi_build_journal import HashFile
+from scripts.python.upi_utility import Printer
+
+# A single native library build: one xcodebuild invocation for a plug-in, a platform (or batched platform group) and a config
+class ShardJob:
+    def __init__(self, plugin_id : str, platform : str, config : str, platforms : list[str]) -> None:
+        self.plugin_id = plugin_id
+        self.platform = platform
+        self.config = config
+
+        # Platforms whose NativeLibraries~/<Config>/<Platform> folders the build writes; more than one for a batched xcodebuild invocation
+        self.platforms = platforms
+
+    def Key(self) -> str:
+        return f"{self.plugin_id}/{self.platform}/{self.config}"
+
+# Parses a shard specification of the form 'i/N', where 1 <= i <= N.
+# Returns (i, N); raises ValueError if the specification is malformed.
+def ParseShardSpec(shard_spec : str) -> tuple[int, int]:
+    index_string, _, count_string = shard_spec.partition('/')
+    shard_index, shard_count = int(index_string), int(count_string)
+    if shard_count < 1 or shard_index < 1 or shard_index > shard_count:
+        raise ValueError(f"Shard index must be between 1 and the shard count: {shard_spec}")
+    return shard_index, shard_count
+
+# Returns the expected duration, in seconds, of each job from a weights file written by --merge, or no weights when 'weights_path' is None, so that every job weighs the same.
+#   The local build history is not used: it differs between machines, and every shard must arrive at the same plan. Jobs without a recorded duration are left out
+#   and weighted by PartitionJobs.
+def GetJobWeights(jobs : list[ShardJob], weights_path : Path = None) -> dict[str, float]:
+    if weights_path is None:
+        return dict()
+
+    recorded_weights = json.loads(weights_path.read_text())
+    return {job.Key() : float(recorded_weights[job.Key()]) for job in jobs if job.Key() in recorded_weights}
+
+# Assigns each job to one of 'shard_count' shards so that the expected durations of the shards are as even as possible.
+#   Jobs are placed longest first on the least loaded shard (ties go to the lower shard index), and jobs of equal weight are taken in key order,
+#   so every node which computes a plan from the same jobs and weights arrives at the same plan. Jobs without a weight count as the mean of the known weights.
+# Returns {job key: shard index}, with shard indices starting at 1.
+def PartitionJobs(jobs : list[ShardJob], shard_count : int, weights : dict[str, float]) -> dict[str, int]:
+    known_weights = [weights[job.Key()] for job in jobs if job.Key() in weights]
+    default_weight = sum(known_weights) / len(known_weights) if len(known_weights) > 0 else 1.0
+
+    shard_loads = [0.0] * shard_count
+    assignments = dict()
+    for job in sorted(jobs, key=lambda job: (-weights.get(job.Key(), default_weight), job.Key())):
+        shard_position = min(range(shard_count), key=lambda position: (shard_loads[position], position))
+        shard_loads[shard_position] += weights.get(job.Key(), default_weight)
+        assignments[job.Key()] = shard_position + 1
+    return assignments
+
+# Returns a description of every regular file and symbolic link under 'root', keyed by path relative to 'root'.
+def DescribeFiles(root : Path) -> dict[str, dict]:
+    files = dict()
+    for file_path in sorted(root.rglob('*')):
+        if file_path.is_symlink():
+            files[f"{file_path.relative_to(root)}"] = {"link" : os.readlink(file_path)}
+        elif file_path.is_file():
+            files[f"{file_path.relative_to(root)}"] = {"size" : file_path.stat().st_size, "sha256" : HashFile(file_path)}
+    return files
+
+def CopyFolder(source_path : Path, destination_path : Path) -> None:
+    if destination_path.is_dir() and not destination_path.is_symlink():
+        shutil.rmtree(destination_path)
+    elif destination_path.exists() or destination_path.is_symlink():
+        destination_path.unlink()
+
+    destination_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copytree(source_path, destination_path, symlinks=True)
+
+# One shard of a build spread across several machines (--shard i/N).
+#   Every shard computes the same plan from the full native build job list and builds only its own jobs. Export then copies the NativeLibraries~
+#   folders those jobs wrote, with a manifest of their files, into the output folder, ready to be collected and combined with ShardMerge.
+class BuildShard:
+    MANIFEST_FILE_NAME = "ShardManifest.json"
+
+    def __init__(self, shard_index : int, shard_count : int, jobs : list[ShardJob], weights : dict[str, float]) -> None:
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.jobs = jobs
+        self.weights = weights
+
+        self.assignments = PartitionJobs(jobs, shard_count, weights)
+        self.plan_hash = hashlib.sha256(json.dumps(self.assignments, sort_keys=True).encode()).hexdigest()[:12]
+
+    def GetShardJobs(self, shard_index : int = 0) -> list[ShardJob]:
+        shard_index = shard_index if shard_index > 0 else self.shard_index
+        return [job for job in self.jobs if self.assignments[job.Key()] == shard_index]
+
+    def HasJobs(self, plugin_id : str) -> bool:
+        return any(job.plugin_id == plugin_id for job in self.GetShardJobs())
+
+    # Returns True if one of this shard's jobs writes the NativeLibraries~ folder for 'platform' and 'config'
+    def IncludesOutput(self, plugin_id : str, platform : str, config : str) -> bool:
+        return any(job.plugin_id == plugin_id and job.config == config and platform in job.platforms for job in self.GetShardJobs())
+
+    # Removes the commands for jobs assigned to other shards from a command table returned by GenerateXcodeBuildCommands
+    def FilterBuildCommands(self, plugin_id : str, build_commands : dict[str, dict[str, list[str]]]) -> dict[str, dict[str, list[str]]]:
+        filtered_commands = dict()
+        for platform, command_set in build_commands.items():
+            for config, command in command_set.items():
+                if self.assignments.get(f"{plugin_id}/{platform}/{config}") == self.shard_index:
+                    filtered_commands.setdefault(platform, dict())[config] = command
+        return filtered_commands
+
+    def PrintPlan(self, printer : Printer) -> None:
+        printer.MessageWithContext("Shard: ", f"{self.shard_index} of {self.shard_count} (plan {self.plan_hash})", "\n")
+        printer.MessageWithContext("Jobs weighted by recorded duration: ", f"{len([job for job in self.jobs if job.Key() in self.weights])} of {len(self.jobs)}", printer.Indent(1))
+
+        for shard_index in range(1, self.shard_count + 1):
+            shard_jobs = self.GetShardJobs(shard_index)
+            expected_seconds = sum(self.weights.get(job.Key(), 0.0) for job in shard_jobs)
+            printer.MessageWithContext(f"Shard {shard_index}: ", f"{len(shard_jobs)} job(s), {expected_seconds:.0f}s recorded", printer.Indent(1))
+
+        for job in self.GetShardJobs():
+            printer.MessageWithContext("Assigned: ", job.Key(), printer.Indent(2))
+
+    # Copies the output of this shard's jobs to '<output_path>/Shard_<i>of<N>' and writes the shard manifest.
+    #   'native_library_paths' maps each processed plug-in id to its NativeLibraries~ folder; paths are recorded relative to 'plugin_root' so the merge can run from another checkout.
+    # Returns the folder written.
+    def Export(self, output_path : Path, plugin_root : Path, native_library_paths : dict[str, Path], history : BuildHistory, printer : Printer) -> Path:
+        shard_path = output_path.joinpath(f"Shard_{self.shard_index}of{self.shard_count}")
+        if shard_path.exists():
+            shutil.rmtree(shard_path)
+        shard_path.mkdir(parents=True)
+
+        printer.StatusMessageWithContext("Exporting shard outputs to: ", f"{shard_path}", "\n")
+
+        # Jobs skipped by a resumed run have no duration; their outputs were verified by the build journal
+        durations = {f"{record.plugin_id}/{record.platform}/{record.config}" : record.duration for record in history.run_records if record.step == BuildStepID.NATIVE_BUILD and record.succeeded}
+        failed_job_keys = {f"{record.plugin_id}/{record.platform}/{record.config}" for record in history.run_records if record.step == BuildStepID.NATIVE_BUILD and not record.succeeded}
+
+        job_entries = dict()
+        for job in self.GetShardJobs():
+            native_library_path = native_library_paths.get(job.plugin_id)
+            output_paths = [native_library_path.joinpath(job.config, platform) for platform in job.platforms] if native_library_path is not None else list()
+            complete = len(output_paths) > 0 and all(output_path.is_dir() for output_path in output_paths) and job.Key() not in failed_job_keys
+
+            if complete:
+                for platform in job.platforms:
+                    CopyFolder(native_library_path.joinpath(job.config, platform), shard_path.joinpath(job.plugin_id, job.config, platform))
+            else:
+                printer.WarningMessage(f"Shard job {job.Key()} did not complete; its output is left out of the shard.")
+
+            job_entries[job.Key()] = {
+                "plugin_id" : job.plugin_id,
+                "platform" : job.platform,
+                "config" : job.config,
+                "platforms" : job.platforms,
+                "native_library_path" : f"{native_library_path.relative_to(plugin_root)}" if native_library_path is not None else "",
+                "duration" : durations.get(job.Key()),
+                "complete" : complete
+            }
+
+        manifest = {
+            "shard_index" : self.shard_index,
+            "shard_count" : self.shard_count,
+            "plan_hash" : self.plan_hash,
+            "plan" : self.assignments,
+            "jobs" : job_entries,
+            "files" : DescribeFiles(shard_path)
+        }
+        shard_path.joinpath(BuildShard.MANIFEST_FILE_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+
+        printer.MessageWithContext("Completed jobs: ", f"{len([entry for entry in job_entries.values() if entry['complete']])} of {len(job_entries)}", printer.Indent(1))
+        return shard_path
+
+# Combines the folders exported by every shard of a build (--merge) into the plug-ins' NativeLibraries~ folders.
+#   Validate refuses to merge unless every shard of one plan is present, every expected job completed in the shard it was assigned to,
+#   every exported file matches its manifest, and no two shards disagree about the contents of the same output folder.
+class ShardMerge:
+    WEIGHTS_FILE_NAME = "ShardWeights.json"
+
+    def __init__(self, shard_paths : list[Path]) -> None:
+        self.shard_paths = shard_paths
+        self.manifests : list[dict] = list()
+
+        # {(plug-in id, config, platform): (shard folder, NativeLibraries~ path relative to the plug-in root)} for each output folder to copy
+        self.outputs : dict[tuple[str, str, str], tuple[Path, str]] = dict()
+
+    # Reads the manifest in each shard folder
+    # Returns False, after reporting the problem, if any is missing or unreadable
+    def Load(self, printer : Printer) -> bool:
+        self.manifests.clear()
+        for shard_path in self.shard_paths:
+            manifest_path = shard_path.joinpath(BuildShard.MANIFEST_FILE_NAME)
+            try:
+                self.manifests.append(json.loads(manifest_path.read_text()))
+            except (OSError, json.JSONDecodeError) as error:
+                printer.ErrorMessage(f"Cannot read shard manifest at path: {manifest_path} ({error})")
+                return False
+            printer.MessageWithContext("Loaded shard manifest: ", f"{manifest_path}", printer.Indent(1))
+        return len(self.manifests) > 0
+
+    # Checks the loaded shards for completeness and conflicts against the jobs this run would build.
+    # Returns True if the shards can be merged; every problem found is reported.
+    def Validate(self, expected_jobs : list[ShardJob], printer : Printer) -> bool:
+        valid = True
+
+        plan_hashes = sorted({manifest["plan_hash"] for manifest in self.manifests})
+        shard_counts = sorted({manifest["shard_count"] for manifest in self.manifests})
+        if len(plan_hashes) > 1 or len(shard_counts) > 1:
+            printer.ErrorMessage(f"Shards were built from different plans ({', '.join(plan_hashes)}). Give every shard the same options, and the same --shard-weights file.")
+            return False
+
+        shard_count = shard_counts[0]
+        plan = self.manifests[0]["plan"]
+        shard_indices = sorted(manifest["shard_index"] for manifest in self.manifests)
+        if shard_indices != list(range(1, shard_count + 1)):
+            missing_indices = [f"{shard_index}" for shard_index in range(1, shard_count + 1) if shard_index not in shard_indices]
+            duplicate_indices = sorted({f"{shard_index}" for shard_index in shard_indices if shard_indices.count(shard_index) > 1})
+            printer.ErrorMessage(f"Expected shards 1 to {shard_count}." + (f" Missing: {', '.join(missing_indices)}." if len(missing_indices) > 0 else "") + (f" Repeated: {', '.join(duplicate_indices)}." if len(duplicate_indices) > 0 else ""))
+            valid = False
+
+        # Every job this run would build must be in the plan and completed by its shard
+        manifest_jobs = {job_key : (shard_path, manifest["jobs"][job_key]) for shard_path, manifest in zip(self.shard_paths, self.manifests) for job_key in manifest["jobs"]}
+        for job in expected_jobs:
+            if job.Key() not in plan:
+                printer.ErrorMessage(f"Native library build {job.Key()} is not part of the shard plan. Were the shards built with the same plug-ins, platforms and configs?")
+                valid = False
+            elif job.Key() not in manifest_jobs or not manifest_jobs[job.Key()][1]["complete"]:
+                printer.ErrorMessage(f"Native library build {job.Key()} was not completed by shard {plan[job.Key()]}.")
+                valid = False
+
+        expected_keys = [job.Key() for job in expected_jobs]
+        for job_key in sorted(job_key for job_key in plan if job_key not in expected_keys):
+            printer.WarningMessage(f"Shard plan includes {job_key}, which this run does not build. Its output will be merged anyway.")
+
+        # Each file must match its manifest, and an output folder exported by more than one shard must be identical in each
+        self.outputs.clear()
+        output_files : dict[tuple[str, str, str], dict] = dict()
+        for shard_path, manifest in zip(self.shard_paths, self.manifests):
+            for relative_path, description in manifest["files"].items():
+                file_path = shard_path.joinpath(relative_path)
+                if "link" in description:
+                    intact = file_path.is_symlink() and os.readlink(file_path) == description["link"]
+                else:
+                    intact = file_path.is_file() and file_path.stat().st_size == description["size"] and HashFile(file_path) == description["sha256"]
+                if not intact:
+                    printer.ErrorMessage(f"Shard file is missing or modified: {file_path}")
+                    valid = False
+
+            for job_entry in manifest["jobs"].values():
+                if not job_entry["complete"]:
+                    continue
+
+                for platform in job_entry["platforms"]:
+                    output_key = (job_entry["plugin_id"], job_entry["config"], platform)
+                    prefix = f"{Path(*output_key)}{os.sep}"
+                    files = {relative_path : description for relative_path, description in manifest["files"].items() if relative_path.startswith(prefix)}
+
+                    if output_key in self.outputs and output_files[output_key] != files:
+                        printer.ErrorMessage(f"Shards {self.outputs[output_key][0].name} and {shard_path.name} produced different {'/'.join(output_key)} native libraries.")
+                        valid = False
+                    elif output_key not in self.outputs:
+                        self.outputs[output_key] = (shard_path, job_entry["native_library_path"])
+                        output_files[output_key] = files
+
+        return valid
+
+    # Replaces each merged output folder in the plug-ins' NativeLibraries~ folders with the copy from its shard
+    def Apply(self, plugin_root : Path, printer : Printer) -> None:
+        for (plugin_id, config, platform), (shard_path, native_library_path) in sorted(self.outputs.items()):
+            destination_path = plugin_root.joinpath(native_library_path, config, platform)
+            printer.MessageWithContext("Merging native libraries: ", f"{shard_path.name}/{plugin_id}/{config}/{platform} -> {destination_path}", printer.Indent(1))
+            CopyFolder(shard_path.joinpath(plugin_id, config, platform), destination_path)
+
+    # Writes the duration each shard recorded for its jobs, for use with --shard-weights, so that later shard plans are weighted alike on every machine.
+    def WriteWeights(self, weights_path : Path, printer : Printer) -> None:
+        weights = {job_key : job_entry["duration"] for manifest in self.manifests for job_key, job_entry in manifest["jobs"].items() if job_entry["duration"] is not None}
+        weights_path.parent.mkdir(parents=True, exist_ok=True)
+        weights_path.write_text(json.dumps(weights, indent=2, sort_keys=True))
+        printer.MessageWithContext("Shard weights written to: ", f"{weights_path}", "\n")
@@ -0,0 +1,79 @@
+#! /usr/bin/env python3
+# Requirements: python3, git
+
+import scripts.python.upi_utility as utility
+
+from pathlib import Path
+
+# Repository paths, other than the plug-ins themselves, whose changes can affect the output of every plug-in. A change under any of them selects all plug-ins.
+GLOBAL_INPUT_PATHS = ["build.py", "scripts/"]
+
+# Folders written by builds of a plug-in which may not be covered by a .gitignore. Untracked files under them are not counted as changes.
+BUILD_OUTPUT_FOLDER_NAMES = ["NativeLibraries~", "Library", "Temp", "Logs", "obj", "UserSettings", "TestPlayers", "build", "DerivedData", "xcuserdata"]
+
+# Returns the repository paths which differ between the merge base of 'ref' and HEAD and the working tree, including untracked files, or None if git fails.
+#   Diffing from the merge base leaves out changes made on 'ref' after the current branch was created.
+def GetChangedPaths(repository_root : Path, ref : str) -> list[str]:
+    merge_base_output = utility.RunCommand(["git", "merge-base", ref, "HEAD"], cwd=repository_root)
+    if merge_base_output.returncode != 0:
+        return None
+
+    diff_output = utility.RunCommand(["git", "diff", "--name-only", "--no-renames", merge_base_output.stdout.strip()], cwd=repository_root)
+    untracked_output = utility.RunCommand(["git", "ls-files", "--others", "--exclude-standard"], cwd=repository_root)
+    if diff_output.returncode != 0 or untracked_output.returncode != 0:
+        return None
+
+    untracked_paths = [path for path in untracked_output.stdout.splitlines() if not any(part in BUILD_OUTPUT_FOLDER_NAMES for part in path.split('/'))]
+    return sorted({path for path in diff_output.stdout.splitlines() + untracked_paths if len(path) > 0})
+
+def IsGlobalInputPath(changed_path : str) -> bool:
+    return any(changed_path == global_path or (global_path.endswith('/') and changed_path.startswith(global_path)) for global_path in GLOBAL_INPUT_PATHS)
+
+# Returns the ids of the plug-ins in 'plugin_ids' with a changed path under 'plugin_root_name/Apple.<id>/'. A change to a global input path selects every plug-in.
+def GetChangedPluginIDs(changed_paths : list[str], plugin_ids : list[str], plugin_root_name : str = "plug-ins") -> list[str]:
+    changed_plugin_ids = set()
+    for changed_path in changed_paths:
+        if IsGlobalInputPath(changed_path):
+            return list(plugin_ids)
+
+        path_parts = changed_path.split('/')
+        if len(path_parts) > 2 and path_parts[0] == plugin_root_name and path_parts[1].startswith("Apple.") and path_parts[1][len("Apple."):] in plugin_ids:
+            changed_plugin_ids.add(path_parts[1][len("Apple."):])
+
+    return [plugin_id for plugin_id in plugin_ids if plugin_id in changed_plugin_ids]
+
+# Returns 'plugin_ids' together with every plug-in which depends on one of them, directly or through other plug-ins, in dependency order.
+#   'dependencies' maps each plug-in id to the ids of the plug-ins its package depends on. (See: GetPluginPackageDependencies)
+def GetReverseDependencyClosure(plugin_ids : list[str], dependencies : dict[str, list[str]]) -> list[str]:
+    selected = set(plugin_ids)
+    pending = list(plugin_ids)
+    while len(pending) > 0:
+        plugin_id = pending.pop()
+        for dependent_id, dependent_dependencies in dependencies.items():
+            if plugin_id in dependent_dependencies and dependent_id not in selected:
+                selected.add(dependent_id)
+                pending.append(dependent_id)
+
+    ordered = list()
+    def Visit(plugin_id : str) -> None:
+        if plugin_id in ordered:
+            return
+        for dependency_id in dependencies.get(plugin_id, list()):
+            if dependency_id in selected:
+                Visit(dependency_id)
+        ordered.append(plugin_id)
+
+    for plugin_id in sorted(selected):
+        Visit(plugin_id)
+    return ordered
+
+# Returns the plug-ins which 'plugin_ids' depend on, directly or through other plug-ins, leaving out 'plugin_ids' themselves unless they depend on one another.
+def GetDependencyClosure(plugin_ids : list[str], dependencies : dict[str, list[str]]) -> list[str]:
+    found = set()
+    pending = list(plugin_ids)
+    while len(pending) > 0:
+        for dependency_id in dependencies.get(pending.pop(), list()):
+            if dependency_id not in found:
+                found.add(dependency_id)
+                pending.append(dependency_id)
+    return sorted(found)
@@ -42,6 +42,29 @@ class ConfigID:
     # Builds both Debug and Release libraries.
     ALL = "all"
 
+# Build settings profiles (--profile)
+#   Each profile injects a set of xcodebuild build settings and a derived data layout into every generated xcodebuild command. (See: BUILD_PROFILE_TABLE in upi_build_context.py)
+class BuildProfileID:
+    # No additional build settings; matches the xcodebuild invocations of earlier script versions.
+    DEFAULT = "default"
+
+    # Fastest clean CI builds: per plug-in derived data, shared clang module cache, no index store and no dSYM generation.
+    CI_FAST = "ci-fast"
+
+    # Local iteration: as ci-fast, but also builds only the host architecture for macOS.
+    DEV_LOCAL = "dev-local"
+
+    # Distributable builds: per plug-in derived data with dSYMs for every architecture.
+    RELEASE = "release"
+
+# Command types (--timeout, --inactivity-timeout)
+#   External commands are grouped by type so that each type can have its own time limits. (See: BuildContext.command_limits)
+class CommandTypeID:
+    XCODEBUILD = "xcodebuild"
+    UNITY = "unity"
+    CODESIGN = "codesign"
+    PACK = "pack"
+
 # Build Actions (-b, --build-action)
 class BuildActionID:
     # Builds each selected plug-in's native frameworks and moves them to associated Unity plug-in project folder hierarchy
@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+# Requirements: python3, ccache (or a compatible compiler cache launcher)
+
+import shutil
+
+import scripts.python.upi_utility as utility
+
+from pathlib import Path
+
+from scripts.python.upi_utility import Printer
+
+# Hit and miss counts reported by the compiler cache launcher
+class CompilerCacheStatistics:
+    def __init__(self, hits : int = 0, misses : int = 0, uncacheable : int = 0, cache_size_bytes : int = 0) -> None:
+        self.hits = hits
+        self.misses = misses
+        self.uncacheable = uncacheable
+        self.cache_size_bytes = cache_size_bytes
+
+    # Returns the change in hit and miss counts since 'earlier'; cache size is taken from this snapshot.
+    def Since(self, earlier : 'CompilerCacheStatistics') -> 'CompilerCacheStatistics':
+        return CompilerCacheStatistics(self.hits - earlier.hits, self.misses - earlier.misses, self.uncacheable - earlier.uncacheable, self.cache_size_bytes)
+
+    def HitRate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+# Routes C, C++ and Objective-C compilation in xcodebuild through a compiler cache launcher such as ccache.
+#   Xcode runs the compiler named by the CC and CXX build settings, so the cache installs small wrapper scripts which exec '<launcher> <compiler> "$@"'
+#   with the cache configuration exported. Linking is left to the real compiler via LD and LDPLUSPLUS.
+#   Swift compilation is not affected; swiftc has no equivalent launcher hook.
+#
+#   Both the launcher and the compiler can be replaced, which allows the integration to be exercised on Linux with the stand-in compiler in scripts/stand-ins.
+class CompilerCache:
+    # ccache's --print-stats keys which count towards each statistic
+    HIT_STATISTICS = ["direct_cache_hit", "preprocessed_cache_hit"]
+    MISS_STATISTICS = ["cache_miss"]
+    UNCACHEABLE_STATISTICS = ["called_for_link", "called_for_preprocessing", "compile_failed", "unsupported_compiler_option", "unsupported_source_language", "no_input_file"]
+
+    def __init__(self, cache_path : Path, max_size : str = "5G", launcher : str = "ccache", compiler : str = "") -> None:
+        self.cache_path = cache_path
+        self.max_size = max_size
+        self.launcher = launcher
+
+        # Resolved with 'xcrun -f' when not provided. The C++ compiler is assumed to sit alongside the C compiler with a '++' suffix, as clang and clang++ do.
+        self.compiler = compiler
+        self.cxx_compiler = f"{compiler}++" if len(compiler) > 0 else ""
+
+        self.wrapper_path = cache_path.joinpath("bin")
+        self.initial_statistics : CompilerCacheStatistics = None
+
+    # Resolves the launcher and compilers, writes the wrapper scripts and snapshots the current statistics.
+    # Returns False, after reporting the problem, if the cache cannot be used.
+    def Configure(self, printer : Printer) -> bool:
+        launcher_path = shutil.which(self.launcher)
+        if launcher_path is None:
+            printer.WarningMessage(f"Compiler cache launcher '{self.launcher}' not found. Native libraries will be built without a compiler cache.")
+            printer.InfoMessage(f"Install ccache (e.g. {Printer.Bold('brew install ccache')}) or pass a launcher path with {Printer.Bold('--compiler-cache-launcher')}.")
+            return False
+        self.launcher = launcher_path
+
+        if len(self.compiler) == 0:
+            self.compiler = utility.RunCommand(["xcrun", "-f", "clang"]).stdout.strip()
+            self.cxx_compiler = utility.RunCommand(["xcrun", "-f", "clang++"]).stdout.strip()
+
+        if not Path(self.compiler).is_file() or not Path(self.cxx_compiler).is_file():
+            printer.WarningMessage(f"Could not locate compilers '{self.compiler}' and '{self.cxx_compiler}'. Native libraries will be built without a compiler cache.")
+            return False
+
+        self.wrapper_path.mkdir(parents=True, exist_ok=True)
+        self.WriteWrapper(self.wrapper_path.joinpath("cc"), self.compiler)
+        self.WriteWrapper(self.wrapper_path.joinpath("c++"), self.cxx_compiler)
+
+        self.initial_statistics = self.GetStatistics()
+
+        printer.MessageWithContext("Compiler cache launcher: ", self.launcher, printer.Indent(1))
+        printer.MessageWithContext("Compiler cache path: ", f"{self.cache_path} (max size {self.max_size})", printer.Indent(1))
+        printer.MessageWithContext("Cached compilers: ", f"{self.compiler}, {self.cxx_compiler}", printer.Indent(1))
+        return True
+
+    def WriteWrapper(self, wrapper_path : Path, compiler : str) -> None:
+        wrapper_path.write_text("#!/bin/sh\n"
+                                "# Generated by build.py; routes compilation through the compiler cache.\n"
+                                f"{self.GetEnvironmentExports()}"
+                                f"exec \"{self.launcher}\" \"{compiler}\" \"$@\"\n")
+        wrapper_path.chmod(0o755)
+
+    def GetEnvironment(self) -> dict[str, str]:
+        return {
+            "CCACHE_DIR" : f"{self.cache_path.joinpath('store')}",
+            "CCACHE_MAXSIZE" : self.max_size,
+            # Clang modules, precompiled headers and index store paths vary between otherwise identical Xcode builds
+            "CCACHE_SLOPPINESS" : "clang_index_store,file_stat_matches,include_file_ctime,include_file_mtime,ivfsoverlay,modules,pch_defines,system_headers,time_macros",
+            "CCACHE_FILECLONE" : "true",
+        }
+
+    def GetEnvironmentExports(self) -> str:
+        return ''.join(f"export {key}=\"{value}\"\n" for key, value in self.GetEnvironment().items())
+
+    # Returns the build settings which route compilation through the wrapper scripts
+    def GetBuildSettings(self) -> dict[str, str]:
+        return {
+            "CC" : f"{self.wrapper_path.joinpath('cc')}",
+            "CXX" : f"{self.wrapper_path.joinpath('c++')}",
+            "LD" : self.compiler,
+            "LDPLUSPLUS" : self.cxx_compiler,
+            # Explicitly built modules bypass the CC build setting
+            "CLANG_ENABLE_EXPLICIT_MODULES" : "NO",
+        }
+
+    # Queries the launcher for its cumulative statistics
+    def GetStatistics(self) -> CompilerCacheStatistics:
+        stats_command = ["env"] + [f"{key}={value}" for key, value in self.GetEnvironment().items()] + [self.launcher, "--print-stats"]
+        stats_output = utility.RunCommand(stats_command)
+
+        values = dict()
+        for line in stats_output.stdout.splitlines():
+            fields = line.split('\t')
+            if len(fields) == 2 and fields[1].strip().isdigit():
+                values[fields[0]] = int(fields[1])
+
+        return CompilerCacheStatistics(sum(values.get(key, 0) for key in CompilerCache.HIT_STATISTICS),
+                                       sum(values.get(key, 0) for key in CompilerCache.MISS_STATISTICS),
+                                       sum(values.get(key, 0) for key in CompilerCache.UNCACHEABLE_STATISTICS),
+                                       values.get("cache_size_kibibyte", 0) * 1024)
+
+    # Prints hit and miss counts accumulated since Configure was called
+    def PrintSummary(self, printer : Printer) -> None:
+        if self.initial_statistics is None:
+            return
+
+        statistics = self.GetStatistics().Since(self.initial_statistics)
+        printer.MessageWithContext("Compiler cache hits: ", f"{statistics.hits}", printer.Indent(1))
+        printer.MessageWithContext("Compiler cache misses: ", f"{statistics.misses}", printer.Indent(1))
+        printer.MessageWithContext("Uncacheable calls: ", f"{statistics.uncacheable}", printer.Indent(1))
+        printer.MessageWithContext("Hit rate: ", f"{statistics.HitRate():.0%}", printer.Indent(1))
+        printer.MessageWithContext("Cache size: ", f"{statistics.cache_size_bytes / (1024 * 1024):.1f} MiB (max {self.max_size})", printer.Indent(1))
@@ -0,0 +1,120 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import json, os, shutil, sys
+import xml.etree.ElementTree as ElementTree
+
+import scripts.python.upi_utility as utility
+
+from pathlib import Path
+
+from scripts.python.upi_unity_worker_pool import WORKER_FOLDER_NAME
+from scripts.python.upi_utility import Printer
+
+# Folders of a Unity project which are not copied into its EditMode clone; Unity recreates them. Library is synced separately.
+CLONE_EXCLUDED_FOLDER_NAMES = ["Library", "Temp", "Logs", "obj", "UserSettings", "TestPlayers"]
+
+# Outcome of the EditMode test run of one plug-in, read from the NUnit XML results Unity writes with -testResults
+class EditModeTestResult:
+    def __init__(self, plugin_id : str, results_path : Path, log_path : Path) -> None:
+        self.plugin_id = plugin_id
+        self.results_path = results_path
+        self.log_path = log_path
+
+        self.total = 0
+        self.passed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.inconclusive = 0
+        self.duration = 0.0
+        self.failures : list[tuple[str, str]] = list() # [(test full name, failure message)]
+
+        # Set when Unity produced no readable results
+        self.error = ""
+
+    def Succeeded(self) -> bool:
+        return len(self.error) == 0 and self.failed == 0
+
+    # Reads the counts and failed test cases from the NUnit 3 XML results file
+    def Load(self) -> None:
+        try:
+            test_run = ElementTree.parse(self.results_path).getroot()
+        except (OSError, ElementTree.ParseError) as parse_error:
+            self.error = f"No readable test results at {self.results_path} ({parse_error})"
+            return
+
+        self.total = int(test_run.get("total", 0))
+        self.passed = int(test_run.get("passed", 0))
+        self.failed = int(test_run.get("failed", 0))
+        self.skipped = int(test_run.get("skipped", 0))
+        self.inconclusive = int(test_run.get("inconclusive", 0))
+        self.duration = float(test_run.get("duration", 0.0))
+
+        for test_case in test_run.iter("test-case"):
+            if test_case.get("result") == "Failed":
+                message = test_case.findtext("failure/message", default="").strip()
+                self.failures.append((test_case.get("fullname", test_case.get("name", "")), message.splitlines()[0] if len(message) > 0 else ""))
+
+    def ToDict(self) -> dict:
+        return {"total" : self.total, "passed" : self.passed, "failed" : self.failed, "skipped" : self.skipped, "inconclusive" : self.inconclusive, "duration" : self.duration,
+                "failures" : [{"test" : test_name, "message" : message} for test_name, message in self.failures], "results" : f"{self.results_path}", "log" : f"{self.log_path}", "error" : self.error}
+
+# Copies a Unity project to 'clone_path' so that Unity can run EditMode tests in it while other Unity commands use the original project.
+#   Everything but the generated folders is replaced on each call. The clone's Library folder is kept between calls, so later runs import incrementally; a clone
+#   without one starts from a copy of the original project's Library, cloned with copy-on-write where the file system supports it.
+#   Local package references ('file:' paths in Packages/manifest.json) are made absolute, as they are relative to the original project's Packages folder.
+#   The Unity worker script, which a worker may have installed in the original project, is not copied.
+def SyncProjectClone(project_path : Path, clone_path : Path) -> None:
+    clone_path.mkdir(parents=True, exist_ok=True)
+    for clone_child_path in clone_path.iterdir():
+        if clone_child_path.name in CLONE_EXCLUDED_FOLDER_NAMES:
+            continue
+        if clone_child_path.is_dir() and not clone_child_path.is_symlink():
+            shutil.rmtree(clone_child_path)
+        else:
+            clone_child_path.unlink()
+
+    for child_path in project_path.iterdir():
+        if child_path.name in CLONE_EXCLUDED_FOLDER_NAMES:
+            continue
+        if child_path.is_dir() and not child_path.is_symlink():
+            shutil.copytree(child_path, clone_path.joinpath(child_path.name), symlinks=True, ignore=shutil.ignore_patterns(WORKER_FOLDER_NAME, f"{WORKER_FOLDER_NAME}.meta"))
+        else:
+            shutil.copy2(child_path, clone_path.joinpath(child_path.name), follow_symlinks=False)
+
+    library_path = project_path.joinpath("Library")
+    clone_library_path = clone_path.joinpath("Library")
+    if library_path.is_dir() and not clone_library_path.exists():
+        clone_command = ["cp", "-c", "-R", f"{library_path}", f"{clone_library_path}"] if sys.platform == "darwin" else ["cp", "-R", "--reflink=auto", f"{library_path}", f"{clone_library_path}"]
+        if utility.RunCommand(clone_command).returncode != 0:
+            shutil.rmtree(clone_library_path, ignore_errors=True)
+
+    manifest_path = clone_path.joinpath("Packages", "manifest.json")
+    if manifest_path.is_file():
+        manifest_data = json.loads(manifest_path.read_text())
+        for package_name, package_reference in manifest_data.get("dependencies", dict()).items():
+            if isinstance(package_reference, str) and package_reference.startswith("file:") and not os.path.isabs(package_reference[len("file:"):]):
+                manifest_data["dependencies"][package_name] = f"file:{project_path.joinpath('Packages', package_reference[len('file:'):]).resolve()}"
+        manifest_path.write_text(json.dumps(manifest_data, indent=2) + "\n")
+
+        # The lock file records the relative references; Unity writes a new one
+        clone_path.joinpath("Packages", "packages-lock.json").unlink(missing_ok=True)
+
+# Prints the combined results of every plug-in's EditMode tests
+def PrintEditModeSummary(results : dict[str, EditModeTestResult], printer : Printer) -> None:
+    for plugin_id, result in results.items():
+        if len(result.error) > 0:
+            printer.MessageWithContext(f"{plugin_id}: ", result.error, "\n")
+            printer.MessageWithContext("Unity log: ", f"{result.log_path}", printer.Indent(1))
+            continue
+
+        printer.MessageWithContext(f"{plugin_id}: ", f"{result.passed}/{result.total} passed, {result.failed} failed, {result.skipped} skipped, {result.inconclusive} inconclusive in {result.duration:.1f}s", "\n")
+        for test_name, message in result.failures:
+            printer.MessageWithContext("Failed: ", f"{test_name}{f' ({message})' if len(message) > 0 else ''}", printer.Indent(1))
+        if not result.Succeeded():
+            printer.MessageWithContext("Results: ", f"{result.results_path}", printer.Indent(1))
+
+    total = sum(result.total for result in results.values())
+    passed = sum(result.passed for result in results.values())
+    errors = sum(1 for result in results.values() if len(result.error) > 0)
+    printer.MessageWithContext("All EditMode tests: ", f"{passed} of {total} passed across {len(results)} plug-in(s){f', {errors} without results' if errors > 0 else ''}", "\n")
@@ -0,0 +1,292 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import fcntl, hashlib, json, os, socket, tempfile, threading, time
+
+from pathlib import Path
+from collections.abc import Callable
+
+from scripts.python.upi_utility import Printer
+
+# Default folder for locks shared by every build.py run on the host, whichever checkout it runs from
+DEFAULT_HOST_LOCK_ROOT = Path(tempfile.gettempdir()).joinpath("com.apple.unityplugins.locks")
+
+# Opens (creating it if needed) and takes an exclusive advisory lock on a file, returning its descriptor, or None if another descriptor holds the lock.
+#   The kernel drops the lock when the descriptor is closed or its process exits for any reason, so a crashed holder never leaves a lock behind.
+def TryLockFile(lock_path : Path) -> int:
+    lock_fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(lock_fd)
+        return None
+    return lock_fd
+
+# Records who holds a lock in its file, for the messages of processes waiting for it
+def WriteHolder(lock_fd : int, holder : str) -> None:
+    os.ftruncate(lock_fd, 0)
+    os.pwrite(lock_fd, json.dumps({"pid" : os.getpid(), "host" : socket.gethostname(), "holder" : holder, "time" : time.time()}).encode(), 0)
+
+def ReadHolder(lock_path : Path) -> dict:
+    try:
+        return json.loads(lock_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+# A seat taken from a HostSemaphore; the seat is free again once the lease is released, or its process exits
+class HostSemaphoreLease:
+    def __init__(self, semaphore : 'HostSemaphore', seat_index : int, lock_fd : int) -> None:
+        self.semaphore = semaphore
+        self.seat_index = seat_index
+        self.lock_fd = lock_fd
+
+    def Release(self) -> None:
+        if self.lock_fd is not None:
+            os.ftruncate(self.lock_fd, 0)
+            os.close(self.lock_fd)
+            self.lock_fd = None
+
+    def __enter__(self) -> 'HostSemaphoreLease':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.Release()
+
+# Counting semaphore shared by every process on the host, built on advisory file locks, e.g. to keep the number of running Unity Editors within the license seats.
+#   Each seat is a lock file; holding the lock holds the seat. Locks are released by the kernel when their process exits, so seats held by a crashed build are free again
+#   straight away.
+#
+#   Waiters are served in arrival order. Each waiter locks a ticket file named by its arrival time in the queue folder, and only the oldest live ticket may take a seat.
+#   A ticket whose lock can be taken belongs to a process which has exited without removing it; it is deleted by the next waiter which finds it.
+#
+#   Every process sharing the semaphore should be given the same number of seats.
+class HostSemaphore:
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, lock_root : Path, name : str, seats : int) -> None:
+        self.path = lock_root.joinpath(name)
+        self.queue_path = self.path.joinpath("queue")
+        self.seats = max(1, seats)
+
+        self.lock = threading.Lock()
+        self.acquired_count = 0
+        self.waited_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.stale_tickets_removed = 0
+
+    def GetSeatPath(self, seat_index : int) -> Path:
+        return self.path.joinpath(f"seat_{seat_index}.lock")
+
+    # Waits for a free seat, in turn with every other waiter on the host.
+    #   'holder' describes the caller to waiting processes. 'on_wait' is called on each poll while the caller waits, e.g. to give up seats held by idle work.
+    def Acquire(self, holder : str, on_wait : Callable[[], None] = None, printer : Printer = None, indent : str = "") -> HostSemaphoreLease:
+        self.queue_path.mkdir(parents=True, exist_ok=True)
+
+        # The ticket is locked before it gets its queue name, so no other waiter can mistake it for the ticket of an exited process
+        ticket_name = f"{time.time_ns():020d}_{os.getpid()}_{threading.get_ident()}"
+        ticket_path = self.queue_path.joinpath(ticket_name)
+        pending_ticket_path = self.queue_path.joinpath(f".{ticket_name}")
+        ticket_fd = TryLockFile(pending_ticket_path)
+        os.rename(pending_ticket_path, ticket_path)
+
+        start_time = time.monotonic()
+        waited = False
+        try:
+            while True:
+                if self.IsFirstInQueue(ticket_name):
+                    for seat_index in range(self.seats):
+                        seat_fd = TryLockFile(self.GetSeatPath(seat_index))
+                        if seat_fd is not None:
+                            WriteHolder(seat_fd, holder)
+                            self.RecordAcquire(time.monotonic() - start_time, waited)
+                            return HostSemaphoreLease(self, seat_index, seat_fd)
+
+                if not waited:
+                    waited = True
+                    if printer is not None:
+                        holders = [ReadHolder(self.GetSeatPath(seat_index)) for seat_index in range(self.seats)]
+                        holder_descriptions = [f"{seat_holder.get('holder', '')} (pid {seat_holder.get('pid', '?')})" for seat_holder in holders if seat_holder is not None]
+                        printer.MessageWithContext(f"Waiting for one of {self.seats} {self.path.name} held by: ", ', '.join(holder_descriptions) if len(holder_descriptions) > 0 else "other waiters", indent)
+                if on_wait is not None:
+                    on_wait()
+                time.sleep(HostSemaphore.POLL_INTERVAL)
+        finally:
+            ticket_path.unlink(missing_ok=True)
+            os.close(ticket_fd)
+
+    # Returns True if no live ticket is older than 'ticket_name'. Tickets of exited processes are removed.
+    def IsFirstInQueue(self, ticket_name : str) -> bool:
+        for other_ticket_name in sorted(os.listdir(self.queue_path)):
+            if other_ticket_name >= ticket_name:
+                return True
+            if other_ticket_name.startswith('.'):
+                continue
+
+            other_ticket_path = self.queue_path.joinpath(other_ticket_name)
+            try:
+                other_ticket_fd = TryLockFile(other_ticket_path)
+            except FileNotFoundError:
+                continue
+            if other_ticket_fd is None:
+                return False
+
+            other_ticket_path.unlink(missing_ok=True)
+            os.close(other_ticket_fd)
+            with self.lock:
+                self.stale_tickets_removed += 1
+        return True
+
+    def RecordAcquire(self, wait_seconds : float, waited : bool) -> None:
+        with self.lock:
+            self.acquired_count += 1
+            if waited:
+                self.waited_count += 1
+                self.total_wait_seconds += wait_seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def PrintConfiguration(self, printer : Printer) -> None:
+        printer.MessageWithContext("Seats: ", f"{self.seats}", printer.Indent(1))
+        printer.MessageWithContext("Lock path: ", f"{self.path}", printer.Indent(1))
+
+    def PrintSummary(self, printer : Printer) -> None:
+        printer.MessageWithContext("Seats taken: ", f"{self.acquired_count}", printer.Indent(1))
+        printer.MessageWithContext("Waited for a seat: ", f"{self.waited_count} time(s), {self.total_wait_seconds:.1f}s in total, {self.max_wait_seconds:.1f}s at most", printer.Indent(1))
+        if self.stale_tickets_removed > 0:
+            printer.MessageWithContext("Queue tickets of exited processes removed: ", f"{self.stale_tickets_removed}", printer.Indent(1))
+
+class HostLockModeID:
+    SHARED = "shared"
+    EXCLUSIVE = "exclusive"
+
+# Advisory lock on a folder used by build.py runs, e.g. a plug-in project or an output folder. Runs which only read the folder share the lock; a run which writes to it
+# holds it exclusively. The lock file is named after the folder's resolved path, so every checkout, and every spelling of the path, maps to the same lock.
+class HostPathLock:
+    def __init__(self, lock_root : Path, path : Path) -> None:
+        self.path = path.resolve()
+        self.lock_path = lock_root.joinpath("paths", f"{self.path.name}_{hashlib.sha1(str(self.path).encode()).hexdigest()[:12]}.lock")
+        self.lock_fd : int = None
+        self.mode : str = None
+
+    # Takes the lock in 'mode', converting it if already held. Returns the seconds spent waiting for other runs, or None if 'wait' is False and the lock is held elsewhere.
+    #   Converting a held lock is not atomic: the lock may be given up, and is lost when a conversion without waiting fails.
+    def Acquire(self, mode : str, holder : str, wait : bool = True, printer : Printer = None, indent : str = "") -> float:
+        if self.lock_fd is None:
+            self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+            self.lock_fd = os.open(self.lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+
+        operation = fcntl.LOCK_SH if mode == HostLockModeID.SHARED else fcntl.LOCK_EX
+        wait_seconds = 0.0
+        try:
+            fcntl.flock(self.lock_fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.mode = None
+            if not wait:
+                return None
+
+            if printer is not None:
+                lock_holder = ReadHolder(self.lock_path)
+                printer.MessageWithContext(f"Waiting for {mode} lock on {self.path}, held by: ", f"{lock_holder.get('holder', '')} (pid {lock_holder.get('pid', '?')})" if lock_holder is not None else "another build.py run", indent)
+            start_time = time.monotonic()
+            fcntl.flock(self.lock_fd, operation)
+            wait_seconds = time.monotonic() - start_time
+
+        self.mode = mode
+        WriteHolder(self.lock_fd, holder)
+        return wait_seconds
+
+    def Release(self) -> None:
+        if self.lock_fd is not None:
+            if self.mode == HostLockModeID.EXCLUSIVE:
+                os.ftruncate(self.lock_fd, 0)
+            os.close(self.lock_fd)
+            self.lock_fd = None
+            self.mode = None
+
+# The folder locks held by one build.py run.
+#   Every lock the run needs is requested at once and taken in the order of the lock file names. As no run waits for a lock while holding one that sorts after it, runs
+#   which need overlapping folders queue behind each other rather than deadlock. Later conversions never wait while other locks are held (See: Convert).
+class HostLockSet:
+    def __init__(self, lock_root : Path, holder : str) -> None:
+        self.lock_root = lock_root
+        self.holder = holder
+        self.locks : dict[Path, HostPathLock] = dict() # {resolved folder path: lock}
+
+        self.lock = threading.Lock()
+        self.acquired_count = 0
+        self.waited_count = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.skipped_exclusive_count = 0
+
+    # Takes the lock on each folder in 'requests', {folder path: HostLockModeID}, waiting for other runs as needed.
+    #   A folder requested exclusively and in a shared mode is locked exclusively.
+    def Acquire(self, requests : dict[Path, str], printer : Printer = None, indent : str = "") -> None:
+        modes : dict[Path, str] = dict()
+        for path, mode in requests.items():
+            resolved_path = path.resolve()
+            if modes.get(resolved_path) != HostLockModeID.EXCLUSIVE:
+                modes[resolved_path] = mode
+
+        for path_lock in sorted((self.locks.get(path) or HostPathLock(self.lock_root, path) for path in modes.keys()), key=lambda path_lock: path_lock.lock_path):
+            self.locks[path_lock.path] = path_lock
+            if path_lock.mode == modes[path_lock.path]:
+                continue
+            self.RecordAcquire(path_lock.Acquire(modes[path_lock.path], self.holder, printer=printer, indent=indent))
+
+    # Converts the lock on 'path' to 'mode' without waiting for other runs. Returns False if another run holds it, in which case the lock is held in its former mode again.
+    #   A failed conversion gives up the lock, so every lock of the run is released and taken again in order, as in Acquire. A shared lock is taken even if that waits.
+    def Convert(self, path : Path, mode : str, printer : Printer = None, indent : str = "") -> bool:
+        path_lock = self.locks[path.resolve()]
+        if path_lock.mode == mode:
+            return True
+
+        former_mode = path_lock.mode
+        if path_lock.Acquire(mode, self.holder, wait=False) is not None:
+            return True
+
+        modes = {lock_path : held_lock.mode for lock_path, held_lock in self.locks.items()}
+        modes[path_lock.path] = mode if mode == HostLockModeID.SHARED else former_mode
+        self.ReleaseAll()
+        self.Acquire(modes, printer, indent)
+        return mode == HostLockModeID.SHARED
+
+    # Takes the lock on 'path' exclusively if no other run is using the folder, e.g. before evicting outputs which other runs may still be writing
+    def TryExclusive(self, path : Path, printer : Printer = None, indent : str = "") -> bool:
+        if self.Convert(path, HostLockModeID.EXCLUSIVE, printer, indent):
+            return True
+        with self.lock:
+            self.skipped_exclusive_count += 1
+        return False
+
+    def Downgrade(self, path : Path, printer : Printer = None, indent : str = "") -> None:
+        if path.resolve() in self.locks:
+            self.Convert(path, HostLockModeID.SHARED, printer, indent)
+
+    def Release(self, path : Path) -> None:
+        path_lock = self.locks.pop(path.resolve(), None)
+        if path_lock is not None:
+            path_lock.Release()
+
+    def ReleaseAll(self) -> None:
+        for path in list(self.locks.keys()):
+            self.Release(path)
+
+    def RecordAcquire(self, wait_seconds : float) -> None:
+        with self.lock:
+            self.acquired_count += 1
+            if wait_seconds > 0.0:
+                self.waited_count += 1
+                self.total_wait_seconds += wait_seconds
+                self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+
+    def PrintConfiguration(self, printer : Printer) -> None:
+        for path, path_lock in sorted(self.locks.items()):
+            printer.MessageWithContext(f"{path_lock.mode.capitalize()}: ", f"{path}", printer.Indent(1))
+        printer.MessageWithContext("Lock path: ", f"{self.lock_root.joinpath('paths')}", printer.Indent(1))
+
+    def PrintSummary(self, printer : Printer) -> None:
+        printer.MessageWithContext("Folder locks taken: ", f"{self.acquired_count}", printer.Indent(1))
+        printer.MessageWithContext("Waited for other runs: ", f"{self.waited_count} time(s), {self.total_wait_seconds:.1f}s in total, {self.max_wait_seconds:.1f}s at most", printer.Indent(1))
+        if self.skipped_exclusive_count > 0:
+            printer.MessageWithContext("Output evictions skipped while other runs used the folder: ", f"{self.skipped_exclusive_count}", printer.Indent(1))
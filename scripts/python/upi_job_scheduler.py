@@ -0,0 +1,347 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import os, sys, threading, time
+
+import scripts.python.upi_utility as utility
+
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from collections.abc import Callable, Iterator
+
+from scripts.python.upi_cli_argument_options import CommandTypeID
+from scripts.python.upi_build_history import BuildHistory, BuildStepID
+from scripts.python.upi_utility import Printer
+
+GIB = 1024 * 1024 * 1024
+
+# Snapshot of host memory and CPU load used for admission decisions.
+#   'available_memory_bytes' and 'total_memory_bytes' are None when the host cannot be queried; admission then falls back to job counts only.
+class SystemLoad:
+    def __init__(self, available_memory_bytes : int = None, total_memory_bytes : int = None, load_average : float = 0.0, cpu_count : int = 1) -> None:
+        self.available_memory_bytes = available_memory_bytes
+        self.total_memory_bytes = total_memory_bytes
+        self.load_average = load_average
+        self.cpu_count = cpu_count
+
+    # Load average normalized by the number of CPUs, e.g. 1.0 when every core has one runnable process
+    def LoadPerCpu(self) -> float:
+        return self.load_average / max(1, self.cpu_count)
+
+    @staticmethod
+    def Sample() -> 'SystemLoad':
+        try:
+            total_memory_bytes = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        except (ValueError, OSError):
+            total_memory_bytes = None
+
+        try:
+            load_average = os.getloadavg()[0]
+        except OSError:
+            load_average = 0.0
+
+        return SystemLoad(SystemLoad.GetAvailableMemory(), total_memory_bytes, load_average, os.cpu_count() or 1)
+
+    # Returns the memory which can be given to new processes without swapping, in bytes, or None if unknown.
+    #   macOS: free, inactive, speculative and purgeable pages as reported by vm_stat. Linux: MemAvailable from /proc/meminfo.
+    @staticmethod
+    def GetAvailableMemory() -> int:
+        if sys.platform == "darwin":
+            vm_stat_output = utility.RunCommand(["vm_stat"])
+            if vm_stat_output.returncode != 0:
+                return None
+
+            page_size = 4096
+            page_counts = dict()
+            for line in vm_stat_output.stdout.splitlines():
+                if "page size of" in line:
+                    page_size = int(line.split("page size of")[1].split()[0])
+                else:
+                    key, _, value = line.partition(':')
+                    if value.strip().rstrip('.').isdigit():
+                        page_counts[key.strip()] = int(value.strip().rstrip('.'))
+
+            available_pages = sum(page_counts.get(key, 0) for key in ["Pages free", "Pages inactive", "Pages speculative", "Pages purgeable"])
+            return available_pages * page_size
+
+        try:
+            with open("/proc/meminfo") as meminfo_file:
+                for line in meminfo_file:
+                    if line.startswith("MemAvailable:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return None
+
+# Decides how many heavy commands (xcodebuild, Unity, pack) run at once.
+#   Each command type has a memory estimate: configured on the command line, otherwise learned from the peak RSS of recent runs in the build history, otherwise a default.
+#   A command is admitted when fewer than the current concurrency limit are running, the host's load per CPU is below 'max_load_per_cpu',
+#   and available memory, less the estimates of recently started commands which have not reached their peak yet, less 'memory_reserve_bytes', covers its estimate.
+#   When available memory falls below the reserve the concurrency limit is halved; it grows back by one as commands finish without memory pressure.
+#   A command is always admitted when nothing else is running, so the build makes progress on hosts smaller than any estimate.
+class AdmissionController:
+    DEFAULT_MEMORY_ESTIMATES = {
+        CommandTypeID.XCODEBUILD : 4 * GIB,
+        CommandTypeID.UNITY : 6 * GIB,
+        CommandTypeID.CODESIGN : GIB // 4,
+        CommandTypeID.PACK : GIB // 2
+    }
+
+    # Build history steps whose peak RSS is representative of each command type
+    HISTORY_STEPS = {
+        CommandTypeID.XCODEBUILD : [BuildStepID.NATIVE_BUILD],
+        CommandTypeID.UNITY : [BuildStepID.TEST_BUILD, BuildStepID.TOUCH_PROJECT],
+        CommandTypeID.CODESIGN : [BuildStepID.CODESIGN],
+        CommandTypeID.PACK : [BuildStepID.PACK]
+    }
+
+    # Learned estimates are padded to allow for run-to-run variation
+    LEARNED_ESTIMATE_MARGIN = 1.25
+
+    # Commands are assumed to take this long to reach their peak memory use; until then their estimate is held back from available memory
+    RAMP_UP_SECONDS = 30.0
+
+    # Minimum time between two reductions of the concurrency limit
+    BACK_OFF_COOLDOWN_SECONDS = 15.0
+
+    def __init__(self, max_jobs : int = 1, memory_reserve_bytes : int = 2 * GIB, max_load_per_cpu : float = 1.5, sample_load : Callable[[], SystemLoad] = SystemLoad.Sample) -> None:
+        self.max_jobs = max(1, max_jobs)
+        self.memory_reserve_bytes = memory_reserve_bytes
+        self.max_load_per_cpu = max_load_per_cpu
+        self.sample_load = sample_load
+
+        self.memory_estimates : dict[str, int] = dict(AdmissionController.DEFAULT_MEMORY_ESTIMATES)
+        self.estimate_sources : dict[str, str] = {command_type : "default" for command_type in self.memory_estimates}
+
+        self.concurrency_limit = self.max_jobs
+        self.printer : Printer = None
+
+        self._condition = threading.Condition()
+        self._running : dict[int, tuple[str, int, float]] = dict() # {token: (command type, memory estimate, start time)}
+        self._next_token = 0
+        self._last_back_off_time = 0.0
+
+        # Statistics for the end of run summary
+        self.admitted_count = 0
+        self.peak_concurrency = 0
+        self.total_wait_seconds = 0.0
+        self.back_off_count = 0
+
+    # Sets the memory estimate for each command type in 'configured_estimates' and learns the others from the peak RSS of up to 'sample_count' recent successful steps.
+    def ConfigureEstimates(self, configured_estimates : dict[str, int], history : BuildHistory = None, sample_count : int = 10) -> None:
+        for command_type in self.memory_estimates:
+            if command_type in configured_estimates:
+                self.memory_estimates[command_type] = configured_estimates[command_type]
+                self.estimate_sources[command_type] = "configured"
+            elif history is not None:
+                learned_peaks = [history.GetPeakMemoryEstimate(step, sample_count) for step in AdmissionController.HISTORY_STEPS[command_type]]
+                learned_peaks = [peak for peak in learned_peaks if peak is not None and peak > 0]
+                if len(learned_peaks) > 0:
+                    self.memory_estimates[command_type] = int(max(learned_peaks) * AdmissionController.LEARNED_ESTIMATE_MARGIN)
+                    self.estimate_sources[command_type] = "learned"
+
+    # Blocks until a command of 'command_type' may start, then holds its slot until the 'with' block exits.
+    @contextmanager
+    def Admit(self, command_type : str) -> Iterator[None]:
+        token = self.Acquire(command_type)
+        try:
+            yield
+        finally:
+            self.Release(token)
+
+    def Acquire(self, command_type : str) -> int:
+        estimate = self.memory_estimates.get(command_type, 0)
+        wait_start_time = time.monotonic()
+        announced_wait = False
+
+        with self._condition:
+            while True:
+                load = self.sample_load()
+                self.CheckMemoryPressure(load)
+
+                blocked_reason = self.GetBlockedReason(estimate, load)
+                if blocked_reason is None:
+                    break
+
+                if not announced_wait and self.printer is not None:
+                    self.printer.MessageWithContext(f"Waiting to start {command_type}: ", blocked_reason, self.printer.Indent(1))
+                    announced_wait = True
+
+                # Re-sample periodically as well as when a running command finishes; available memory can change without any command finishing
+                self._condition.wait(2.0)
+
+            token = self._next_token
+            self._next_token += 1
+            self._running[token] = (command_type, estimate, time.monotonic())
+
+            self.admitted_count += 1
+            self.peak_concurrency = max(self.peak_concurrency, len(self._running))
+            self.total_wait_seconds += time.monotonic() - wait_start_time
+            return token
+
+    def Release(self, token : int) -> None:
+        with self._condition:
+            self._running.pop(token, None)
+
+            load = self.sample_load()
+            if not self.IsUnderMemoryPressure(load) and self.concurrency_limit < self.max_jobs:
+                self.concurrency_limit += 1
+
+            self._condition.notify_all()
+
+    # Returns None when a command with the given memory estimate can be admitted, otherwise a description of what it is waiting for.
+    def GetBlockedReason(self, estimate : int, load : SystemLoad) -> str:
+        if len(self._running) == 0:
+            return None
+
+        if len(self._running) >= self.concurrency_limit:
+            return f"{len(self._running)} of {self.concurrency_limit} job slot(s) in use"
+
+        if load.LoadPerCpu() > self.max_load_per_cpu:
+            return f"load average {load.load_average:.1f} exceeds {self.max_load_per_cpu:.1f} per CPU"
+
+        if load.available_memory_bytes is not None:
+            now = time.monotonic()
+            ramping_estimates = sum(running_estimate for _, running_estimate, start_time in self._running.values() if now - start_time < AdmissionController.RAMP_UP_SECONDS)
+            headroom = load.available_memory_bytes - ramping_estimates - self.memory_reserve_bytes
+            if headroom < estimate:
+                return f"{max(0, headroom) / GIB:.1f} GiB memory headroom, {estimate / GIB:.1f} GiB needed"
+
+        return None
+
+    def IsUnderMemoryPressure(self, load : SystemLoad) -> bool:
+        return load.available_memory_bytes is not None and load.available_memory_bytes < self.memory_reserve_bytes
+
+    # Halves the concurrency limit when available memory has fallen below the reserve
+    def CheckMemoryPressure(self, load : SystemLoad) -> None:
+        now = time.monotonic()
+        if not self.IsUnderMemoryPressure(load) or self.concurrency_limit <= 1 or now - self._last_back_off_time < AdmissionController.BACK_OFF_COOLDOWN_SECONDS:
+            return
+
+        self.concurrency_limit = max(1, self.concurrency_limit // 2)
+        self._last_back_off_time = now
+        self.back_off_count += 1
+
+        if self.printer is not None:
+            self.printer.WarningMessage(f"Memory pressure: {load.available_memory_bytes / GIB:.1f} GiB available, below the {self.memory_reserve_bytes / GIB:.1f} GiB reserve. Reducing concurrent jobs to {self.concurrency_limit}.")
+
+    def PrintConfiguration(self, printer : Printer) -> None:
+        printer.MessageWithContext("Maximum concurrent jobs: ", f"{self.max_jobs}", printer.Indent(1))
+        printer.MessageWithContext("Memory reserve: ", f"{self.memory_reserve_bytes / GIB:.1f} GiB", printer.Indent(1))
+        for command_type, estimate in self.memory_estimates.items():
+            printer.MessageWithContext(f"{command_type} memory estimate: ", f"{estimate / GIB:.1f} GiB ({self.estimate_sources[command_type]})", printer.Indent(1))
+
+    def PrintSummary(self, printer : Printer) -> None:
+        printer.MessageWithContext("Jobs admitted: ", f"{self.admitted_count}", printer.Indent(1))
+        printer.MessageWithContext("Peak concurrent jobs: ", f"{self.peak_concurrency} (limit {self.max_jobs})", printer.Indent(1))
+        printer.MessageWithContext("Time spent waiting for admission: ", f"{self.total_wait_seconds:.1f}s", printer.Indent(1))
+        printer.MessageWithContext("Memory pressure back-offs: ", f"{self.back_off_count}", printer.Indent(1))
+
+# Runs build jobs on a pool of worker threads. Heavy commands within each job are gated by the AdmissionController.
+#   With a single worker, jobs run inline on the calling thread in submission order, exactly as the sequential build did.
+class JobExecutor:
+    def __init__(self, max_workers : int = 1) -> None:
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="upi-job") if self.max_workers > 1 else None
+
+    def Submit(self, job : Callable, *args) -> Future:
+        if self._pool is not None:
+            return self._pool.submit(job, *args)
+
+        # Inline jobs raise straight to the caller, so a failure stops the remaining jobs as it did before
+        future = Future()
+        future.set_result(job(*args))
+        return future
+
+    # Runs 'job' for each item in 'items' and waits for all of them; the first exception raised by a job is re-raised once every job has finished.
+    def Map(self, job : Callable, items : list) -> list:
+        futures = [self.Submit(job, item) for item in items]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        if len(errors) > 0:
+            raise errors[0]
+        return [future.result() for future in futures]
+
+    def Shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+
+# Outcome of each task in a StagePipeline
+class TaskStatusID:
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    SKIPPED = "skipped"
+
+# A unit of work in a StagePipeline. 'job' returns True on success.
+#   'requires' names tasks which must succeed first; the task is skipped if any of them fails or is skipped.
+#   'after' names tasks which must only have finished first, whatever their outcome.
+#   Tasks named in either list which are not part of the pipeline are ignored.
+class PipelineTask:
+    def __init__(self, key : tuple[str, str], job : Callable[[], bool], requires : list[tuple[str, str]] = None, after : list[tuple[str, str]] = None, priority : tuple = ()) -> None:
+        self.key = key
+        self.job = job
+        self.requires = requires if requires is not None else list()
+        self.after = after if after is not None else list()
+
+        # Among ready tasks, the lowest priority value starts first
+        self.priority = priority
+
+# Runs (plug-in, stage) tasks on a JobExecutor as soon as the tasks they depend on have finished, rather than in global phases.
+#   At most 'max_workers' tasks are started at once so that the priority order is respected; with one worker, tasks run one at a time in priority order.
+class StagePipeline:
+    def __init__(self, executor : JobExecutor) -> None:
+        self.executor = executor
+        self.tasks : dict[tuple[str, str], PipelineTask] = dict()
+        self.status : dict[tuple[str, str], str] = dict()
+
+    def AddTask(self, task : PipelineTask) -> None:
+        self.tasks[task.key] = task
+
+    # Runs every task and returns the status of each. The first exception raised by a task is re-raised once no more tasks are running.
+    def Run(self, printer : Printer = None) -> dict[tuple[str, str], str]:
+        pending = dict(self.tasks)
+        running : dict[Future, tuple[str, str]] = dict()
+        errors = list()
+
+        while len(pending) > 0 or len(running) > 0:
+            ready = sorted((task for task in pending.values() if self.IsReady(task)), key=lambda task: task.priority)
+
+            for task in ready:
+                failed_requirements = [key for key in task.requires if self.status.get(key, TaskStatusID.SUCCEEDED) != TaskStatusID.SUCCEEDED]
+                if len(failed_requirements) > 0 or len(errors) > 0:
+                    del pending[task.key]
+                    self.status[task.key] = TaskStatusID.SKIPPED
+                    if printer is not None and len(errors) == 0:
+                        printer.WarningMessage(f"Skipping {' '.join(task.key)}: {', '.join(' '.join(key) for key in failed_requirements)} did not succeed.")
+                    continue
+
+                if len(running) >= self.executor.max_workers:
+                    break
+
+                del pending[task.key]
+                try:
+                    running[self.executor.Submit(task.job)] = task.key
+                except Exception as error:
+                    self.status[task.key] = TaskStatusID.FAILED
+                    errors.append(error)
+
+            if len(running) == 0:
+                if len(ready) == 0 and len(pending) > 0:
+                    raise RuntimeError(f"Pipeline tasks have circular dependencies: {', '.join(' '.join(key) for key in pending)}")
+                continue
+
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                if future.exception() is not None:
+                    self.status[key] = TaskStatusID.FAILED
+                    errors.append(future.exception())
+                else:
+                    self.status[key] = TaskStatusID.SUCCEEDED if future.result() else TaskStatusID.FAILED
+
+        if len(errors) > 0:
+            raise errors[0]
+        return self.status
+
+    def IsReady(self, task : PipelineTask) -> bool:
+        return all(key in self.status or key not in self.tasks for key in task.requires + task.after)
+
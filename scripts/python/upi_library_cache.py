@@ -0,0 +1,202 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import hashlib, json, os, shutil, sys, threading, time
+
+import scripts.python.upi_utility as utility
+
+from pathlib import Path
+
+from scripts.python.upi_assembly_graph import GetProjectFilePaths
+from scripts.python.upi_build_journal import HashFile
+from scripts.python.upi_utility import Printer
+
+# Folders under Library/ whose files Unity writes once and never modifies in place, so a cache entry and a project can share them through hard links.
+#   Artifacts holds the content-addressed results of asset imports, which make up most of a Library folder.
+IMMUTABLE_LIBRARY_FOLDER_NAMES = ["Artifacts"]
+
+# Returns the total size, in bytes, of the files under 'root'
+def GetTreeSize(root : Path) -> int:
+    total_size = 0
+    for folder_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            file_path = Path(folder_path, file_name)
+            if not file_path.is_symlink():
+                total_size += file_path.stat().st_size
+    return total_size
+
+# Local cache of Unity project Library folders, so that Unity commands on a project without a Library folder (e.g. a fresh checkout) start from a
+# previous import instead of importing every asset again.
+#   Entries are keyed by the Unity editor version, the project's package manifests and project settings (the base key), and the contents of its Assets folder
+#   (the asset key). A project without a Library folder is restored from the entry with the same keys or, failing that, from the most recently used entry with the same
+#   base key, which Unity then brings up to date with an incremental import. After a successful Unity command the project's Library folder is saved under the keys
+#   computed before the command ran.
+#
+#   Entries are cloned rather than copied where the file system supports it: with copy-on-write clones (APFS, Btrfs, XFS) when it can, and otherwise by hard linking
+#   the immutable folders and copying the rest. Least recently used entries are evicted to keep the cache within its size budget.
+class UnityLibraryCache:
+    ENTRY_FILE_NAME = "entry.json"
+
+    def __init__(self, cache_path : Path, max_size_bytes : int) -> None:
+        self.cache_path = cache_path
+        self.max_size_bytes = max_size_bytes
+
+        # None until the first clone attempt shows whether the file system supports copy-on-write clones
+        self.clone_supported : bool = None
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self.saves = 0
+        self.evicted_entries = 0
+        self.evicted_bytes = 0
+
+    # Returns (base key, asset key) for a project opened with the given editor version.
+    #   Folders under Assets which Unity does not import, and the Unity worker's scripts, are left out (See: GetProjectFilePaths).
+    def GetKeys(self, project_path : Path, unity_version : str) -> tuple[str, str]:
+        base_hash = hashlib.sha256(unity_version.encode())
+        settings_paths = [project_path.joinpath("Packages", "manifest.json"), project_path.joinpath("Packages", "packages-lock.json")] + sorted(project_path.joinpath("ProjectSettings").glob("*.asset"))
+        for settings_path in settings_paths:
+            if settings_path.is_file():
+                base_hash.update(f"{settings_path.relative_to(project_path)}\0{HashFile(settings_path)}\n".encode())
+
+        asset_hash = hashlib.sha256()
+        assets_path = project_path.joinpath("Assets")
+        for file_path in GetProjectFilePaths(assets_path):
+            asset_hash.update(f"{file_path.relative_to(assets_path)}\0{HashFile(file_path)}\n".encode())
+
+        return base_hash.hexdigest()[:16], asset_hash.hexdigest()[:16]
+
+    def GetEntryPath(self, project_path : Path, keys : tuple[str, str]) -> Path:
+        return self.cache_path.joinpath(project_path.name, *keys)
+
+    # Returns the paths of the complete entries matching 'pattern' under 'root'; entries still being saved are left out
+    def FindEntryPaths(self, root : Path, pattern : str) -> list[Path]:
+        return [entry_file_path.parent for entry_file_path in root.glob(f"{pattern}/{UnityLibraryCache.ENTRY_FILE_NAME}") if ".partial-" not in entry_file_path.parent.name]
+
+    # Copies the folder at 'source_path' to 'destination_path', which must not exist, sharing file contents where the file system allows.
+    # Returns a description of the method used.
+    def CloneTree(self, source_path : Path, destination_path : Path) -> str:
+        if self.clone_supported is not False:
+            clone_command = ["cp", "-c", "-R", f"{source_path}", f"{destination_path}"] if sys.platform == "darwin" else ["cp", "-R", "--reflink=always", f"{source_path}", f"{destination_path}"]
+            if utility.RunCommand(clone_command).returncode == 0:
+                self.clone_supported = True
+                return "copy-on-write clone"
+
+            self.clone_supported = False
+            shutil.rmtree(destination_path, ignore_errors=True)
+
+        def LinkOrCopy(source_file : str, destination_file : str) -> None:
+            if Path(source_file).relative_to(source_path).parts[0] in IMMUTABLE_LIBRARY_FOLDER_NAMES:
+                try:
+                    os.link(source_file, destination_file)
+                    return
+                except OSError:
+                    pass
+            shutil.copy2(source_file, destination_file)
+
+        shutil.copytree(source_path, destination_path, symlinks=True, copy_function=LinkOrCopy)
+        return "hard links and copies"
+
+    # Restores the Library folder of a project which has none from the cache.
+    # Returns the keys under which the project's Library folder should be saved once the Unity command succeeds.
+    def Restore(self, project_path : Path, unity_version : str, printer : Printer, indent : str = "") -> tuple[str, str]:
+        keys = self.GetKeys(project_path, unity_version)
+        library_path = project_path.joinpath("Library")
+
+        if library_path.is_dir() and any(library_path.iterdir()):
+            printer.MessageWithContext("Unity Library folder present; not restored from cache: ", f"{library_path}", indent)
+            return keys
+
+        entry_path = self.GetEntryPath(project_path, keys)
+        partial_hit = False
+        if not entry_path.joinpath("Library").is_dir():
+            entry_paths = self.FindEntryPaths(entry_path.parent, "*")
+            entry_path = max(entry_paths, key=lambda path: path.joinpath(UnityLibraryCache.ENTRY_FILE_NAME).stat().st_mtime) if len(entry_paths) > 0 else None
+            partial_hit = entry_path is not None
+
+        if entry_path is None:
+            with self.lock:
+                self.misses += 1
+            printer.MessageWithContext("Unity Library cache miss: ", f"{project_path.name} ({'/'.join(keys)}); Unity will import every asset.", indent)
+            return keys
+
+        if library_path.is_dir():
+            shutil.rmtree(library_path)
+
+        # Marking the entry as used first keeps it from being evicted while it is cloned
+        os.utime(entry_path.joinpath(UnityLibraryCache.ENTRY_FILE_NAME))
+        restore_path = project_path.joinpath(f"Library.restore-{os.getpid()}")
+        shutil.rmtree(restore_path, ignore_errors=True)
+        clone_method = self.CloneTree(entry_path.joinpath("Library"), restore_path)
+        restore_path.rename(library_path)
+
+        with self.lock:
+            if partial_hit:
+                self.partial_hits += 1
+            else:
+                self.hits += 1
+
+        hit_description = "Restored Unity Library from an earlier import of changed assets: " if partial_hit else "Restored Unity Library from cache: "
+        printer.MessageWithContext(hit_description, f"{entry_path} ({clone_method})", indent)
+        return keys
+
+    # Saves a project's Library folder under 'keys', replacing any existing entry, then evicts entries beyond the size budget.
+    def Save(self, project_path : Path, keys : tuple[str, str], printer : Printer, indent : str = "") -> None:
+        library_path = project_path.joinpath("Library")
+        if not library_path.is_dir():
+            return
+
+        entry_path = self.GetEntryPath(project_path, keys)
+        partial_path = entry_path.with_name(f"{entry_path.name}.partial-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(partial_path, ignore_errors=True)
+        partial_path.mkdir(parents=True)
+
+        clone_method = self.CloneTree(library_path, partial_path.joinpath("Library"))
+        entry = {"project" : project_path.name, "keys" : list(keys), "size" : GetTreeSize(partial_path.joinpath("Library")), "saved" : time.time()}
+        partial_path.joinpath(UnityLibraryCache.ENTRY_FILE_NAME).write_text(json.dumps(entry, indent=2))
+
+        with self.lock:
+            if entry_path.exists():
+                shutil.rmtree(entry_path)
+            partial_path.rename(entry_path)
+            self.saves += 1
+
+        printer.MessageWithContext("Saved Unity Library to cache: ", f"{entry_path} ({entry['size'] / (1024 * 1024):.1f} MiB, {clone_method})", indent)
+        self.Evict(entry_path, printer, indent)
+
+    # Removes the least recently used entries, other than 'keep_path', until the cache is within its size budget
+    def Evict(self, keep_path : Path, printer : Printer, indent : str = "") -> None:
+        with self.lock:
+            entries = list()
+            for entry_path in self.FindEntryPaths(self.cache_path, "*/*/*"):
+                entry_file_path = entry_path.joinpath(UnityLibraryCache.ENTRY_FILE_NAME)
+                try:
+                    entries.append((entry_file_path.stat().st_mtime, json.loads(entry_file_path.read_text())["size"], entry_path))
+                except (OSError, ValueError, KeyError):
+                    continue
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, entry_path in sorted(entries, key=lambda entry: entry[0]):
+                if total_size <= self.max_size_bytes:
+                    break
+                if entry_path == keep_path:
+                    continue
+
+                shutil.rmtree(entry_path, ignore_errors=True)
+                total_size -= size
+                self.evicted_entries += 1
+                self.evicted_bytes += size
+                printer.MessageWithContext("Evicted Unity Library cache entry: ", f"{entry_path}", indent)
+
+    def PrintConfiguration(self, printer : Printer) -> None:
+        printer.MessageWithContext("Unity Library cache path: ", f"{self.cache_path} (max size {self.max_size_bytes / (1024 ** 3):.1f} GiB)", printer.Indent(1))
+
+    def PrintSummary(self, printer : Printer) -> None:
+        printer.MessageWithContext("Restored: ", f"{self.hits}", printer.Indent(1))
+        printer.MessageWithContext("Restored from an earlier import of changed assets: ", f"{self.partial_hits}", printer.Indent(1))
+        printer.MessageWithContext("Not cached: ", f"{self.misses}", printer.Indent(1))
+        printer.MessageWithContext("Saved: ", f"{self.saves}", printer.Indent(1))
+        printer.MessageWithContext("Evicted: ", f"{self.evicted_entries} ({self.evicted_bytes / (1024 * 1024):.1f} MiB)", printer.Indent(1))
+        printer.MessageWithContext("Cache size: ", f"{sum(GetTreeSize(entry_path) for entry_path in self.FindEntryPaths(self.cache_path, '*/*/*')) / (1024 * 1024):.1f} MiB", printer.Indent(1))
@@ -0,0 +1,194 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import hashlib, json, os, time
+
+from pathlib import Path
+
+from scripts.python.upi_build_journal import FingerprintTree, HashFile
+from scripts.python.upi_cli_argument_options import ConfigID
+
+# Folders of a plug-in's Xcode project which xcodebuild writes; they are not inputs of its native libraries
+NATIVE_GENERATED_FOLDER_NAMES = ["build", "DerivedData", "xcuserdata"]
+
+# Returns a hash of the native sources of the plug-in at 'plugin_path': everything which can change the native libraries built from it
+def FingerprintNativeSources(plugin_path : Path) -> str:
+    return FingerprintTree(plugin_path.joinpath("Native"), NATIVE_GENERATED_FOLDER_NAMES)
+
+# Returns the total size and the sha256 of the contents of a library, which is a single file (.a) or a bundle folder (.bundle, .framework)
+def MeasureArtifact(artifact_path : Path) -> tuple[int, str]:
+    if not artifact_path.is_dir() or artifact_path.is_symlink():
+        return artifact_path.lstat().st_size, HashFile(artifact_path) if not artifact_path.is_symlink() else hashlib.sha256(os.readlink(artifact_path).encode()).hexdigest()
+
+    size = 0
+    content_hash = hashlib.sha256()
+    for member_path in sorted(artifact_path.rglob("*")):
+        relative_path = member_path.relative_to(artifact_path)
+        if member_path.is_symlink():
+            content_hash.update(f"{relative_path}\0->{os.readlink(member_path)}\n".encode())
+        elif member_path.is_file():
+            size += member_path.stat().st_size
+            content_hash.update(f"{relative_path}\0{HashFile(member_path)}\n".encode())
+    return size, content_hash.hexdigest()
+
+# Returns a hash of the size and modification time of a library's files (See: FingerprintTree)
+def FingerprintArtifact(artifact_path : Path) -> str:
+    if artifact_path.is_dir() and not artifact_path.is_symlink():
+        return FingerprintTree(artifact_path)
+    artifact_stat = artifact_path.lstat()
+    return hashlib.sha256(f"{artifact_stat.st_size}\0{artifact_stat.st_mtime_ns}\n".encode()).hexdigest()
+
+# A library found under NativeLibraries~/<Config>/<Platform>
+class NativeArtifact:
+    def __init__(self, relative_path : str, config : str, platform : str, unity_platform : str, variant : str) -> None:
+        self.relative_path = relative_path # Relative to NativeLibraries~
+        self.config = config
+        self.platform = platform # NativeLibraries~ platform folder name, e.g. iPhoneSimulator
+        self.unity_platform = unity_platform
+        self.variant = variant # UnitySdkVariantID
+
+        self.size = 0
+        self.content_hash = ""
+
+        # Hash of the size and modification time of the library's files, to tell cheaply whether it has changed since (See: FingerprintTree)
+        self.fingerprint = ""
+
+        # Native sources the library was built from (See: FingerprintNativeSources); empty when not known
+        self.inputs_fingerprint = ""
+
+        # Code signing identity hash the library was signed with; empty when unsigned
+        self.signed_identity = ""
+
+    def IsSignable(self) -> bool:
+        return Path(self.relative_path).suffix in [".bundle", ".framework"]
+
+    def ToDict(self) -> dict:
+        return {"path" : self.relative_path, "config" : self.config, "platform" : self.platform, "unity_platform" : self.unity_platform, "variant" : self.variant,
+                "size" : self.size, "sha256" : self.content_hash, "fingerprint" : self.fingerprint, "inputs_fingerprint" : self.inputs_fingerprint, "signed_identity" : self.signed_identity}
+
+    @staticmethod
+    def FromDict(data : dict) -> 'NativeArtifact':
+        artifact = NativeArtifact(data["path"], data["config"], data["platform"], data["unity_platform"], data["variant"])
+        artifact.size = data.get("size", 0)
+        artifact.content_hash = data.get("sha256", "")
+        artifact.fingerprint = data.get("fingerprint", "")
+        artifact.inputs_fingerprint = data.get("inputs_fingerprint", "")
+        artifact.signed_identity = data.get("signed_identity", "")
+        return artifact
+
+# Every library the build stage produced for one plug-in, written to '<output path>/NativeManifests/<plug-in id>.json' (See: NativeUnityPluginManager.ProcessNativeUnityPlugin)
+#   NativeLibraries~ is walked once, by Scan. Signing, the test builds and packing then read the manifest instead of walking the folder again, and --status
+#   compares it with the native sources and the libraries on disk without building anything (See: GetStaleOutputs).
+class NativeOutputManifest:
+    FOLDER_NAME = "NativeManifests"
+
+    def __init__(self, plugin_id : str, native_library_path : Path) -> None:
+        self.plugin_id = plugin_id
+        self.native_library_path = native_library_path
+        self.artifacts : list[NativeArtifact] = list()
+        self.updated = 0.0
+
+        # Folders Scan found under NativeLibraries~ which are not a known config or platform
+        self.unknown_paths : list[Path] = list()
+
+    @staticmethod
+    def GetManifestPath(output_path : Path, plugin_id : str) -> Path:
+        return output_path.joinpath(NativeOutputManifest.FOLDER_NAME, f"{plugin_id}.json")
+
+    # Lists the libraries in 'native_library_path'. Sizes and hashes are filled in by Measure, once the libraries have been signed.
+    #   'platform_name_table' maps each platform folder name to its Unity platform and SDK variant.
+    @staticmethod
+    def Scan(plugin_id : str, native_library_path : Path, platform_name_table : dict[str, tuple[str, str]]) -> 'NativeOutputManifest':
+        manifest = NativeOutputManifest(plugin_id, native_library_path)
+        for config_path in sorted(native_library_path.iterdir()):
+            if not config_path.is_dir():
+                continue
+            if config_path.name not in [ConfigID.RELEASE, ConfigID.DEBUG]:
+                manifest.unknown_paths.append(config_path)
+                continue
+            for platform_path in sorted(config_path.iterdir()):
+                if not platform_path.is_dir():
+                    continue
+                if platform_path.name not in platform_name_table:
+                    manifest.unknown_paths.append(platform_path)
+                    continue
+                unity_platform, variant = platform_name_table[platform_path.name]
+                for artifact_path in sorted(platform_path.iterdir()):
+                    manifest.artifacts.append(NativeArtifact(f"{artifact_path.relative_to(native_library_path)}", config_path.name, platform_path.name, unity_platform, variant))
+        return manifest
+
+    @staticmethod
+    def Load(manifest_path : Path) -> 'NativeOutputManifest':
+        try:
+            manifest_data = json.loads(manifest_path.read_text())
+        except (OSError, ValueError):
+            return None
+
+        manifest = NativeOutputManifest(manifest_data["plugin_id"], Path(manifest_data["native_library_path"]))
+        manifest.artifacts = [NativeArtifact.FromDict(artifact_data) for artifact_data in manifest_data.get("artifacts", list())]
+        manifest.updated = manifest_data.get("updated", 0.0)
+        return manifest
+
+    def Save(self, manifest_path : Path) -> None:
+        self.updated = time.time()
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = manifest_path.with_name(f"{manifest_path.name}.tmp")
+        temporary_path.write_text(json.dumps({"plugin_id" : self.plugin_id, "native_library_path" : f"{self.native_library_path}", "updated" : self.updated,
+                                              "artifacts" : [artifact.ToDict() for artifact in self.artifacts]}, indent=2) + "\n")
+        os.replace(temporary_path, manifest_path)
+
+    def GetArtifactPath(self, artifact : NativeArtifact) -> Path:
+        return self.native_library_path.joinpath(artifact.relative_path)
+
+    # Returns {config: {platform folder name: path}} for every platform folder holding at least one library
+    def GetPlatformPaths(self) -> dict[str, dict[str, Path]]:
+        platform_paths = dict()
+        for artifact in self.artifacts:
+            platform_paths.setdefault(artifact.config, dict())[artifact.platform] = self.native_library_path.joinpath(artifact.config, artifact.platform)
+        return platform_paths
+
+    # Records the size, content hash and fingerprint of every library. Libraries in 'built_outputs', as (platform folder name, config), were built from the native
+    # sources with 'inputs_fingerprint'. The others keep the inputs and signing identity recorded in 'previous_manifest', if they are unchanged since.
+    def Measure(self, built_outputs : list[tuple[str, str]], inputs_fingerprint : str, previous_manifest : 'NativeOutputManifest') -> None:
+        previous_artifacts = {artifact.relative_path : artifact for artifact in previous_manifest.artifacts} if previous_manifest is not None else dict()
+        for artifact in self.artifacts:
+            artifact_path = self.GetArtifactPath(artifact)
+            artifact.size, artifact.content_hash = MeasureArtifact(artifact_path)
+            artifact.fingerprint = FingerprintArtifact(artifact_path)
+
+            previous_artifact = previous_artifacts.get(artifact.relative_path)
+            if (artifact.platform, artifact.config) in built_outputs:
+                artifact.inputs_fingerprint = inputs_fingerprint
+            elif previous_artifact is not None and previous_artifact.content_hash == artifact.content_hash:
+                artifact.inputs_fingerprint = previous_artifact.inputs_fingerprint
+                if len(artifact.signed_identity) == 0:
+                    artifact.signed_identity = previous_artifact.signed_identity
+
+    # Returns the libraries which changed on disk, or went missing, since the manifest was written
+    def GetChangedArtifacts(self) -> list[NativeArtifact]:
+        changed_artifacts = list()
+        for artifact in self.artifacts:
+            artifact_path = self.GetArtifactPath(artifact)
+            if not artifact_path.exists():
+                changed_artifacts.append(artifact)
+            elif artifact.fingerprint != FingerprintArtifact(artifact_path):
+                changed_artifacts.append(artifact)
+        return changed_artifacts
+
+    # Returns a list of (output, reason) for each output a build of 'selected_outputs', as (platform folder name, config), from the plug-in at 'plugin_path' would
+    # change: libraries built from other native sources or changed since, and selected outputs without a library. Only file sizes and modification times are read.
+    def GetStaleOutputs(self, plugin_path : Path, selected_outputs : list[tuple[str, str]]) -> list[tuple[str, str]]:
+        stale_outputs = list()
+        inputs_fingerprint = FingerprintNativeSources(plugin_path)
+        changed_artifacts = self.GetChangedArtifacts()
+        for artifact in [artifact for artifact in self.artifacts if (artifact.platform, artifact.config) in selected_outputs]:
+            if artifact in changed_artifacts:
+                stale_outputs.append((artifact.relative_path, "missing" if not self.GetArtifactPath(artifact).exists() else "changed since it was built"))
+            elif artifact.inputs_fingerprint != inputs_fingerprint:
+                stale_outputs.append((artifact.relative_path, "native sources changed since it was built" if len(artifact.inputs_fingerprint) > 0 else "built from unknown native sources"))
+
+        built_outputs = {(artifact.platform, artifact.config) for artifact in self.artifacts}
+        for platform, config in selected_outputs:
+            if (platform, config) not in built_outputs:
+                stale_outputs.append((f"{config}/{platform}", "not built"))
+        return stale_outputs
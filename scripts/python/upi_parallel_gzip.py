@@ -0,0 +1,70 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import os, struct, time, zlib
+
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# gzip member header: magic, deflate, no flags, no modification time (so the same input always gives the same package), no extra flags, Unix
+GZIP_HEADER = bytes([0x1f, 0x8b, 0x08, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x03])
+
+# Size of the deflate window; each block is primed with this much of the data before it
+DICTIONARY_SIZE = 32 * 1024
+
+# Compresses one block of a deflate stream.
+#   'dictionary' is the data which precedes the block, so matches can reach back across the block boundary as they would in a single-threaded stream.
+#   Every block but the last ends with a sync flush, which byte-aligns it without ending the stream, so the compressed blocks can simply be concatenated.
+def CompressBlock(data : bytes, dictionary : bytes, last : bool, level : int) -> bytes:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary) if len(dictionary) > 0 else zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+# Compresses files to gzip on several cores, in the manner of pigz.
+#   The input is split into fixed size blocks which are deflated concurrently, each primed with the end of the block before it, and written in order as a single
+#   standard gzip member that any gzip reader, including the Unity Package Manager, can read. The output depends only on the input, level and block size,
+#   not on the number of jobs.
+#
+#   zlib releases the interpreter lock while it compresses, so worker threads run on separate cores without the cost of passing blocks between processes.
+class ParallelGzip:
+    DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+    def __init__(self, level : int = 6, jobs : int = 0, block_size : int = DEFAULT_BLOCK_SIZE) -> None:
+        self.level = level
+        self.jobs = jobs if jobs > 0 else (os.cpu_count() or 1)
+        self.block_size = block_size
+
+    # Compresses 'source_path' into 'destination_path'.
+    # Returns (uncompressed bytes, compressed bytes, seconds taken)
+    def CompressFile(self, source_path : Path, destination_path : Path) -> tuple[int, int, float]:
+        start_time = time.perf_counter()
+        crc = 0
+        size = 0
+
+        with open(source_path, "rb") as source_file, open(destination_path, "wb") as destination_file, ThreadPoolExecutor(self.jobs, thread_name_prefix="gzip") as pool:
+            destination_file.write(GZIP_HEADER)
+
+            # Enough blocks are kept in flight to occupy every worker while finished blocks are written out in order
+            pending_blocks = deque()
+            dictionary = b""
+            block = source_file.read(self.block_size)
+            while True:
+                next_block = source_file.read(self.block_size)
+                last = len(next_block) == 0
+
+                pending_blocks.append(pool.submit(CompressBlock, block, dictionary, last, self.level))
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+                dictionary = block[-DICTIONARY_SIZE:] if len(block) >= DICTIONARY_SIZE else (dictionary + block)[-DICTIONARY_SIZE:]
+
+                while len(pending_blocks) > 0 and (last or len(pending_blocks) > 2 * self.jobs):
+                    destination_file.write(pending_blocks.popleft().result())
+
+                if last:
+                    break
+                block = next_block
+
+            destination_file.write(struct.pack("<II", crc, size & 0xffffffff))
+            compressed_size = destination_file.tell()
+
+        return size, compressed_size, time.perf_counter() - start_time
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import os, shutil, stat, time
+
+from pathlib import Path
+
+from scripts.python.upi_change_selection import BUILD_OUTPUT_FOLDER_NAMES
+from scripts.python.upi_utility import Printer
+
+# Returns "link", "folder" or "file" for a directory entry, without following symbolic links
+def GetEntryKind(entry : os.DirEntry) -> str:
+    if entry.is_symlink():
+        return "link"
+    return "folder" if entry.is_dir() else "file"
+
+def RemovePath(path : Path) -> None:
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+# Copy of the checkout's plug-ins which an out-of-tree build (--out-of-tree) writes to instead of the checkout, so the checkout can be read-only and shared by
+# builds of several configurations at once. Native libraries, test players, Unity's Library and the other generated folders (See: BUILD_OUTPUT_FOLDER_NAMES) are
+# written into the copy, on top of the sources; packages, test builds and caches are written elsewhere under the output root.
+#   Sync() brings the copy up to date with the checkout before each build. Files whose size or modification time differ are copied again and files the checkout no
+#   longer has are removed. Generated folders are left alone, so later builds from the same output root reuse them.
+class SourceOverlay:
+    # Folders of the checkout which are copied
+    COPIED_FOLDER_NAMES = ["plug-ins"]
+
+    # Folders of the checkout which are linked rather than copied; the build only reads them. The plug-ins' Xcode projects run scripts/shell (See: AUP_SHELL_SCRIPT_PATH)
+    LINKED_FOLDER_NAMES = ["scripts"]
+
+    def __init__(self, source_root : Path, output_root : Path) -> None:
+        self.source_root = source_root
+        self.output_root = output_root
+        self.work_root = output_root.joinpath("Sources")
+        self.plugin_root = self.work_root.joinpath("plug-ins")
+
+        # Outcome of the last Sync
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self.unchanged_files = 0
+        self.removed_paths = 0
+        self.sync_time = 0.0
+
+    def Sync(self) -> None:
+        start_time = time.monotonic()
+        self.copied_files = self.copied_bytes = self.unchanged_files = self.removed_paths = 0
+
+        self.work_root.mkdir(parents=True, exist_ok=True)
+        for folder_name in SourceOverlay.LINKED_FOLDER_NAMES:
+            link_path = self.work_root.joinpath(folder_name)
+            if not link_path.is_symlink() or link_path.readlink() != self.source_root.joinpath(folder_name):
+                RemovePath(link_path)
+                link_path.symlink_to(self.source_root.joinpath(folder_name), target_is_directory=True)
+
+        for folder_name in SourceOverlay.COPIED_FOLDER_NAMES:
+            self.SyncFolder(self.source_root.joinpath(folder_name), self.work_root.joinpath(folder_name))
+
+        self.sync_time = time.monotonic() - start_time
+
+    # Mirrors 'source_path' into 'copy_path', leaving the generated folders of both alone
+    def SyncFolder(self, source_path : Path, copy_path : Path) -> None:
+        copy_path.mkdir(exist_ok=True)
+        source_entries = {entry.name : entry for entry in os.scandir(source_path) if entry.name not in BUILD_OUTPUT_FOLDER_NAMES}
+
+        for copy_entry in os.scandir(copy_path):
+            if copy_entry.name in BUILD_OUTPUT_FOLDER_NAMES:
+                continue
+            source_entry = source_entries.get(copy_entry.name)
+            if source_entry is None or GetEntryKind(source_entry) != GetEntryKind(copy_entry):
+                RemovePath(Path(copy_entry.path))
+                self.removed_paths += 1
+
+        for name, source_entry in source_entries.items():
+            target_path = copy_path.joinpath(name)
+            source_kind = GetEntryKind(source_entry)
+            if source_kind == "folder":
+                self.SyncFolder(Path(source_entry.path), target_path)
+            elif source_kind == "link":
+                if not target_path.is_symlink() or os.readlink(target_path) != os.readlink(source_entry.path):
+                    target_path.unlink(missing_ok=True)
+                    target_path.symlink_to(os.readlink(source_entry.path))
+                    self.copied_files += 1
+                else:
+                    self.unchanged_files += 1
+            else:
+                source_stat = source_entry.stat()
+                target_stat = target_path.stat() if target_path.exists() else None
+                if target_stat is not None and target_stat.st_size == source_stat.st_size and target_stat.st_mtime_ns == source_stat.st_mtime_ns:
+                    self.unchanged_files += 1
+                    continue
+
+                # The copy keeps the file's modification time, to be found unchanged next time, but is writable even when the checkout is not
+                target_path.unlink(missing_ok=True)
+                shutil.copy2(source_entry.path, target_path)
+                target_path.chmod(stat.S_IMODE(source_stat.st_mode) | stat.S_IWUSR)
+                self.copied_files += 1
+                self.copied_bytes += source_stat.st_size
+
+    def PrintConfiguration(self, printer : Printer) -> None:
+        printer.MessageWithContext("Checkout: ", f"{self.source_root} (read only)", printer.Indent(1))
+        printer.MessageWithContext("Output root: ", f"{self.output_root}", printer.Indent(1))
+        printer.MessageWithContext("Plug-in sources built from: ", f"{self.plugin_root}", printer.Indent(1))
+
+    def PrintSync(self, printer : Printer) -> None:
+        printer.MessageWithContext("Copied: ", f"{self.copied_files} file(s) ({self.copied_bytes / (1024 * 1024):.1f} MiB)", printer.Indent(1))
+        printer.MessageWithContext("Unchanged: ", f"{self.unchanged_files} file(s)", printer.Indent(1))
+        printer.MessageWithContext("Removed: ", f"{self.removed_paths} file(s) or folder(s) no longer in the checkout", printer.Indent(1))
+        printer.MessageWithContext("Sync time: ", f"{self.sync_time:.2f}s", printer.Indent(1))
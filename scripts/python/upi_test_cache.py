@@ -0,0 +1,126 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import hashlib, json, os, shutil, threading, time
+
+from pathlib import Path
+
+from scripts.python.upi_assembly_graph import GetAssemblySources, GetProjectFilePaths, SCRIPT_FILE_SUFFIXES
+from scripts.python.upi_build_journal import HashFile
+from scripts.python.upi_utility import Printer
+
+# Returns the folders of the local packages ('file:' dependencies) listed in a Unity project's Packages/manifest.json
+def GetLocalPackagePaths(project_path : Path) -> list[Path]:
+    manifest_path = project_path.joinpath("Packages", "manifest.json")
+    if not manifest_path.is_file():
+        return list()
+
+    package_paths = list()
+    for package_reference in json.loads(manifest_path.read_text()).get("dependencies", dict()).values():
+        if isinstance(package_reference, str) and package_reference.startswith("file:"):
+            package_path = project_path.joinpath("Packages", package_reference[len("file:"):]).resolve()
+            if package_path.is_dir():
+                package_paths.append(package_path)
+    return package_paths
+
+# Returns a hash of the contents of every file in the 'NativeLibraries~' folders under 'root' whose platform folder is named in 'native_folder_names'
+def HashNativeLibraries(root : Path, native_folder_names : list[str]) -> str:
+    native_hash = hashlib.sha256()
+    for native_library_root in sorted(root.glob("**/NativeLibraries~")):
+        for platform_path in sorted(path for path in native_library_root.glob("*/*") if path.is_dir() and path.name in native_folder_names):
+            for folder_path, folder_names, file_names in os.walk(platform_path):
+                folder_names.sort()
+                for file_name in sorted(file_names):
+                    file_path = Path(folder_path, file_name)
+                    if file_path.is_file() and not file_path.is_symlink():
+                        native_hash.update(f"{file_path.relative_to(root)}\0{HashFile(file_path)}\n".encode())
+    return native_hash.hexdigest()
+
+# Local record of Unity test runs which passed, so that a test build whose inputs are unchanged is reported as a cached pass instead of being run again.
+#   Each entry is keyed by the Unity version, the test platform and variant, the test assemblies, the project's settings and package manifest, the script sources of
+#   every assembly in the project and its local packages (grouped by assembly), the other assets of the project and its local packages, which test players bundle
+#   (scenes, prefabs, Resources, StreamingAssets and .meta files), and the contents of the native libraries the platform loads. The Unity log of the
+#   passing run is kept with the entry, so the report of a cached pass can link to it after the test build folder itself is gone.
+#
+#   The newest few entries are kept for each project, platform and variant; older ones are removed as new passes are saved.
+class TestResultCache:
+    ENTRY_FILE_NAME = "entry.json"
+    ENTRIES_PER_COMBINATION = 4
+
+    def __init__(self, cache_path : Path) -> None:
+        self.cache_path = cache_path
+
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saves = 0
+
+    # Returns the key of a test run of the Unity project at 'project_path'.
+    #   'native_folder_names' are the NativeLibraries~ platform folders used by the test platform and by the Editor which builds it.
+    def GetKey(self, project_path : Path, unity_version : str, test_platform : str, variant : str, test_assemblies : list[str], native_folder_names : list[str]) -> str:
+        key_hash = hashlib.sha256(f"{unity_version}\0{test_platform}\0{variant}\0{';'.join(sorted(test_assemblies))}\n".encode())
+
+        settings_paths = [project_path.joinpath("Packages", "manifest.json"), project_path.joinpath("Packages", "packages-lock.json")] + sorted(project_path.joinpath("ProjectSettings").glob("*.asset"))
+        for settings_path in settings_paths:
+            if settings_path.is_file():
+                key_hash.update(f"{settings_path.relative_to(project_path)}\0{HashFile(settings_path)}\n".encode())
+
+        for source_root in [project_path.joinpath("Assets")] + GetLocalPackagePaths(project_path):
+            for assembly_name, source_paths in sorted(GetAssemblySources(source_root).items()):
+                key_hash.update(f"{assembly_name}\n".encode())
+                for source_path in source_paths:
+                    key_hash.update(f"{source_path.relative_to(source_root)}\0{HashFile(source_path)}\n".encode())
+            for asset_path in [path for path in GetProjectFilePaths(source_root) if path.suffix not in SCRIPT_FILE_SUFFIXES]:
+                key_hash.update(f"{asset_path.relative_to(source_root)}\0{HashFile(asset_path)}\n".encode())
+            key_hash.update(HashNativeLibraries(source_root, native_folder_names).encode())
+
+        return key_hash.hexdigest()[:16]
+
+    def GetEntryPath(self, project_path : Path, test_platform : str, variant : str, key : str) -> Path:
+        return self.cache_path.joinpath(project_path.name, f"{test_platform}_{variant}", key)
+
+    # Returns the entry recorded for a passing run with 'key', or None
+    def Lookup(self, project_path : Path, test_platform : str, variant : str, key : str) -> dict:
+        entry_file_path = self.GetEntryPath(project_path, test_platform, variant, key).joinpath(TestResultCache.ENTRY_FILE_NAME)
+        try:
+            entry = json.loads(entry_file_path.read_text())
+        except (OSError, ValueError):
+            entry = None
+
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    # Records a passing run with 'key', keeping a copy of its Unity log
+    def Save(self, project_path : Path, test_platform : str, variant : str, key : str, log_path : Path, test_build_path : Path, printer : Printer, indent : str = "") -> None:
+        entry_path = self.GetEntryPath(project_path, test_platform, variant, key)
+        entry_path.mkdir(parents=True, exist_ok=True)
+
+        cached_log_path = entry_path.joinpath(log_path.name)
+        if log_path.is_file():
+            shutil.copy2(log_path, cached_log_path)
+
+        entry = {"key" : key, "project" : project_path.name, "platform" : test_platform, "variant" : variant, "log" : f"{cached_log_path}", "original_log" : f"{log_path}", "test_build" : f"{test_build_path}", "time" : time.time()}
+        partial_file_path = entry_path.joinpath(f"{TestResultCache.ENTRY_FILE_NAME}.partial")
+        partial_file_path.write_text(json.dumps(entry, indent=2))
+        partial_file_path.replace(entry_path.joinpath(TestResultCache.ENTRY_FILE_NAME))
+
+        # Older passes of the same combination are only hit again if its inputs revert, so only a few are kept
+        entry_paths = sorted((path for path in entry_path.parent.iterdir() if path.joinpath(TestResultCache.ENTRY_FILE_NAME).is_file()), key=lambda path: path.joinpath(TestResultCache.ENTRY_FILE_NAME).stat().st_mtime, reverse=True)
+        for old_entry_path in entry_paths[TestResultCache.ENTRIES_PER_COMBINATION:]:
+            shutil.rmtree(old_entry_path, ignore_errors=True)
+
+        with self.lock:
+            self.saves += 1
+        printer.MessageWithContext("Saved passing test run to cache: ", f"{entry_path}", indent)
+
+    def PrintConfiguration(self, printer : Printer) -> None:
+        printer.MessageWithContext("Test result cache path: ", f"{self.cache_path}", printer.Indent(1))
+
+    def PrintSummary(self, printer : Printer) -> None:
+        printer.MessageWithContext("Cached passes: ", f"{self.hits}", printer.Indent(1))
+        printer.MessageWithContext("Run: ", f"{self.misses}", printer.Indent(1))
+        printer.MessageWithContext("Saved: ", f"{self.saves}", printer.Indent(1))
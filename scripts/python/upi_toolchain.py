@@ -10,12 +10,19 @@ from scripts.python.upi_cli_argument_options import PlatformID
 #--------------
 # Build Helpers
 
+# Commands which query the toolchain; each is parsed by the matching Parse function below
+TOOLCHAIN_VERSION_COMMAND = ["xcodebuild", "-version"]
+SDK_VERSION_COMMAND = ["xcodebuild", "-sdk", "-version"]
+CODESIGN_IDENTITY_COMMAND = ["security", "find-identity", "-v", "-p", "codesigning"]
+
 # Invokes 'xcodebuild -version' and parses output for the associated Xcode version and build number
 def GetToolchainVersions() -> tuple[str, str]:
+    return ParseToolchainVersions(utility.RunCommand(TOOLCHAIN_VERSION_COMMAND).stdout)
+
+def ParseToolchainVersions(version_output : str) -> tuple[str, str]:
     xcode_version = ""
     build_number = ""
-    version_output = utility.RunCommand(["xcodebuild", "-version"])
-    output_lines = version_output.stdout.split('\n')
+    output_lines = version_output.split('\n')
     for line in output_lines:
         if line.startswith("Xcode"):
             xcode_version = line.split(' ')[1]
@@ -27,10 +34,12 @@ def GetToolchainVersions() -> tuple[str, str]:
 # Invokes 'xcodebuild -sdk -version' and searches the results for known SDK platform folder names.
 # Returns a list of PlatformID representing the currently installed Apple platform SDKs
 def GetSupportedPlatformList() -> list[str]:
+    return ParseSupportedPlatformList(utility.RunCommand(SDK_VERSION_COMMAND).stdout)
+
+def ParseSupportedPlatformList(sdk_version_output : str) -> list[str]:
     # Use a set to ensure entries are unique; duplicates are possible. Ordering isn't important.
     result = set()
-    sdk_version_output = utility.RunCommand(["xcodebuild", "-sdk", "-version"])
-    output_lines = sdk_version_output.stdout.split('\n')
+    output_lines = sdk_version_output.split('\n')
     
     for line in output_lines:
         if "iPhoneOS.platform" in line:
@@ -76,8 +85,10 @@ def GetSupportedPlatformList() -> list[str]:
 #
 # Organizing the output dictionary in this manner provides an easy means of listing the full identity and retreiving just the hash without further parsing.
 def GetCodesignIdentities() -> dict[str, str]:
-    security_command_output = utility.RunCommand(["security", "find-identity", "-v", "-p",  "codesigning"])
-    output_lines = security_command_output.stdout.strip().split("\n")
+    return ParseCodesignIdentities(utility.RunCommand(CODESIGN_IDENTITY_COMMAND).stdout)
+
+def ParseCodesignIdentities(security_command_output : str) -> dict[str, str]:
+    output_lines = security_command_output.strip().split("\n")
         
     codesign_identity_table = dict()
     num_lines = len(output_lines)
@@ -100,7 +111,8 @@ def GetCodesignIdentities() -> dict[str, str]:
 
 # Performs codesigning on supplied object, such as a .framework or .bundle, using the supplied codesign identity hash.
 #   See: GetCodesignIdentities for querying codesign identities on the system.
-def Codesign(printer : Printer, signable_object_path : str, hash : str, logWithContext : Callable[[str, str], None] = None) -> bool:
+#   Optional 'limits' apply a watchdog and retries to the codesign command. (See: utility.CommandLimits)
+def Codesign(printer : Printer, signable_object_path : str, hash : str, logWithContext : Callable[[str, str], None] = None, limits : utility.CommandLimits = None) -> bool:
     codesign_command = ["codesign", "--force", "--sign", hash, "--timestamp=none", "--preserve-metadata=identifier,entitlements,flags", "--generate-entitlement-der", f"{signable_object_path}"]
     
     if logWithContext == None:
@@ -110,9 +122,9 @@ def Codesign(printer : Printer, signable_object_path : str, hash : str, logWithC
         logWithContext("Target object: ", signable_object_path)
         logWithContext("Codesign command: ", f"{' '.join(codesign_command)}")
 
-    codesign_command_output = utility.RunCommand(codesign_command)
+    codesign_command_output = utility.RunCommand(codesign_command, limits=limits, printer=printer)
     if codesign_command_output.returncode != 0:
-        printer.ErrorMessage("Failed to perform codesign.")
+        printer.ErrorMessage(f"Failed to perform codesign{f' ({codesign_command_output.timed_out})' if len(codesign_command_output.timed_out) > 0 else ''}.")
         printer.Message("Command Response:" 
                         f"\n{codesign_command_output.stdout}")
         return False
@@ -120,13 +132,15 @@ def Codesign(printer : Printer, signable_object_path : str, hash : str, logWithC
         return True
     
 # Method prompts the user before identifying a codesign identity to use for signing newly compiled native plug-in libraries
-def PromptForCodesignIdentity(printer : Printer) -> str:
+#   'codesign_identities' are those already queried with GetCodesignIdentities, if any; otherwise they are queried once the user opts in.
+def PromptForCodesignIdentity(printer : Printer, codesign_identities : dict[str, str] = None) -> str:
     if not utility.BooleanPrompt(printer, "Would you like the script to code sign the compiled native plug-in libraries?"):
         printer.Message("User opted out of code signing.")
         printer.Message(f"For more information about code signing, please see: {Printer.Bold('https://developer.apple.com/library/archive/documentation/Security/Conceptual/CodeSigningGuide/Introduction/Introduction.html')}", printer.Indent(1))
         return ""
     
-    codesign_identities = GetCodesignIdentities()
+    if codesign_identities is None:
+        codesign_identities = GetCodesignIdentities()
     if len(codesign_identities) == 0:
         printer.WarningMessage("No codesign identities found.")
         printer.Message(f"For more information about code signing, please see: {Printer.Bold('https://developer.apple.com/library/archive/documentation/Security/Conceptual/CodeSigningGuide/Introduction/Introduction.html')}", printer.Indent(1))
@@ -1,26 +1,56 @@
 #! /usr/bin/env python3
 # Requirements: python3
 
-import os, shutil, json
+import hashlib, os, shutil, json, threading
 
 import scripts.python.upi_utility as utility
 import scripts.python.upi_toolchain as toolchain
 
-from scripts.python.upi_cli_argument_options import ConfigID
+from scripts.python.upi_cli_argument_options import ConfigID, CommandTypeID, PlatformID
 
 from pathlib import Path
 from collections.abc import Callable
 
 from scripts.python.upi_build_context import BuildContext
+from scripts.python.upi_build_history import BuildStepID
+from scripts.python.upi_job_scheduler import StagePipeline, PipelineTask
+from scripts.python.upi_build_journal import FingerprintTree
+from scripts.python.upi_native_manifest import NativeOutputManifest, FingerprintNativeSources
+from scripts.python.upi_build_shards import ShardJob
+from scripts.python.upi_assembly_graph import AssemblyGraph
+from scripts.python.upi_test_cache import GetLocalPackagePaths
+from scripts.python.upi_editmode_tests import EditModeTestResult, SyncProjectClone
+from scripts.python.upi_unity_worker_pool import UnityWorkerCommandID, WORKER_FOLDER_NAME
 from scripts.python.upi_utility import Printer
 
-CTX : BuildContext = None
+# Folders in a Unity project which Unity, or this script, writes to while processing the project. The Unity worker's scripts are installed in Assets only while
+# a worker has the project open, so they must not change the stage inputs (See: GetStageInputsHash).
+UNITY_GENERATED_FOLDER_NAMES = ["Library", "Temp", "Logs", "obj", "UserSettings", "TestPlayers", WORKER_FOLDER_NAME]
 
 # Unity tracks Sim/Device separately from BuildTarget
 class UnitySdkVariantID:
     DEVICE = "Device"
     SIMULATOR = "Simulator"
 
+# Stages each plug-in moves through in RunPipeline
+class PipelineStageID:
+    BUILD = "build"
+    TOUCH = "touch"
+    TEST = "test"
+    EDIT_MODE_CLONE = "editmode_clone"
+    EDIT_MODE_TEST = "editmode_test"
+    PACK = "pack"
+    UNLOCK = "unlock"
+
+# Maps each NativeLibraries~ platform folder to the Unity platform and SDK variant it is loaded by
+UNITY_PLATFORM_NAME_TABLE = {"iOS":("iOS", UnitySdkVariantID.DEVICE),
+                             "iPhoneSimulator":("iOS", UnitySdkVariantID.SIMULATOR),
+                             "tvOS":("tvOS", UnitySdkVariantID.DEVICE),
+                             "AppleTVSimulator":("tvOS",UnitySdkVariantID.SIMULATOR),
+                             "macOS":("StandaloneOSX", UnitySdkVariantID.DEVICE),
+                             "visionOS":("VisionOS", UnitySdkVariantID.DEVICE),
+                             "VisionSimulator":("VisionOS", UnitySdkVariantID.SIMULATOR)}
+
 # Represents an individual Unity project at a given path. This path is equivalent to the path that would be opened by the Unity Editor.
 class UnityProject:
     unknown_unity_project_version_string = "Unknown"
@@ -33,6 +63,16 @@ class UnityProject:
         self.test_assemblies : list[str] = list()
         self.editor_test_assemblies : list[str] = list()
 
+# Runs a one-shot Unity command under the Unity watchdog limits, with 'watch_path' as its log.
+#   When license seats are shared by the builds on the host (See: --unity-seats), the command first waits for a seat, described to other waiters by 'holder'. Idle Unity
+#   workers of this build give up their seats to it.
+def RunUnityCommand(ctx : BuildContext, command : list[str], watch_path : Path, holder : str) -> utility.CommandResult:
+    if ctx.unity_seats is None:
+        return utility.RunCommand(command, limits=ctx.command_limits[CommandTypeID.UNITY], watch_path=watch_path, printer=ctx.printer)
+
+    with ctx.unity_seats.Acquire(holder, on_wait=ctx.unity_workers.StopIdleWorkers if ctx.unity_workers is not None else None, printer=ctx.printer, indent=ctx.printer.Indent(2)):
+        return utility.RunCommand(command, limits=ctx.command_limits[CommandTypeID.UNITY], watch_path=watch_path, printer=ctx.printer)
+
 # Tracks important paths and version information for a given Unity installation
 class UnityInstallation:
     def __init__(self, app_path : Path, exe_path : Path, unity_version : str) -> None:
@@ -43,20 +83,76 @@ class UnityInstallation:
     # This method uses this Unity installation to open a passed project in batch mode and immediately close in order to do the following:
     #   - Create/Update .meta files within the project
     #   - If the project version doesn't match this installation's version, opening will attempt to update the project to match the installation's version
-    def TouchProject(self, unity_project : UnityProject, logWithContext : Callable[[str, str], None] = lambda m, c: CTX.printer.MessageWithContext(m, c)) -> bool:
-        unity_command = [f"{self.executable_path}", "-batchmode", "-nographics", "-projectPath", f"{unity_project.path}", "-quit"]
+    # With the Unity worker pool, the project is opened by a worker which stays open for the test builds that follow.
+    def TouchProject(self, ctx : BuildContext, unity_project : UnityProject, logWithContext : Callable[[str, str], None] = None) -> bool:
+        logWithContext = logWithContext if logWithContext is not None else ctx.printer.MessageWithContext
+
+        # Unity writes to a log file rather than stdout in batch mode; the watchdog treats growth of this log as activity.
+        unity_log_path = unity_project.path.joinpath("Logs", "upi_touch_project.log")
+        unity_command = [f"{self.executable_path}", "-batchmode", "-nographics", "-projectPath", f"{unity_project.path}", "-logFile", f"{unity_log_path}", "-quit"]
         
-        logWithContext(f"Unity project path: ", f"{unity_project.path}")
-        logWithContext(f"Unity touch command: ", f"{' '.join(unity_command)}")
+        logWithContext("Unity project path: ", f"{unity_project.path}")
+        logWithContext("Unity touch command: ", f"{' '.join(unity_command)}")
+
+        library_cache_keys = ctx.library_cache.Restore(unity_project.path, self.version, ctx.printer, ctx.printer.Indent(2)) if ctx.library_cache is not None else None
         
-        command_output = utility.RunCommand(unity_command)
+        with ctx.admission.Admit(CommandTypeID.UNITY):
+            step_record = ctx.history.BeginStep(BuildStepID.TOUCH_PROJECT, unity_project.path.parent.name[len("Apple."):], unity_version=self.version)
+            command_output = None
+            if ctx.unity_workers is not None:
+                command_output = ctx.unity_workers.Run(self.executable_path, unity_project.path, self.version, [{"command" : UnityWorkerCommandID.TOUCH}], unity_log_path, ctx.printer, ctx.printer.Indent(2))
+            if command_output is None:
+                command_output = RunUnityCommand(ctx, unity_command, unity_log_path, f"touch {unity_project.path.name}")
+            ctx.history.EndStep(step_record, command_output.returncode == 0)
+
+        # A worker still has the project open; its Library folder is saved once the test builds have released it (See: BuildPluginTests)
+        if library_cache_keys is not None and command_output.returncode == 0 and (ctx.unity_workers is None or not ctx.unity_workers.IsRunning(unity_project.path)):
+            ctx.library_cache.Save(unity_project.path, library_cache_keys, ctx.printer, ctx.printer.Indent(2))
         
+        if len(command_output.timed_out) > 0:
+            ctx.printer.WarningMessage(f"Updating Unity project was stopped by the watchdog ({command_output.timed_out}) after {command_output.attempts} attempt(s).\nCheck Unity log for details: {unity_log_path}")
+            return False
+
         if command_output.returncode != 0:
-            CTX.printer.WarningMessage(f"Updating Unity project completed with non-zero return code.\n\nSTDOUT:\n{command_output.stdout}")
+            ctx.printer.WarningMessage(f"Updating Unity project completed with non-zero return code.\n\nSTDOUT:\n{command_output.stdout}\nCheck Unity log for details: {unity_log_path}")
             return False
         
         return True
 
+# Reads the NATIVE_LIBRARY_ROOT_FOLDER_NAME build setting from the xcconfig files in a plug-in's native project folder.
+#   This is the folder under the Unity project's /Assets folder which holds NativeLibraries~ (See: scripts/shell/copy_native_libraries.sh)
+def GetNativeLibraryRootFolderName(native_project_path : Path) -> str:
+    for xcconfig_path in sorted(native_project_path.glob("*.xcconfig")):
+        for line in xcconfig_path.read_text().splitlines():
+            if line.startswith("NATIVE_LIBRARY_ROOT_FOLDER_NAME="):
+                return line.split('=', 1)[1].strip()
+    return ""
+
+# Returns the path to the package.json of a plug-in's Unity package, ignoring any in the project's package cache, or None if there is none.
+#   Not all Unity projects keep their package.json file in the same location, so search the whole project.
+#   TODO: This will break if there's more than one package.json in the folder tree - with the exception of those in PackageCache, which are filtered.
+def GetPluginPackageJsonPath(unity_project_path : Path) -> Path:
+    for curr_package_json_path in sorted(unity_project_path.glob('**/package.json')):
+        if str(curr_package_json_path).find("PackageCache") == -1:
+            return curr_package_json_path
+    return None
+
+# Reads each plug-in's package.json and returns, for each plug-in id, the ids of the other plug-ins in 'plugin_paths' which its package depends on.
+def GetPluginPackageDependencies(plugin_paths : list[Path]) -> dict[str, list[str]]:
+    package_names : dict[str, str] = dict() # {package name: plug-in id}
+    package_data : dict[str, dict] = dict() # {plug-in id: package.json contents}
+
+    for plugin_path in plugin_paths:
+        plugin_id = plugin_path.name[len("Apple."):]
+        package_json_path = GetPluginPackageJsonPath(plugin_path.joinpath(f"{plugin_path.name}_Unity"))
+        if package_json_path is None:
+            continue
+
+        package_data[plugin_id] = json.loads(package_json_path.read_text())
+        package_names[package_data[plugin_id]["name"]] = plugin_id
+
+    return {plugin_id : [package_names[name] for name in data.get("dependencies", dict()) if name in package_names] for plugin_id, data in package_data.items()}
+
 # Simple object which contains both the Unity project reprensetation along with the path to the native Xcode project.
 class NativeUnityPlugin:
     def __init__(self, root_path : Path, native_project_path : Path) -> None:
@@ -64,43 +160,86 @@ class NativeUnityPlugin:
         self.native_project_path = native_project_path
         self.unity_project = UnityProject()
 
+        # Libraries found in NativeLibraries~ by the build stage; later stages read it instead of the folder
+        self.native_manifest : NativeOutputManifest = None
+
+        # Set once the plug-in has been packed
+        self.package_path : Path = None
+        self.slice_package_paths : dict[str, Path] = dict() # {"<Platform>-<Config>": path to the package slice}
+
 # Native Unity plug-in manager class maintains collections of Unity.app installations and relevant information for each native plug-in.
 class NativeUnityPluginManager:
     def __init__(self, build_context : BuildContext) -> None:
+        # Everything the manager does is configured by, and recorded in, the context of the build it runs for; managers of other builds in the same process are unaffected
+        self.ctx = build_context
+
         self.unity_installation_table : dict[str, UnityInstallation] = dict()
         self.native_unity_plugin_table : dict[str, NativeUnityPlugin] = dict()
 
-        global CTX
-        CTX = build_context
+        # Plug-ins may be processed on job executor threads; only one of them may prompt the user at a time
+        self.prompt_lock = threading.Lock()
+
+        # Answer to the project upgrade prompt, asked at most once per run (See: GetUpgradeInstallation)
+        self.upgrade_prompted = False
+        self.upgrade_installation : UnityInstallation = None
+
+        # Results of each plug-in's EditMode test lane (See: RunEditModeTests)
+        self.editmode_results : dict[str, EditModeTestResult] = dict()
+
+        # Outcome of each plug-in's pipeline stages, once RunPipeline has finished (See: BuildResult)
+        self.stage_status : dict[tuple[str, str], str] = dict()
+
     
     # Find and track all Unity.app installations found under 'unity_installation_root'
     # Note: Ensure this is called on a sensible root folder as recursively searching large folder hierarchies can be slow
     def ScanForUnityInstallations(self) -> None:
-        CTX.printer.StatusMessageWithContext("Scanning for Unity installations under path: ", f"{CTX.unity_install_root}", "\n")
+        # Earlier builds of the process may have scanned the same root (See: BuildEnvironment)
+        cached_installations = self.ctx.environment.GetUnityInstallations(self.ctx.unity_install_root)
+        if cached_installations is not None:
+            self.unity_installation_table.update(cached_installations)
+            self.ctx.printer.StatusMessageWithContext("Using the Unity installations found earlier under path: ", f"{self.ctx.unity_install_root}", "\n")
+            for unity_version_string, unity_installation in self.unity_installation_table.items():
+                self.ctx.printer.MessageWithContext(f"{unity_version_string}: ", f"{unity_installation.app_path}", self.ctx.printer.Indent(1))
+            return
 
-        app_paths = list(CTX.unity_install_root.glob('**/Unity.app'))
+        # An installation whose version could not be read is missing from the table, so the next build scans the root again
+        if self.ScanUnityInstallRoot():
+            self.ctx.environment.SetUnityInstallations(self.ctx.unity_install_root, self.unity_installation_table)
+
+    # Runs 'Unity -version' for each Unity.app under the installation root, tracking one installation per version
+    # Returns False if the version of a Unity.app could not be read
+    def ScanUnityInstallRoot(self) -> bool:
+        self.ctx.printer.StatusMessageWithContext("Scanning for Unity installations under path: ", f"{self.ctx.unity_install_root}", "\n")
+
+        app_paths = list(self.ctx.unity_install_root.glob('**/Unity.app'))
         if len(app_paths) < 1:
-            CTX.printer.WarningMessage("No Unity installations found. Consider updating the Unity installation root path.")
-            return
+            self.ctx.printer.WarningMessage("No Unity installations found. Consider updating the Unity installation root path.")
+            return True
 
+        versions_read = True
         for curr_app_path in app_paths:
-            CTX.printer.StatusMessageWithContext("Inspecting Unity.app at path: ", curr_app_path, "\n")
+            self.ctx.printer.StatusMessageWithContext("Inspecting Unity.app at path: ", curr_app_path, "\n")
 
             exe_path = curr_app_path.joinpath("Contents/MacOS/Unity")
             if exe_path.exists():
-                unity_version_cli_output = utility.RunCommand([exe_path, "-version"])
-                unity_version_string = unity_version_cli_output.stdout.rstrip("\n")
-                if unity_version_string in self.unity_installation_table:
-                    CTX.printer.MessageWithContext("Already tracking Unity.app with version: ", unity_version_string, f"\n{CTX.printer.Indent(1)}")
-                    CTX.printer.MessageWithContext("Unity.app Path: ", f"{self.unity_installation_table[unity_version_string].app_path}", f"\n{CTX.printer.Indent(1)}")
+                # Usually answered by the start-up probe (See: BuildEnvironment.Probe)
+                unity_version_string = self.ctx.environment.GetUnityVersion(exe_path, self.ctx.probe_fallbacks)
+                if len(unity_version_string) == 0:
+                    self.ctx.printer.WarningMessage(f"Could not read the version of Unity.app at {curr_app_path}")
+                    versions_read = False
+                elif unity_version_string in self.unity_installation_table:
+                    self.ctx.printer.MessageWithContext("Already tracking Unity.app with version: ", unity_version_string, f"\n{self.ctx.printer.Indent(1)}")
+                    self.ctx.printer.MessageWithContext("Unity.app Path: ", f"{self.unity_installation_table[unity_version_string].app_path}", f"\n{self.ctx.printer.Indent(1)}")
                 else:
                     self.unity_installation_table[unity_version_string] = UnityInstallation(curr_app_path, exe_path, unity_version_string)
-                    CTX.printer.MessageWithContext("Tracked Unity.app installation:")
-                    CTX.printer.MessageWithContext("Version: ", unity_version_string, CTX.printer.Indent(1))
-                    CTX.printer.MessageWithContext("Unity.app Path: ", curr_app_path, CTX.printer.Indent(1))
-                    CTX.printer.MessageWithContext("Executable Path: ", exe_path, CTX.printer.Indent(1))
+                    self.ctx.printer.MessageWithContext("Tracked Unity.app installation:")
+                    self.ctx.printer.MessageWithContext("Version: ", unity_version_string, self.ctx.printer.Indent(1))
+                    self.ctx.printer.MessageWithContext("Unity.app Path: ", curr_app_path, self.ctx.printer.Indent(1))
+                    self.ctx.printer.MessageWithContext("Executable Path: ", exe_path, self.ctx.printer.Indent(1))
             else:
-                CTX.printer.WarningMessage(f"Could not locate executable for Unity.app at {exe_path}")
+                self.ctx.printer.WarningMessage(f"Could not locate executable for Unity.app at {exe_path}")
+
+        return versions_read
 
     # Returns a list of tracked Unity installation versions
     def GetUnityInstallationList(self) -> list[str]:
@@ -115,33 +254,34 @@ class NativeUnityPluginManager:
         return self.native_unity_plugin_table[plugin_id] if plugin_id in self.native_unity_plugin_table else None
 
     # Scans the provided plug-in path, optionally builds native libraries for each plug-in, and tracks relevant information for the plug-in's Unity and Xcode projects.
-    def ProcessNativeUnityPlugin(self, plugin_path : Path) -> None:
-        CTX.printer.StatusMessageWithContext("Scanning native plug-in subfolder: ", plugin_path.name, "\n")
-        CTX.printer.MessageWithContext("Plug-in path: ", plugin_path, f"{CTX.printer.Indent(1)}")
+    #   When 'build_native_libraries' is False, the native libraries already in NativeLibraries~ (e.g. from a resumed run) are scanned without being built or signed.
+    def ProcessNativeUnityPlugin(self, plugin_path : Path, build_native_libraries : bool = True) -> None:
+        self.ctx.printer.StatusMessageWithContext("Scanning native plug-in subfolder: ", plugin_path.name, "\n")
+        self.ctx.printer.MessageWithContext("Plug-in path: ", plugin_path, f"{self.ctx.printer.Indent(1)}")
 
         # Get plug-in id, which will also be used as a key for future look-up
         # By standard, all plug-ins begin with 'Apple.'
         plugin_id = plugin_path.name[len("Apple."):]
         if plugin_id in self.native_unity_plugin_table:
-            CTX.printer.StatusMessageWithContext("Already tracking plug-in at path", plugin_path)
+            self.ctx.printer.StatusMessageWithContext("Already tracking plug-in at path", plugin_path)
             return
         
         # Skip if not needed
-        if not CTX.plugins[plugin_id]:
-            CTX.printer.MessageWithContext("User omitted from list of plug-ins. Skipping: ", plugin_id, CTX.printer.Indent(1))
+        if not self.ctx.plugins[plugin_id]:
+            self.ctx.printer.MessageWithContext("User omitted from list of plug-ins. Skipping: ", plugin_id, self.ctx.printer.Indent(1))
             return
 
         # As a standard, all plug-in Unity project folders are the containing folder name with the string '_Unity' appended.
         #   Example: The Apple.Core plug-in Unity project is assumed to be at the path '/plugin_path/Apple.Core_Unity/'
         unity_project_path = plugin_path.joinpath(f"{plugin_path.name}_Unity")
         if not unity_project_path.is_dir():
-            CTX.printer.ErrorMessage(f"Failed to locate expected Unity project folder at path: {unity_project_path}")
+            self.ctx.printer.ErrorMessage(f"Failed to locate expected Unity project folder at path: {unity_project_path}")
             return
 
         # As a standard, all native library Xcode projects are in the /Native subfolder in each plug-in folder.
         native_project_path = plugin_path.joinpath("Native")
         if not native_project_path.is_dir():
-            CTX.printer.ErrorMessage(f"Failed to locate expected native Xcode project folder at path: {native_project_path}")
+            self.ctx.printer.ErrorMessage(f"Failed to locate expected native Xcode project folder at path: {native_project_path}")
             return
 
         native_plugin = NativeUnityPlugin(plugin_path, native_project_path)
@@ -154,297 +294,759 @@ class NativeUnityPluginManager:
             try:
                 version_string_index = project_version_file_contents.index("m_EditorVersion:") + 1
                 if len(project_version_file_contents) <= version_string_index:
-                    CTX.printer.WarningMessage(f"Couldn't find editor version string in {project_version_file_path}")
+                    self.ctx.printer.WarningMessage(f"Couldn't find editor version string in {project_version_file_path}")
                     native_plugin.unity_project.version = UnityProject.unknown_unity_project_version_string
                 else:
                     native_plugin.unity_project.version = project_version_file_contents[version_string_index]
-                    CTX.printer.MessageWithContext("Project version: ", native_plugin.unity_project.version, CTX.printer.Indent(1))
+                    self.ctx.printer.MessageWithContext("Project version: ", native_plugin.unity_project.version, self.ctx.printer.Indent(1))
             except:
-                CTX.printer.WarningMessage(f"Couldn't find editor version string in {project_version_file_path}")
+                self.ctx.printer.WarningMessage(f"Couldn't find editor version string in {project_version_file_path}")
                 native_plugin.unity_project.version = self.UnityProject.unknown_unity_project_version_string
         else:
-            CTX.printer.ErrorMessage(f"Couldn't find file at path: {project_version_file_path}")
-            CTX.printer.InfoMessage("Unity project must contain '/ProjectSettings/ProjectVersion.txt' to be considered a Unity project.")
+            self.ctx.printer.ErrorMessage(f"Couldn't find file at path: {project_version_file_path}")
+            self.ctx.printer.InfoMessage("Unity project must contain '/ProjectSettings/ProjectVersion.txt' to be considered a Unity project.")
             return
 
         # Find project test assemblies
         unity_tests_paths = list(unity_project_path.joinpath("Assets").glob('**/Tests'))
         if len(unity_tests_paths) < 1:
-            CTX.printer.WarningMessage(f"{plugin_id} appears to have no supported tests. Cannot find a 'Tests' folder under /Assets.")
+            self.ctx.printer.WarningMessage(f"{plugin_id} appears to have no supported tests. Cannot find a 'Tests' folder under /Assets.")
 
         for tests_path in unity_tests_paths:
             test_assembly_paths = list(tests_path.glob('**/*.asmdef'))
             for test_assembly_path in test_assembly_paths:
                 if list(test_assembly_path.parts).count('Editor') > 0:
-                    CTX.printer.MessageWithContext("Editor test assembly: ", test_assembly_path.stem, CTX.printer.Indent(1))
+                    self.ctx.printer.MessageWithContext("Editor test assembly: ", test_assembly_path.stem, self.ctx.printer.Indent(1))
                     native_plugin.unity_project.editor_test_assemblies.append(test_assembly_path.stem)
                 else:
-                    CTX.printer.MessageWithContext("Test assembly: ", test_assembly_path.stem, CTX.printer.Indent(1))
+                    self.ctx.printer.MessageWithContext("Test assembly: ", test_assembly_path.stem, self.ctx.printer.Indent(1))
                     native_plugin.unity_project.test_assemblies.append(test_assembly_path.stem)
 
-        # cache working dir and cd shell to native project folder; xcodebuild must be invoked from within folder containing the .xcodeproj
-        working_dir = os.getcwd()
-        os.chdir(native_project_path)
-
         # Build
+        # xcodebuild must be invoked from within folder containing the .xcodeproj
         # TODO: (Jared) Interrogate build machine for SDKs
-        build_commands = CTX.GenerateXcodeBuildCommands()
+        build_commands = self.ctx.GenerateXcodeBuildCommands(plugin_id) if build_native_libraries else dict()
+        if not build_native_libraries:
+            self.ctx.printer.MessageWithContext("Using previously built native libraries for: ", plugin_id, f"\n{self.ctx.printer.Indent(1)}")
+        elif self.ctx.shard is not None:
+            build_commands = self.ctx.shard.FilterBuildCommands(plugin_id, build_commands)
+            self.ctx.printer.MessageWithContext(f"Native library builds assigned to shard {self.ctx.shard.shard_index}: ", ', '.join(f"{platform} {config}" for platform, command_set in build_commands.items() for config in command_set), f"\n{self.ctx.printer.Indent(1)}")
+
+        # The libraries built below are recorded with the native sources they were built from (See: NativeOutputManifest)
+        inputs_fingerprint = FingerprintNativeSources(plugin_path) if len(build_commands) > 0 else ""
+        built_outputs : list[tuple[str, str]] = list()
 
         for platform, command_set in build_commands.items():
             for config, command in command_set.items():
-                CTX.printer.StatusMessageWithContext(f"Building {config} {plugin_id} native libraries for platform: ", platform, f"\n{CTX.printer.Indent(1)}")
-                CTX.printer.MessageWithContext("Build command: ", f"{' '.join(command)}", CTX.printer.Indent(2))
+                self.ctx.printer.StatusMessageWithContext(f"Building {config} {plugin_id} native libraries for platform: ", platform.replace(BuildContext.BATCHED_PLATFORM_SEPARATOR, ", "), f"\n{self.ctx.printer.Indent(1)}")
+                self.ctx.printer.MessageWithContext("Build command: ", f"{' '.join(command)}", self.ctx.printer.Indent(2))
+
+                with self.ctx.admission.Admit(CommandTypeID.XCODEBUILD):
+                    step_record = self.ctx.history.BeginStep(BuildStepID.NATIVE_BUILD, plugin_id, platform, config)
+                    build_command_output = utility.RunCommand(command, cwd=native_project_path, limits=self.ctx.command_limits[CommandTypeID.XCODEBUILD], printer=self.ctx.printer)
+                    self.ctx.history.EndStep(step_record, build_command_output.returncode == 0)
+
+                if build_command_output.returncode == 0 and self.ctx.batch_xcodebuild:
+                    self.CopyBatchedBuildProducts(plugin_id, native_plugin, platform.split(BuildContext.BATCHED_PLATFORM_SEPARATOR), config)
+
+                if build_command_output.returncode == 0:
+                    built_outputs += [(built_platform, config) for built_platform in platform.split(BuildContext.BATCHED_PLATFORM_SEPARATOR)]
+
+                if len(build_command_output.timed_out) > 0:
+                    self.ctx.printer.WarningMessage(f"Native library build command was stopped by the watchdog ({build_command_output.timed_out}) after {build_command_output.attempts} attempt(s)")
 
-                build_command_output = utility.RunCommand(command)
                 if build_command_output.returncode != 0:
-                    CTX.printer.WarningMessage("Native library build command completed with non-zero return code")
-                    CTX.printer.MessageWithContext("Command output:", f"\n{build_command_output.stdout}")
+                    self.ctx.printer.WarningMessage("Native library build command completed with non-zero return code")
+                    self.ctx.printer.MessageWithContext("Command output:", f"\n{build_command_output.stdout}")
                     
-                    if not utility.BooleanPrompt(CTX.printer, "Would you like to continue the build process?"):
-                        os.chdir(working_dir)
-                        return
+                    with self.prompt_lock:
+                        if not utility.BooleanPrompt(self.ctx.printer, f"Would you like to continue the {plugin_id} build process?"):
+                            return
 
         # Determine path to /NativeLibraries~, Each project should write all built libraries to this folder.
         unity_plugins_paths = list(native_plugin.unity_project.path.joinpath("Assets").glob('**/NativeLibraries~'))
 
         if len(unity_plugins_paths) < 1:
-            CTX.printer.ErrorMessage(f"Cannot locate the \"/NativeLibraries~\" folder for {plugin_id}.\nThis may be due to a build failure. Skipping remaining steps.")
+            self.ctx.printer.ErrorMessage(f"Cannot locate the \"/NativeLibraries~\" folder for {plugin_id}.\nThis may be due to a build failure. Skipping remaining steps.")
             return
         else:
             if len(unity_plugins_paths) > 1:
-                CTX.printer.ErrorMessage(f"{plugin_id} has multiple 'NativeLibraries~' folders under /Assets.\nPlease remove both and try building again.\nSkipping remaining steps.")
+                self.ctx.printer.ErrorMessage(f"{plugin_id} has multiple 'NativeLibraries~' folders under /Assets.\nPlease remove both and try building again.\nSkipping remaining steps.")
                 return
 
             native_plugin.unity_project.native_library_path = unity_plugins_paths[0]
 
-        # Build completed -> cd shell to working_dir
-        os.chdir(working_dir)
-
         # Determine supported Unity platforms (see: https://docs.unity3d.com/ScriptReference/BuildTarget.html for relevant Apple platform target names)
-        CTX.printer.StatusMessage("Scanning for supported platforms.", f"\n{CTX.printer.Indent(1)}")
-        unity_platform_name_table = {"iOS":("iOS", UnitySdkVariantID.DEVICE),
-                                     "iPhoneSimulator":("iOS", UnitySdkVariantID.SIMULATOR),
-                                     "tvOS":("tvOS", UnitySdkVariantID.DEVICE),
-                                     "AppleTVSimulator":("tvOS",UnitySdkVariantID.SIMULATOR),
-                                     "macOS":("StandaloneOSX", UnitySdkVariantID.DEVICE),
-                                     "visionOS":("VisionOS", UnitySdkVariantID.DEVICE),
-                                     "VisionSimulator":("VisionOS", UnitySdkVariantID.SIMULATOR)}
-        
+        #   NativeLibraries~ is walked once, into the plug-in's native output manifest; signing, the test builds and packing read the manifest.
+        self.ctx.printer.StatusMessage("Scanning for supported platforms.", f"\n{self.ctx.printer.Indent(1)}")
+        native_manifest = NativeOutputManifest.Scan(plugin_id, native_plugin.unity_project.native_library_path, UNITY_PLATFORM_NAME_TABLE)
+
         native_plugin.unity_project.supported_platforms.clear()
-        
-        for build_config_path in native_plugin.unity_project.native_library_path.iterdir():
-            if build_config_path.is_dir() and build_config_path.name in [ConfigID.RELEASE, ConfigID.DEBUG]:
-                for native_platform_path in build_config_path.iterdir():
-                    if native_platform_path.is_dir() and native_platform_path.name in unity_platform_name_table:
-                        unity_platform_name, unity_platform_variant = unity_platform_name_table[native_platform_path.name]
-                        
-                        if unity_platform_name not in native_plugin.unity_project.supported_platforms.keys():
-                            native_plugin.unity_project.supported_platforms[unity_platform_name] = dict()
-
-                        native_plugin.unity_project.supported_platforms[unity_platform_name][unity_platform_variant] = native_platform_path
-
-                        CTX.printer.MessageWithContext("Found supported Unity platform: ", unity_platform_name, CTX.printer.Indent(2))
-                        CTX.printer.MessageWithContext("              Platform variant: ", unity_platform_variant, CTX.printer.Indent(2))
-                        CTX.printer.MessageWithContext("                  Build Config: ", build_config_path.name, CTX.printer.Indent(2))
-                        CTX.printer.MessageWithContext("Platform path: ", native_platform_path, CTX.printer.Indent(3))
-
-                        if len(CTX.codesign_hash) > 0:
-                            CTX.printer.StatusMessageWithContext("Attempting to sign native library with identity: ", CTX.codesign_hash, f"{CTX.printer.Indent(3)}")
-                            for item in native_platform_path.iterdir():
-                                if item.suffix == '.bundle' or item.suffix == '.framework':
-                                    if len(CTX.codesign_hash) > 0:
-                                        toolchain.Codesign(CTX.printer, item, CTX.codesign_hash, logWithContext= lambda m, c: CTX.printer.MessageWithContext(m, c, CTX.printer.Indent(4)))
-                                elif item.suffix == '.a':
-                                    CTX.printer.MessageWithContext("Skipping static library: ", f"{item}", CTX.printer.Indent(4))
-                        else:
-                            CTX.printer.Message("User chose to skip codesign.", CTX.printer.Indent(3))
-
-                        Printer.Newline()
-                    else:
-                        CTX.printer.WarningMessage(f"Unknown platform {native_platform_path.name} found in Plugins folder at {native_platform_path.parent}\n")
+
+        for config, platform_paths in native_manifest.GetPlatformPaths().items():
+            for native_platform_name, native_platform_path in platform_paths.items():
+                unity_platform_name, unity_platform_variant = UNITY_PLATFORM_NAME_TABLE[native_platform_name]
+
+                if unity_platform_name not in native_plugin.unity_project.supported_platforms.keys():
+                    native_plugin.unity_project.supported_platforms[unity_platform_name] = dict()
+
+                native_plugin.unity_project.supported_platforms[unity_platform_name][unity_platform_variant] = native_platform_path
+
+                self.ctx.printer.MessageWithContext("Found supported Unity platform: ", unity_platform_name, self.ctx.printer.Indent(2))
+                self.ctx.printer.MessageWithContext("              Platform variant: ", unity_platform_variant, self.ctx.printer.Indent(2))
+                self.ctx.printer.MessageWithContext("                  Build Config: ", config, self.ctx.printer.Indent(2))
+                self.ctx.printer.MessageWithContext("Platform path: ", native_platform_path, self.ctx.printer.Indent(3))
+
+                if not build_native_libraries:
+                    self.ctx.printer.Message("Native libraries were not rebuilt; skipping codesign.", self.ctx.printer.Indent(3))
+                elif self.ctx.shard is not None and not self.ctx.shard.IncludesOutput(plugin_id, native_platform_name, config):
+                    self.ctx.printer.Message("Native libraries are built by another shard; skipping codesign.", self.ctx.printer.Indent(3))
+                elif len(self.ctx.codesign_hash) > 0:
+                    self.ctx.printer.StatusMessageWithContext("Attempting to sign native library with identity: ", self.ctx.codesign_hash, f"{self.ctx.printer.Indent(3)}")
+                    for artifact in [artifact for artifact in native_manifest.artifacts if artifact.config == config and artifact.platform == native_platform_name]:
+                        item = native_manifest.GetArtifactPath(artifact)
+                        if artifact.IsSignable():
+                            with self.ctx.admission.Admit(CommandTypeID.CODESIGN):
+                                step_record = self.ctx.history.BeginStep(BuildStepID.CODESIGN, plugin_id, native_platform_name, config)
+                                codesign_succeeded = toolchain.Codesign(self.ctx.printer, item, self.ctx.codesign_hash, logWithContext= lambda m, c: self.ctx.printer.MessageWithContext(m, c, self.ctx.printer.Indent(4)), limits=self.ctx.command_limits[CommandTypeID.CODESIGN])
+                                self.ctx.history.EndStep(step_record, codesign_succeeded)
+                            if codesign_succeeded:
+                                artifact.signed_identity = self.ctx.codesign_hash
+                        elif item.suffix == '.a':
+                            self.ctx.printer.MessageWithContext("Skipping static library: ", f"{item}", self.ctx.printer.Indent(4))
+                else:
+                    self.ctx.printer.Message("User chose to skip codesign.", self.ctx.printer.Indent(3))
+
+                Printer.Newline()
+
+        # Don't warn about files - only considering folders
+        for unknown_path in native_manifest.unknown_paths:
+            if unknown_path.parent == native_manifest.native_library_path:
+                self.ctx.printer.WarningMessage(f"Unknown platform variant {unknown_path.name} found in Plugins folder at {unknown_path.parent}")
             else:
-                # Don't warn about files - only considering folders
-                if build_config_path.is_dir():
-                    CTX.printer.WarningMessage(f"Unknown platform variant {build_config_path.name} found in Plugins folder at {build_config_path.parent}")
+                self.ctx.printer.WarningMessage(f"Unknown platform {unknown_path.name} found in Plugins folder at {unknown_path.parent}\n")
+
+        # Sizes and hashes are taken once the libraries are signed, as signing changes them
+        manifest_path = NativeOutputManifest.GetManifestPath(self.ctx.build_path, plugin_id)
+        native_manifest.Measure(built_outputs, inputs_fingerprint, NativeOutputManifest.Load(manifest_path))
+        native_manifest.Save(manifest_path)
+        native_plugin.native_manifest = native_manifest
+        self.ctx.printer.MessageWithContext("Native output manifest: ", f"{manifest_path} ({len(native_manifest.artifacts)} libraries)", self.ctx.printer.Indent(1))
 
         if len(native_plugin.unity_project.supported_platforms) < 1:
-            CTX.printer.WarningMessage(f"No supported platforms found in: {Printer.Decorate(f'{native_plugin.unity_project.native_library_path}', CTX.printer.theme.context_color)}")
-            CTX.printer.WarningMessage(f"Subsequent processing steps for {Printer.Decorate(f'{plugin_id}', CTX.printer.theme.context_color)} will be skipped.", "")
+            self.ctx.printer.WarningMessage(f"No supported platforms found in: {Printer.Decorate(f'{native_plugin.unity_project.native_library_path}', self.ctx.printer.theme.context_color)}")
+            self.ctx.printer.WarningMessage(f"Subsequent processing steps for {Printer.Decorate(f'{plugin_id}', self.ctx.printer.theme.context_color)} will be skipped.", "")
             Printer.Newline()
         else:
             self.native_unity_plugin_table[plugin_id] = native_plugin
 
-        CTX.printer.StatusMessage("Completed supported platform scan.", f"{CTX.printer.Indent(1)}")
+        self.ctx.printer.StatusMessage("Completed supported platform scan.", f"{self.ctx.printer.Indent(1)}")
 
-    # Build tests for each plug-in
-    def BuildTests(self) -> None:
-        self.ValidateProjectVersions()
+    # Copies the products of a batched xcodebuild invocation from derived data into NativeLibraries~/<Config>/<Platform>, mirroring scripts/shell/copy_native_libraries.sh
+    def CopyBatchedBuildProducts(self, plugin_id : str, native_plugin : NativeUnityPlugin, platforms : list[str], config : str) -> None:
+        native_library_root_name = GetNativeLibraryRootFolderName(native_plugin.native_project_path)
+        native_library_root_path = native_plugin.unity_project.path.joinpath("Assets", native_library_root_name)
+        if len(native_library_root_name) == 0 or not native_library_root_path.is_dir():
+            self.ctx.printer.ErrorMessage(f"Native library destination root does not exist at path: {native_library_root_path}")
+            return
 
-        for plugin_id, native_plugin in self.native_unity_plugin_table.items():
-            CTX.printer.StatusMessageWithContext(f"\nBuilding Unity tests for plug-in: ", f"{plugin_id}", CTX.printer.Indent(1))
+        for platform in platforms:
+            products_path = self.ctx.GetBatchedProductsPath(plugin_id, platform, config)
+            destination_path = native_library_root_path.joinpath("NativeLibraries~", config, platform)
+
+            product_paths = [item for item in products_path.glob("*") if item.suffix in ['.framework', '.bundle', '.a']] if products_path.is_dir() else list()
+            if len(product_paths) == 0:
+                self.ctx.printer.WarningMessage(f"No {config} {platform} build products found at: {products_path}")
+                continue
+
+            for product_path in product_paths:
+                # Release builds also carry their debug symbols, matching the behavior of the scheme post-action
+                product_copies = [product_path]
+                dsym_path = product_path.parent.joinpath(f"{product_path.name}.dSYM")
+                if config == ConfigID.RELEASE and dsym_path.exists():
+                    product_copies.append(dsym_path)
+
+                for source_path in product_copies:
+                    target_path = destination_path.joinpath(source_path.name)
+                    self.ctx.printer.MessageWithContext("Copying build product: ", f"{source_path} -> {target_path}", self.ctx.printer.Indent(2))
+                    if target_path.is_dir():
+                        shutil.rmtree(target_path)
+                    elif target_path.exists():
+                        target_path.unlink()
+
+                    destination_path.mkdir(parents=True, exist_ok=True)
+                    if source_path.is_dir():
+                        shutil.copytree(source_path, target_path, symlinks=True)
+                    else:
+                        shutil.copy2(source_path, target_path)
 
-            unity_installation =  self.GetUnityInstallation(native_plugin.unity_project.version)
-            if unity_installation is None:
-                CTX.printer.WarningMessage(f"No matching Unity installation for project version {native_plugin.unity_project.version}. Skipping test build.")
+    # Build tests for each supported platform of a single plug-in
+    # Returns True when a test player was produced for every platform
+    def BuildPluginTests(self, plugin_id : str, native_plugin : NativeUnityPlugin) -> bool:
+        self.ctx.printer.StatusMessageWithContext("\nBuilding Unity tests for plug-in: ", f"{plugin_id}", self.ctx.printer.Indent(1))
 
-            unity_exe = unity_installation.executable_path
-            if unity_exe is None:
-                CTX.printer.WarningMessage(f"Failed to find Unity executable for installation: {native_plugin.unity_project.version}. Skipping test build.")
-            
-            if len(native_plugin.unity_project.test_assemblies) < 1:
-                CTX.printer.WarningMessage(f"{plugin_id}: No test assemblies found. Skipping test build.")
-
-            if len(native_plugin.unity_project.supported_platforms) < 1:
-                CTX.printer.WarningMessage(f"{plugin_id}: No supported test platforms found. Skipping test build.")
-
-            # Unity command line args consume the test assembly list as a single semicolon-delimited string
-            curr_test_assembly_string = ';'.join(native_plugin.unity_project.test_assemblies)
-
-            for curr_platform, supported_variants in  native_plugin.unity_project.supported_platforms.items():
-                for curr_variant in supported_variants.keys():
-                    curr_test_build_identifier = f"{plugin_id}_{native_plugin.unity_project.version}_{curr_platform}_{curr_variant}"
-                    curr_test_build_path = CTX.test_build_output_path.joinpath(curr_test_build_identifier)
-                    if not curr_test_build_path.is_dir():
-                        curr_test_build_path.mkdir()
-
-                    curr_unity_log_path = curr_test_build_path.joinpath(f"{curr_test_build_identifier}_build.log")
-
-                    curr_unity_build_command = [f"{unity_exe}",
-                                                "-runTests",
-                                                "-batchmode",
-                                                "-forgetProjectPath",
-                                                f"-projectPath {native_plugin.unity_project.path}",
-                                                f"-testPlatform {curr_platform}",
-                                                f"-assemblyNames {curr_test_assembly_string}",
-                                                f"-logFile {curr_unity_log_path}"]
-
-                    CTX.printer.StatusMessage(f"Building {curr_platform}_{curr_variant} tests.", f"\n{CTX.printer.Indent(2)}")
-                    CTX.printer.MessageWithContext("Build command: ", f"{' '.join(curr_unity_build_command)}", CTX.printer.Indent(3))
-
-                    curr_unity_build_command_output = utility.RunCommand(curr_unity_build_command)
-                    if curr_unity_build_command_output.returncode != 0:
-                        if len(curr_unity_build_command_output.stdout) > 0:
-                            CTX.printer.WarningMessage(f"Build command completed with non-zero return code.\n\nSTDOUT:\n{curr_unity_build_command_output.stdout}")
-                        else:
-                            CTX.printer.WarningMessage(f"Build command completed with non-zero return code.\nUnity had no output to stdout or stderr.\nCheck Unity log for details: {curr_unity_log_path}")
-
-                    curr_temp_path = native_plugin.unity_project.path.joinpath("TestPlayers")
-                    if not curr_temp_path.is_dir():
-                        CTX.printer.ErrorMessage(f"No test build output found!")
-                        CTX.printer.MessageWithContext("Expected output path: ", f"{curr_temp_path}")
-                        CTX.printer.MessageWithContext("See Unity build log: ", f"{curr_unity_log_path}")
+        unity_installation =  self.GetUnityInstallation(native_plugin.unity_project.version)
+        if unity_installation is None:
+            self.ctx.printer.WarningMessage(f"No matching Unity installation for project version {native_plugin.unity_project.version}. Skipping test build.")
+            return False
+
+        unity_exe = unity_installation.executable_path
+        if unity_exe is None:
+            self.ctx.printer.WarningMessage(f"Failed to find Unity executable for installation: {native_plugin.unity_project.version}. Skipping test build.")
+            return False
+
+        if len(native_plugin.unity_project.test_assemblies) < 1:
+            self.ctx.printer.WarningMessage(f"{plugin_id}: No test assemblies found. Skipping test build.")
+
+        if len(native_plugin.unity_project.supported_platforms) < 1:
+            self.ctx.printer.WarningMessage(f"{plugin_id}: No supported test platforms found. Skipping test build.")
+
+        test_assemblies = self.SelectTestAssemblies(native_plugin, native_plugin.unity_project.test_assemblies)
+        if len(test_assemblies) == 0 and len(native_plugin.unity_project.test_assemblies) > 0:
+            self.ctx.printer.StatusMessage(f"No test assemblies of {plugin_id} reference an assembly with changes. Skipping test build.", f"\n{self.ctx.printer.Indent(2)}")
+            if self.ctx.unity_workers is not None:
+                self.ctx.unity_workers.Release(native_plugin.unity_project.path)
+            return True
+
+        # Unity command line args consume the test assembly list as a single semicolon-delimited string
+        curr_test_assembly_string = ';'.join(test_assemblies)
+
+        # The Library folder is only restored once a test build has to run, so a plug-in whose test runs are all cached never touches it
+        library_cache_keys = None
+
+        tests_succeeded = True
+        unity_commands_succeeded = True
+        for curr_platform, supported_variants in  native_plugin.unity_project.supported_platforms.items():
+            for curr_variant in supported_variants.keys():
+                curr_test_build_identifier = f"{plugin_id}_{native_plugin.unity_project.version}_{curr_platform}_{curr_variant}"
+
+                test_cache_key = None
+                if self.ctx.test_cache is not None:
+                    # The test player loads the platform's libraries; the Editor which builds it loads the macOS libraries
+                    native_folder_names = [folder_name for folder_name, platform_variant in UNITY_PLATFORM_NAME_TABLE.items() if platform_variant == (curr_platform, curr_variant)] + ["macOS"]
+                    test_cache_key = self.ctx.test_cache.GetKey(native_plugin.unity_project.path, unity_installation.version, curr_platform, curr_variant, test_assemblies, native_folder_names)
+                    cached_entry = self.ctx.test_cache.Lookup(native_plugin.unity_project.path, curr_platform, curr_variant, test_cache_key)
+                    if cached_entry is not None:
+                        self.ctx.printer.StatusMessage(f"{curr_platform}_{curr_variant} tests: cached pass.", f"\n{self.ctx.printer.Indent(2)}")
+                        self.ctx.printer.MessageWithContext("Inputs unchanged since passing run: ", f"{cached_entry['test_build']} ({test_cache_key})", self.ctx.printer.Indent(3))
+                        self.ctx.printer.MessageWithContext("Original Unity log: ", f"{cached_entry['log']}", self.ctx.printer.Indent(3))
                         continue
 
-                    CTX.printer.RunCommand(["cp", "-R", curr_temp_path, curr_test_build_path])
-                    shutil.rmtree(curr_temp_path)
+                if self.ctx.library_cache is not None and library_cache_keys is None:
+                    library_cache_keys = self.ctx.library_cache.Restore(native_plugin.unity_project.path, unity_installation.version, self.ctx.printer, self.ctx.printer.Indent(2))
+
+                curr_test_build_path = self.ctx.test_build_output_path.joinpath(curr_test_build_identifier)
+                if not curr_test_build_path.is_dir():
+                    curr_test_build_path.mkdir()
+
+                curr_unity_log_path = curr_test_build_path.joinpath(f"{curr_test_build_identifier}_build.log")
+
+                curr_unity_build_command = [f"{unity_exe}",
+                                            "-runTests",
+                                            "-batchmode",
+                                            "-forgetProjectPath",
+                                            f"-projectPath {native_plugin.unity_project.path}",
+                                            f"-testPlatform {curr_platform}",
+                                            f"-assemblyNames {curr_test_assembly_string}",
+                                            f"-logFile {curr_unity_log_path}"]
+
+                self.ctx.printer.StatusMessage(f"Building {curr_platform}_{curr_variant} tests.", f"\n{self.ctx.printer.Indent(2)}")
+                self.ctx.printer.MessageWithContext("Build command: ", f"{' '.join(curr_unity_build_command)}", self.ctx.printer.Indent(3))
+
+                with self.ctx.admission.Admit(CommandTypeID.UNITY):
+                    step_record = self.ctx.history.BeginStep(BuildStepID.TEST_BUILD, plugin_id, curr_platform, curr_variant, native_plugin.unity_project.version)
+                    curr_unity_build_command_output = None
+                    if self.ctx.unity_workers is not None:
+                        curr_unity_build_command_output = self.ctx.unity_workers.Run(unity_exe, native_plugin.unity_project.path, unity_installation.version,
+                                                                                [{"command" : UnityWorkerCommandID.SWITCH_PLATFORM, "platform" : curr_platform},
+                                                                                 {"command" : UnityWorkerCommandID.BUILD_TESTS, "platform" : curr_platform, "assemblies" : test_assemblies}],
+                                                                                curr_unity_log_path, self.ctx.printer, self.ctx.printer.Indent(3))
+                    if curr_unity_build_command_output is None:
+                        curr_unity_build_command_output = RunUnityCommand(self.ctx, curr_unity_build_command, curr_unity_log_path, f"test build {curr_test_build_identifier}")
+                    self.ctx.history.EndStep(step_record, curr_unity_build_command_output.returncode == 0)
+
+                unity_commands_succeeded = unity_commands_succeeded and curr_unity_build_command_output.returncode == 0
+
+                if len(curr_unity_build_command_output.timed_out) > 0:
+                    self.ctx.printer.WarningMessage(f"Build command was stopped by the watchdog ({curr_unity_build_command_output.timed_out}) after {curr_unity_build_command_output.attempts} attempt(s).\nCheck Unity log for details: {curr_unity_log_path}")
+                elif curr_unity_build_command_output.returncode != 0:
+                    if len(curr_unity_build_command_output.stdout) > 0:
+                        self.ctx.printer.WarningMessage(f"Build command completed with non-zero return code.\n\nSTDOUT:\n{curr_unity_build_command_output.stdout}")
+                    else:
+                        self.ctx.printer.WarningMessage(f"Build command completed with non-zero return code.\nUnity had no output to stdout or stderr.\nCheck Unity log for details: {curr_unity_log_path}")
+
+                curr_temp_path = native_plugin.unity_project.path.joinpath("TestPlayers")
+                if not curr_temp_path.is_dir():
+                    self.ctx.printer.ErrorMessage("No test build output found!")
+                    self.ctx.printer.MessageWithContext("Expected output path: ", f"{curr_temp_path}")
+                    self.ctx.printer.MessageWithContext("See Unity build log: ", f"{curr_unity_log_path}")
+                    tests_succeeded = False
+                    continue
 
-    # Validates that a matching Unity installation has been found for each of the processed plug-ins.
-    # Returns a dictionary mapping a plug-in identifier to a UnityProject for each plug-in where no matching installation of Unity was found.
-    def ValidateProjectVersions(self):
-        supported_plugins = dict()
-        unsupported_plugins = dict()
+                utility.RunCommand(["cp", "-R", curr_temp_path, curr_test_build_path])
+                shutil.rmtree(curr_temp_path)
 
-        for plugin_id, plugin in self.native_unity_plugin_table.items():
-            if plugin.unity_project.version in self.unity_installation_table:
-                CTX.printer.MessageWithContext("Found supported Unity installation for plug-in: ", plugin_id, CTX.printer.Indent(1))
-                supported_plugins[plugin_id] = (self.native_unity_plugin_table[plugin_id])
-            else:
-                CTX.printer.MessageWithContext(f"Missing supported Unity installation for {plugin_id}: ", plugin.unity_project.version, CTX.printer.Indent(1))
-                unsupported_plugins[plugin_id] = (self.native_unity_plugin_table[plugin_id])
-        
-        # Touch each plug-in's Unity project with the appropriate Unity Editor version to update .meta files for newly compiled native libraries.
-        CTX.printer.StatusMessage("Touching Unity plug-in projects:", f"\n{CTX.printer.Indent(1)}")
-        for target_plugin_id, target_native_plugin in supported_plugins.items():
-            target_unity_version = self.GetUnityInstallation(target_native_plugin.unity_project.version)
-            CTX.printer.MessageWithContext("Plug-in: ", target_plugin_id, CTX.printer.Indent(2))
-            target_unity_version.TouchProject(target_native_plugin.unity_project, lambda m, c: CTX.printer.MessageWithContext(m, c, CTX.printer.Indent(2)))
-            
-            Printer.Newline()
+                if test_cache_key is not None and curr_unity_build_command_output.returncode == 0:
+                    self.ctx.test_cache.Save(native_plugin.unity_project.path, curr_platform, curr_variant, test_cache_key, curr_unity_log_path, curr_test_build_path, self.ctx.printer, self.ctx.printer.Indent(3))
+
+        # The project's worker is not needed once its test players are built
+        if self.ctx.unity_workers is not None:
+            self.ctx.unity_workers.Release(native_plugin.unity_project.path)
+
+        # Test builds import the project for each test platform, so the Library folder is saved again once they have all succeeded
+        if library_cache_keys is not None and tests_succeeded and unity_commands_succeeded:
+            self.ctx.library_cache.Save(native_plugin.unity_project.path, library_cache_keys, self.ctx.printer, self.ctx.printer.Indent(2))
 
-        # Optionally upgrade plug-in Unity projects for which no matching Unity Editor installation was located.
-        unsupported_plugin_count = len(unsupported_plugins)
-        if unsupported_plugin_count > 0:
-            CTX.printer.Message(f"Found {unsupported_plugin_count} plug-in(s) with no corresponding Unity installation.", CTX.printer.Indent(2))
-            CTX.printer.InfoMessage(f"\n{CTX.printer.Indent(1)}This script can attempt to upgrade plug-in projects with an existing Unity installation."
-                                    f"\n{CTX.printer.Indent(2)}* If this operation fails, it may require manually opening the associated project within Unity or reverting your local repository."
-                                    f"\n{CTX.printer.Indent(2)}* If you do not upgrade with this script, build may succeed but .meta files will not be generated and the plug-ins {Printer.Bold('*WILL NOT WORK*')}"
-                                    f"\n{CTX.printer.Indent(2)}* Skipping this step means that you will either need to install a matching version of Unity or manually upgrade desired plug-in projects.", "\n")
+        return tests_succeeded
+
+    # Returns the folder of the copy of a plug-in's Unity project in which its EditMode tests run
+    def GetEditModeProjectPath(self, plugin_id : str) -> Path:
+        return self.ctx.build_cache_root.joinpath("EditModeProjects", plugin_id, self.native_unity_plugin_table[plugin_id].unity_project.path.name)
+
+    # Brings the plug-in's EditMode project clone up to date with its Unity project. Runs once the project has been touched, before Unity builds its test players.
+    def CloneEditModeProject(self, plugin_id : str) -> bool:
+        native_plugin = self.native_unity_plugin_table[plugin_id]
+        if len(native_plugin.unity_project.editor_test_assemblies) == 0:
+            return True
+
+        clone_path = self.GetEditModeProjectPath(plugin_id)
+        self.ctx.printer.StatusMessageWithContext("Cloning Unity project for EditMode tests: ", plugin_id, f"\n{self.ctx.printer.Indent(1)}")
+        SyncProjectClone(native_plugin.unity_project.path, clone_path)
+        self.ctx.printer.MessageWithContext("Clone path: ", f"{clone_path}", self.ctx.printer.Indent(2))
+        return True
+
+    # Runs the plug-in's editor test assemblies with Unity's EditMode test platform in its project clone, alongside the test player builds of the original project.
+    #   The NUnit XML results and the Unity log are written to '<plug-in>_<version>_EditMode' in the test build output folder. Returns True if every test passed.
+    def RunEditModeTests(self, plugin_id : str) -> bool:
+        native_plugin = self.native_unity_plugin_table[plugin_id]
+        editor_test_assemblies = self.SelectTestAssemblies(native_plugin, native_plugin.unity_project.editor_test_assemblies)
+        if len(editor_test_assemblies) == 0:
+            self.ctx.printer.MessageWithContext("No EditMode test assemblies to run for: ", plugin_id, f"\n{self.ctx.printer.Indent(1)}")
+            return True
+
+        unity_installation = self.GetUnityInstallation(native_plugin.unity_project.version)
+        if unity_installation is None or unity_installation.executable_path is None:
+            self.ctx.printer.WarningMessage(f"No matching Unity installation for project version {native_plugin.unity_project.version}. Skipping EditMode tests.")
+            return False
+
+        results_identifier = f"{plugin_id}_{native_plugin.unity_project.version}_EditMode"
+        results_folder_path = self.ctx.test_build_output_path.joinpath(results_identifier)
+        results_folder_path.mkdir(parents=True, exist_ok=True)
+        results_path = results_folder_path.joinpath(f"{results_identifier}_results.xml")
+        log_path = results_folder_path.joinpath(f"{results_identifier}.log")
+        results_path.unlink(missing_ok=True)
+
+        editmode_command = [f"{unity_installation.executable_path}",
+                            "-runTests",
+                            "-batchmode",
+                            f"-projectPath {self.GetEditModeProjectPath(plugin_id)}",
+                            "-testPlatform EditMode",
+                            f"-assemblyNames {';'.join(editor_test_assemblies)}",
+                            f"-testResults {results_path}",
+                            f"-logFile {log_path}"]
+
+        self.ctx.printer.StatusMessageWithContext("Running EditMode tests for plug-in: ", plugin_id, f"\n{self.ctx.printer.Indent(1)}")
+        self.ctx.printer.MessageWithContext("Test command: ", f"{' '.join(editmode_command)}", self.ctx.printer.Indent(2))
+
+        with self.ctx.admission.Admit(CommandTypeID.UNITY):
+            step_record = self.ctx.history.BeginStep(BuildStepID.EDIT_MODE_TEST, plugin_id, "EditMode", "", native_plugin.unity_project.version)
+            editmode_command_output = RunUnityCommand(self.ctx, editmode_command, log_path, f"EditMode tests {results_identifier}")
+
+            result = EditModeTestResult(plugin_id, results_path, log_path)
+            result.Load()
+            self.ctx.history.EndStep(step_record, result.Succeeded())
+
+        if len(editmode_command_output.timed_out) > 0:
+            result.error = f"Stopped by the watchdog ({editmode_command_output.timed_out}) after {editmode_command_output.attempts} attempt(s)"
+
+        self.editmode_results[plugin_id] = result
+        if len(result.error) > 0:
+            self.ctx.printer.WarningMessage(f"EditMode tests of {plugin_id} produced no results: {result.error}\nCheck Unity log for details: {log_path}")
+        else:
+            self.ctx.printer.MessageWithContext("EditMode tests: ", f"{result.passed}/{result.total} passed, {result.failed} failed", self.ctx.printer.Indent(2))
+
+        return result.Succeeded()
+
+    # Returns the test assemblies of a plug-in to pass to Unity.
+    #   With changed files from --affected-since, these are the test assemblies which reference an assembly with changes, directly or through other assemblies, in the
+    #   asmdef graph of the plug-in's project and its local packages. Changes in other plug-ins are ignored; a change in the plug-in or its local packages which is not
+    #   a C# source or assembly definition (e.g. a native library source or an asset) selects every test assembly.
+    def SelectTestAssemblies(self, native_plugin : NativeUnityPlugin, test_assemblies : list[str]) -> list[str]:
+        if self.ctx.changed_paths is None or len(test_assemblies) == 0:
+            return list(test_assemblies)
+
+        project_path = native_plugin.unity_project.path.resolve()
+        source_roots = [project_path.joinpath("Assets")] + GetLocalPackagePaths(project_path)
+        plugin_root = self.ctx.plugin_root.resolve()
+        related_plugin_paths = {plugin_root.joinpath(path.relative_to(plugin_root).parts[0]) for path in [project_path] + source_roots if path.is_relative_to(plugin_root)}
+        related_changed_paths = [changed_path for changed_path in self.ctx.changed_paths if any(changed_path.resolve().is_relative_to(plugin_path) for plugin_path in related_plugin_paths)]
+
+        affected_test_assemblies = AssemblyGraph(source_roots).GetAffectedTestAssemblies(related_changed_paths, test_assemblies)
+        if affected_test_assemblies is None:
+            self.ctx.printer.MessageWithContext("Changes outside C# assemblies; running every test assembly: ", ', '.join(test_assemblies), self.ctx.printer.Indent(2))
+            return list(test_assemblies)
+
+        self.ctx.printer.MessageWithContext("Test assemblies affected by changes: ", ', '.join(affected_test_assemblies) if len(affected_test_assemblies) > 0 else "None", self.ctx.printer.Indent(2))
+        return affected_test_assemblies
+
+    # Asks, once per run, whether projects without a matching Unity installation should be upgraded, and with which installation.
+    # Returns the selected UnityInstallation, or None if the user declined or no installations are tracked.
+    def GetUpgradeInstallation(self) -> UnityInstallation:
+        with self.prompt_lock:
+            if self.upgrade_prompted:
+                return self.upgrade_installation
+            self.upgrade_prompted = True
+
+            self.ctx.printer.InfoMessage(f"\n{self.ctx.printer.Indent(1)}This script can attempt to upgrade plug-in projects with an existing Unity installation."
+                                    f"\n{self.ctx.printer.Indent(2)}* If this operation fails, it may require manually opening the associated project within Unity or reverting your local repository."
+                                    f"\n{self.ctx.printer.Indent(2)}* If you do not upgrade with this script, build may succeed but .meta files will not be generated and the plug-ins {Printer.Bold('*WILL NOT WORK*')}"
+                                    f"\n{self.ctx.printer.Indent(2)}* Skipping this step means that you will either need to install a matching version of Unity or manually upgrade desired plug-in projects.", "\n")
             
-            if utility.BooleanPrompt(CTX.printer, "Would you like the script to attempt project upgrade?"):
+            if utility.BooleanPrompt(self.ctx.printer, "Would you like the script to attempt project upgrade?"):
                 installed_unity_versions = self.GetUnityInstallationList()
                 target_unity_version = None
                 
                 if len(installed_unity_versions) != 0:
                     if len(installed_unity_versions) == 1:
                         target_unity_version = installed_unity_versions[0]
-                        CTX.printer.MessageWithContext("Found one Unity installation, version: ", target_unity_version)
+                        self.ctx.printer.MessageWithContext("Found one Unity installation, version: ", target_unity_version)
                     else:
-                        target_unity_version = utility.SelectionPrompt(CTX.printer, "Please select the version of Unity to use for upgrade:", installed_unity_versions)
-                    
-                    CTX.printer.StatusMessageWithContext("Attempting to automatically upgrade the following plug-in projects: ", f"{' '.join(unsupported_plugins.keys())}", f"\n{CTX.printer.Indent(2)}")
-                    CTX.printer.MessageWithContext("Upgrade with Unity version: ", target_unity_version, CTX.printer.Indent(3))
-                    
-                    target_unity_installation = self.GetUnityInstallation(target_unity_version)
+                        target_unity_version = utility.SelectionPrompt(self.ctx.printer, "Please select the version of Unity to use for upgrade:", installed_unity_versions)
 
-                    for target_plugin_id, target_native_plugin in unsupported_plugins.items():
-                        CTX.printer.StatusMessageWithContext("Upgrading: ", target_plugin_id, f"\n{CTX.printer.Indent(3)}")
-                        target_unity_installation.TouchProject(target_native_plugin.unity_project, lambda m, c: CTX.printer.MessageWithContext(m, c, CTX.printer.Indent(4)))
+                    self.upgrade_installation = self.GetUnityInstallation(target_unity_version)
                 else:
-                    CTX.printer.ErrorMessage("No Unity installations are being tracked. Please check your Unity installation root path or install the Unity Editor.")
-    
-    # Packs plug-ins with tar and moves the resulting package to the currently configured build output folder.
-    def GeneratePlugInPackages(self) -> None:
-        # Cache to return; tar should be invoked from the folder containing the associated package.json
-        working_dir = os.getcwd()
-        for  plugin_id, native_plugin in self.native_unity_plugin_table.items():
-            CTX.printer.StatusMessageWithContext("Packing plug-in: ", f"{plugin_id}", "\n")
-            
-            os.chdir(native_plugin.unity_project.path)
+                    self.ctx.printer.ErrorMessage("No Unity installations are being tracked. Please check your Unity installation root path or install the Unity Editor.")
 
-            # Not all Unity projects keep their package.json file in the same location, so get all the paths to any package.json under the current folder hierarchy
-            # TODO: This will break if there's more than one package.json in the folder tree - with the exception of those in PackageCache, which are filtered.
-            package_json_file_paths = list(native_plugin.unity_project.path.glob('**/package.json'))
+            return self.upgrade_installation
 
-            # Ignore anything in the current project's package cache
-            target_package_json_path = Path()
-            for curr_package_json_path in package_json_file_paths:
-                if str(curr_package_json_path).find("PackageCache") != -1:
-                    continue
+    # Touches a single plug-in's Unity project with its matching Unity installation to update .meta files for newly compiled native libraries.
+    #   Projects without a matching installation are upgraded with the installation chosen in GetUpgradeInstallation, if any.
+    # Returns True when the project was touched successfully.
+    def TouchPluginProject(self, plugin_id : str) -> bool:
+        native_plugin = self.native_unity_plugin_table[plugin_id]
+        unity_installation = self.GetUnityInstallation(native_plugin.unity_project.version)
+
+        if unity_installation is not None:
+            self.ctx.printer.StatusMessageWithContext("Touching Unity plug-in project: ", plugin_id, f"\n{self.ctx.printer.Indent(1)}")
+            return unity_installation.TouchProject(self.ctx, native_plugin.unity_project, lambda m, c: self.ctx.printer.MessageWithContext(m, c, self.ctx.printer.Indent(2)))
+
+        self.ctx.printer.MessageWithContext(f"Missing supported Unity installation for {plugin_id}: ", native_plugin.unity_project.version, f"\n{self.ctx.printer.Indent(1)}")
+        upgrade_installation = self.GetUpgradeInstallation()
+        if upgrade_installation is None:
+            return False
+
+        self.ctx.printer.StatusMessageWithContext("Upgrading: ", plugin_id, f"\n{self.ctx.printer.Indent(1)}")
+        self.ctx.printer.MessageWithContext("Upgrade with Unity version: ", upgrade_installation.version, self.ctx.printer.Indent(2))
+        if not upgrade_installation.TouchProject(self.ctx, native_plugin.unity_project, lambda m, c: self.ctx.printer.MessageWithContext(m, c, self.ctx.printer.Indent(2))):
+            return False
+
+        # Later stages look up the Unity installation by project version
+        native_plugin.unity_project.version = upgrade_installation.version
+        return True
+
+    # Runs each stage for every plug-in in 'plugin_paths' as soon as its dependencies allow, instead of finishing each stage for all plug-ins before the next begins.
+    #   build: native libraries are built, signed and scanned (ProcessNativeUnityPlugin)
+    #   touch: the Unity project is opened to update .meta files; needs the plug-in's own build
+    #   test:  test players are built; needs the plug-in's own touch, plus the build and touch of each package it depends on, which Unity imports from its folder
+    #   editmode_clone: the touched project is copied for the EditMode lane; the test player build waits for it, so Unity does not write to the project while it is copied
+    #   editmode_test:  editor test assemblies run in the clone, alongside the test player builds; needs the same packages as the test stage
+    #   pack:  the package is created; waits for the plug-in's own test build, and for the test builds of its dependents which import its package folder
+    # Stages which are not selected are left out; a plug-in whose build fails skips its remaining stages.
+    #   When 'build_native_libraries' is False, the build stage scans the native libraries already in NativeLibraries~ (e.g. merged from shards) instead of building them.
+    def RunPipeline(self, plugin_paths : list[Path], build_tests : bool, pack : bool, build_native_libraries : bool = True, editmode_tests : bool = False) -> None:
+        # Plug-ins the user did not select are reported, as in the phased build, and left out of the pipeline
+        for plugin_path in [plugin_path for plugin_path in plugin_paths if not self.ctx.plugins.get(plugin_path.name[len("Apple."):], False)]:
+            self.ProcessNativeUnityPlugin(plugin_path)
+        plugin_paths = [plugin_path for plugin_path in plugin_paths if self.ctx.plugins.get(plugin_path.name[len("Apple."):], False)]
+
+        # A shard only processes the plug-ins it has native library builds for
+        if self.ctx.shard is not None:
+            for plugin_path in [plugin_path for plugin_path in plugin_paths if not self.ctx.shard.HasJobs(plugin_path.name[len("Apple."):])]:
+                self.ctx.printer.MessageWithContext(f"No native library builds assigned to shard {self.ctx.shard.shard_index}. Skipping: ", plugin_path.name[len("Apple."):], "\n")
+            plugin_paths = [plugin_path for plugin_path in plugin_paths if self.ctx.shard.HasJobs(plugin_path.name[len("Apple."):])]
+
+        pipeline = StagePipeline(self.ctx.executor)
+
+        plugin_ids = [plugin_path.name[len("Apple."):] for plugin_path in plugin_paths]
+        package_dependencies = GetPluginPackageDependencies(plugin_paths)
+        package_dependents = {plugin_id : [dependent for dependent, dependencies in package_dependencies.items() if plugin_id in dependencies] for plugin_id in plugin_ids}
+
+        for plugin_index, plugin_path in enumerate(plugin_paths):
+            plugin_id = plugin_ids[plugin_index]
+            dependencies = package_dependencies.get(plugin_id, list())
+
+            # Lower stage indices first, then the original plug-in order, so a single worker runs the stages in the same order as the phased build
+            pipeline.AddTask(PipelineTask((plugin_id, PipelineStageID.BUILD),
+                                          lambda plugin_path=plugin_path, plugin_id=plugin_id: self.RunJournaledStage(plugin_path, PipelineStageID.BUILD, list(),
+                                              job=lambda: self.ProcessNativeUnityPlugin(plugin_path, build_native_libraries) or plugin_id in self.native_unity_plugin_table,
+                                              resume_job=lambda: self.ProcessNativeUnityPlugin(plugin_path, build_native_libraries=False) or plugin_id in self.native_unity_plugin_table,
+                                              get_artifacts=lambda: [self.native_unity_plugin_table[plugin_id].unity_project.native_library_path]),
+                                          priority=(0, plugin_index)))
+
+            if build_tests:
+                pipeline.AddTask(PipelineTask((plugin_id, PipelineStageID.TOUCH),
+                                              lambda plugin_path=plugin_path, plugin_id=plugin_id: self.RunJournaledStage(plugin_path, PipelineStageID.TOUCH, list(),
+                                                  job=lambda: self.TouchPluginProject(plugin_id)),
+                                              requires=[(plugin_id, PipelineStageID.BUILD)],
+                                              priority=(1, plugin_index)))
+                pipeline.AddTask(PipelineTask((plugin_id, PipelineStageID.TEST),
+                                              lambda plugin_path=plugin_path, plugin_id=plugin_id, dependencies=dependencies: self.RunJournaledStage(plugin_path, PipelineStageID.TEST, [plugin_paths[plugin_ids.index(dependency)] for dependency in dependencies],
+                                                  job=lambda: self.BuildPluginTests(plugin_id, self.native_unity_plugin_table[plugin_id]),
+                                                  get_artifacts=lambda: [path for path in self.ctx.test_build_output_path.glob(f"{plugin_id}_*") if not path.name.endswith("_EditMode")]),
+                                              requires=[(plugin_id, PipelineStageID.TOUCH)] + [(dependency, PipelineStageID.BUILD) for dependency in dependencies],
+                                              after=[(dependency, PipelineStageID.TOUCH) for dependency in dependencies] + [(plugin_id, PipelineStageID.EDIT_MODE_CLONE)],
+                                              priority=(2, plugin_index)))
+
+            if build_tests and editmode_tests:
+                pipeline.AddTask(PipelineTask((plugin_id, PipelineStageID.EDIT_MODE_CLONE),
+                                              lambda plugin_id=plugin_id: self.CloneEditModeProject(plugin_id),
+                                              requires=[(plugin_id, PipelineStageID.TOUCH)],
+                                              priority=(1, plugin_index)))
+                pipeline.AddTask(PipelineTask((plugin_id, PipelineStageID.EDIT_MODE_TEST),
+                                              lambda plugin_path=plugin_path, plugin_id=plugin_id, dependencies=dependencies: self.RunJournaledStage(plugin_path, PipelineStageID.EDIT_MODE_TEST, [plugin_paths[plugin_ids.index(dependency)] for dependency in dependencies],
+                                                  job=lambda: self.RunEditModeTests(plugin_id),
+                                                  get_artifacts=lambda: list(self.ctx.test_build_output_path.glob(f"{plugin_id}_*_EditMode"))),
+                                              requires=[(plugin_id, PipelineStageID.EDIT_MODE_CLONE)] + [(dependency, PipelineStageID.BUILD) for dependency in dependencies],
+                                              after=[(dependency, PipelineStageID.TOUCH) for dependency in dependencies],
+                                              priority=(2, plugin_index)))
+
+            if pack:
+                pipeline.AddTask(PipelineTask((plugin_id, PipelineStageID.PACK),
+                                              lambda plugin_path=plugin_path, plugin_id=plugin_id: self.RunJournaledStage(plugin_path, PipelineStageID.PACK, list(),
+                                                  job=lambda: self.GeneratePlugInPackage(plugin_id, self.native_unity_plugin_table[plugin_id]),
+                                                  get_artifacts=lambda: [self.native_unity_plugin_table[plugin_id].package_path] + list(self.native_unity_plugin_table[plugin_id].slice_package_paths.values())),
+                                              requires=[(plugin_id, PipelineStageID.BUILD)],
+                                              after=[(plugin_id, PipelineStageID.TOUCH), (plugin_id, PipelineStageID.TEST), (plugin_id, PipelineStageID.EDIT_MODE_TEST)] + [(dependent, stage) for dependent in package_dependents[plugin_id] for stage in [PipelineStageID.TEST, PipelineStageID.EDIT_MODE_TEST]],
+                                              priority=(3, plugin_index)))
+
+            # Other build.py runs may use the plug-in's folder once this run, and the test builds which import its package, are done with it (See: HostLockSet)
+            if self.ctx.host_locks is not None:
+                pipeline.AddTask(PipelineTask((plugin_id, PipelineStageID.UNLOCK),
+                                              lambda plugin_path=plugin_path: self.UnlockPlugin(plugin_path),
+                                              after=[(plugin_id, stage) for stage in [PipelineStageID.BUILD, PipelineStageID.TOUCH, PipelineStageID.TEST, PipelineStageID.EDIT_MODE_CLONE, PipelineStageID.EDIT_MODE_TEST, PipelineStageID.PACK]]
+                                                  + [(dependent, stage) for dependent in package_dependents[plugin_id] for stage in [PipelineStageID.TOUCH, PipelineStageID.TEST, PipelineStageID.EDIT_MODE_TEST]],
+                                              priority=(4, plugin_index)))
+
+        self.stage_status = {key : status for key, status in pipeline.Run(self.ctx.printer).items() if key[1] != PipelineStageID.UNLOCK}
+
+    # Gives up the run's lock on a plug-in folder, once no Unity worker of this run has its project open
+    def UnlockPlugin(self, plugin_path : Path) -> bool:
+        if self.ctx.unity_workers is not None:
+            self.ctx.unity_workers.Release(plugin_path.joinpath(f"{plugin_path.name}_Unity"))
+        self.ctx.host_locks.Release(plugin_path)
+        return True
+
+    # Returns the native library builds, one per xcodebuild invocation, which the build stage runs for the selected plug-ins in 'plugin_paths'. (See: upi_build_shards.py)
+    def GetNativeBuildJobs(self, plugin_paths : list[Path]) -> list[ShardJob]:
+        jobs = list()
+        for plugin_path in plugin_paths:
+            plugin_id = plugin_path.name[len("Apple."):]
+            if not self.ctx.plugins.get(plugin_id, False) or not plugin_path.joinpath("Native").is_dir():
+                continue
+
+            for platform, command_set in self.ctx.GenerateXcodeBuildCommands(plugin_id).items():
+                for config in command_set.keys():
+                    jobs.append(ShardJob(plugin_id, platform, config, platform.split(BuildContext.BATCHED_PLATFORM_SEPARATOR)))
+        return jobs
+
+    # Returns a hash of everything which can change the output of a plug-in's pipeline stage: its native sources and, after the build stage, its Unity project.
+    #   The Unity project fingerprint includes NativeLibraries~, so rebuilt native libraries invalidate later stages, but leaves out files that Unity itself generates. 'dependency_paths' adds the sources of the packages the stage imports.
+    def GetStageInputsHash(self, plugin_path : Path, stage : str, dependency_paths : list[Path]) -> str:
+        inputs_hash = hashlib.sha256(stage.encode())
+        for input_plugin_path in [plugin_path] + dependency_paths:
+            inputs_hash.update(FingerprintNativeSources(input_plugin_path).encode())
+            if stage != PipelineStageID.BUILD:
+                inputs_hash.update(FingerprintTree(input_plugin_path.joinpath(f"{input_plugin_path.name}_Unity"), UNITY_GENERATED_FOLDER_NAMES, [".meta"]).encode())
+        return inputs_hash.hexdigest()
+
+    # Runs a pipeline stage through the build journal, when one is configured.
+    #   A stage the journal shows as completed with the same inputs and intact artifacts runs 'resume_job' instead of 'job'. Otherwise 'job' runs and, if it succeeds,
+    #   the stage is recorded with the files returned by 'get_artifacts'.
+    def RunJournaledStage(self, plugin_path : Path, stage : str, dependency_paths : list[Path], job : Callable[[], bool], resume_job : Callable[[], bool] = lambda: True, get_artifacts : Callable[[], list[Path]] = lambda: list()) -> bool:
+        if self.ctx.journal is None:
+            return job()
+
+        step_key = f"{plugin_path.name[len('Apple.'):]}/{stage}"
+        inputs_hash = self.GetStageInputsHash(plugin_path, stage, dependency_paths)
+
+        if self.ctx.journal.IsStepComplete(step_key, inputs_hash, self.ctx.printer):
+            self.ctx.printer.StatusMessageWithContext("Skipping step completed by the resumed run: ", step_key, "\n")
+            return resume_job()
+
+        if not job():
+            return False
+
+        self.ctx.journal.RecordStep(step_key, inputs_hash, [artifact_path for artifact_path in get_artifacts() if artifact_path is not None and artifact_path.exists()])
+        return True
+
+    # Packs a single plug-in; tar is invoked from the Unity project folder containing the associated package.json
+    # Returns True when the package was created
+    def GeneratePlugInPackage(self, plugin_id : str, native_plugin : NativeUnityPlugin) -> bool:
+        self.ctx.printer.StatusMessageWithContext("Packing plug-in: ", f"{plugin_id}", "\n")
+
+        target_package_json_path = GetPluginPackageJsonPath(native_plugin.unity_project.path)
+        if target_package_json_path is None:
+            self.ctx.printer.ErrorMessage(f"Cannot locate package.json for {plugin_id} under {native_plugin.unity_project.path}")
+            return False
+
+        # The package holds the libraries as they are on disk; those changed since the build stage recorded them were not signed or tested by this run
+        if native_plugin.native_manifest is not None:
+            for artifact in native_plugin.native_manifest.GetChangedArtifacts():
+                self.ctx.printer.WarningMessage(f"{plugin_id}: {artifact.relative_path} changed after it was built; packing it as it is now.")
+
+        # If /Demos exists in same folder, rename to Demos~ folder as needed
+        curr_demo_path = target_package_json_path.parent.joinpath("Demos")
+        curr_demo_meta_path = target_package_json_path.parent.joinpath("Demos.meta")
+        dest_demo_path = target_package_json_path.parent.joinpath("Demos~")
+        dest_demo_meta_path = target_package_json_path.parent.joinpath("../Demos.meta")
+
+        if curr_demo_path.exists():
+            utility.RunCommand(["mv", curr_demo_path, dest_demo_path])
+            utility.RunCommand(["mv", curr_demo_meta_path, dest_demo_meta_path])
+
+        # get the package name and version
+        package_json_file = open(target_package_json_path)
+        package_json_data = json.load(package_json_file)
+        tgz_filename = f"{package_json_data['name']}" "-" f"{package_json_data['version']}" ".tgz"
+        native_plugin.package_path = self.ctx.build_output_path.joinpath(tgz_filename)
+        package_json_file.close()
+
+        pack_succeeded = self.RunPackCommand(plugin_id, target_package_json_path.parent, native_plugin.package_path)
+        if pack_succeeded and self.ctx.slice_packages:
+            pack_succeeded = self.GeneratePlugInPackageSlices(plugin_id, native_plugin, target_package_json_path)
+
+        if dest_demo_path.exists():
+            utility.RunCommand(["mv", dest_demo_path, curr_demo_path])
+            utility.RunCommand(["mv", dest_demo_meta_path, curr_demo_meta_path])
+
+        return pack_succeeded
+
+    # Packs the folder 'package_root', which holds a package.json, into 'tgz_path' with tar.
+    #   With a package compressor configured, tar writes an uncompressed archive beside 'tgz_path' which the compressor then gzips on several cores.
+    # Returns True when the package was created
+    def RunPackCommand(self, plugin_id : str, package_root : Path, tgz_path : Path) -> bool:
+        tar_path = tgz_path.with_name(f"{tgz_path.name}.tar") if self.ctx.package_compressor is not None else None
+
+        # using tar:
+        if tar_path is None:
+            pack_command = ["tar", "--auto-compress", "--create", "--file", f"{tgz_path}", "--directory", f"{package_root}", "-s", "/./package/", "." ]
+        else:
+            pack_command = ["tar", "--create", "--file", f"{tar_path}", "--directory", f"{package_root}", "-s", "/./package/", "." ]
+
+        self.ctx.printer.MessageWithContext("Project package.json path: ", f"{package_root.joinpath('package.json')}", self.ctx.printer.Indent(1))
+        self.ctx.printer.MessageWithContext("Pack command: ", f"{(' '.join(pack_command))}", self.ctx.printer.Indent(1))
+
+        with self.ctx.admission.Admit(CommandTypeID.PACK):
+            step_record = self.ctx.history.BeginStep(BuildStepID.PACK, plugin_id)
+            pack_command_output = utility.RunCommand(pack_command, cwd=package_root, limits=self.ctx.command_limits[CommandTypeID.PACK], printer=self.ctx.printer)
+            if tar_path is not None and pack_command_output.returncode == 0:
+                uncompressed_size, compressed_size, compress_time = self.ctx.package_compressor.CompressFile(tar_path, tgz_path)
+                self.ctx.printer.MessageWithContext("Compressed: ", f"{uncompressed_size / (1024 * 1024):.1f} MiB to {compressed_size / (1024 * 1024):.1f} MiB in {compress_time:.2f}s (level {self.ctx.package_compressor.level}, {self.ctx.package_compressor.jobs} job(s))", self.ctx.printer.Indent(1))
+            self.ctx.history.EndStep(step_record, pack_command_output.returncode == 0)
+
+        if tar_path is not None:
+            tar_path.unlink(missing_ok=True)
+
+        if len(pack_command_output.timed_out) > 0:
+            self.ctx.printer.WarningMessage(f"Pack command was stopped by the watchdog ({pack_command_output.timed_out}) after {pack_command_output.attempts} attempt(s).")
+        elif pack_command_output.returncode != 0:
+            self.ctx.printer.WarningMessage(f"Pack command completed with non-zero return code.\n\nSTDOUT:\n{pack_command_output.stdout}")
+        else:
+            self.ctx.printer.StatusMessage("Pack completed.")
+
+        return pack_command_output.returncode == 0
+
+    # Packs a variant of the plug-in's package for each platform and config in NativeLibraries~, written to '<output path>/Slices/<Platform>-<Config>/'.
+    #   Each slice keeps the package's name, version, dependencies and code, so it can replace the full package in a project, but carries only one platform's
+    #   libraries for one config, plus the macOS libraries of that config which the Editor loads for Play mode. Demos~ and the package.json 'samples' which refer to it are left out.
+    #   The libraries stay in the package's own NativeLibraries~ folder because the Editor (See: AppleUnityPackage.cs) only looks for them inside the package which owns the code.
+    # Returns True when every slice was created
+    def GeneratePlugInPackageSlices(self, plugin_id : str, native_plugin : NativeUnityPlugin, package_json_path : Path) -> bool:
+        package_root = package_json_path.parent
+        native_library_path = native_plugin.unity_project.native_library_path
+        native_library_relative_path = native_library_path.relative_to(package_root) if native_library_path is not None and native_library_path.is_relative_to(package_root) else None
+        if native_library_relative_path is None:
+            self.ctx.printer.WarningMessage(f"{plugin_id} keeps its native libraries outside its package folder. Package slices are skipped.")
+            return True
+
+        package_json_data = json.loads(package_json_path.read_text())
+        package_json_data.pop("samples", None)
+
+        native_plugin.slice_package_paths.clear()
+        slices_succeeded = True
+        platform_paths = native_plugin.native_manifest.GetPlatformPaths()
+        for config_path in sorted(native_library_path.joinpath(config) for config in platform_paths.keys()):
+            for platform_path in sorted(platform_paths[config_path.name].values()):
+                slice_name = f"{platform_path.name}-{config_path.name}"
+                included_platforms = [platform_path.name, PlatformID.MACOS]
+                self.ctx.printer.StatusMessageWithContext("Packing plug-in slice: ", f"{plugin_id} {slice_name}", "\n")
+
+                # The slice is staged with hard links to the package's files, leaving out the libraries of other platforms and configs
+                staging_path = self.ctx.build_output_path.joinpath("Slices", ".staging", f"{plugin_id}-{slice_name}")
+                if staging_path.exists():
+                    shutil.rmtree(staging_path)
+
+                def IgnoreSliceFiles(folder : str, names : list[str]) -> list[str]:
+                    folder_path = Path(folder)
+                    if folder_path == package_root:
+                        return [name for name in names if name in ["Demos~", "Demos", "package.json"]]
+                    if folder_path == native_library_path:
+                        return [name for name in names if name != config_path.name]
+                    if folder_path == config_path:
+                        return [name for name in names if name not in included_platforms]
+                    return list()
+
+                def LinkOrCopy(source_file : str, destination_file : str) -> None:
+                    try:
+                        os.link(source_file, destination_file)
+                    except OSError:
+                        shutil.copy2(source_file, destination_file)
+
+                shutil.copytree(package_root, staging_path, symlinks=True, ignore=IgnoreSliceFiles, copy_function=LinkOrCopy)
+                staging_path.joinpath("package.json").write_text(json.dumps(package_json_data, indent=4) + "\n")
+
+                slice_package_path = self.ctx.build_output_path.joinpath("Slices", slice_name, native_plugin.package_path.name)
+                slice_package_path.parent.mkdir(parents=True, exist_ok=True)
+                if self.RunPackCommand(plugin_id, staging_path, slice_package_path):
+                    native_plugin.slice_package_paths[slice_name] = slice_package_path
                 else:
-                    target_package_json_path = curr_package_json_path
-                    break
-
-            # If /Demos exists in same folder, rename to Demos~ folder as needed
-            curr_demo_path = target_package_json_path.parent.joinpath("Demos")
-            curr_demo_meta_path = target_package_json_path.parent.joinpath("Demos.meta")
-            dest_demo_path = target_package_json_path.parent.joinpath("Demos~")
-            dest_demo_meta_path = target_package_json_path.parent.joinpath("../Demos.meta")
-
-            if curr_demo_path.exists():
-                utility.RunCommand(["mv", curr_demo_path, dest_demo_path])
-                utility.RunCommand(["mv", curr_demo_meta_path, dest_demo_meta_path])
-
-            # get the package name and version
-            package_json_file = open(target_package_json_path)
-            package_json_data = json.load(package_json_file)
-            tgz_filename = f"{package_json_data['name']}" "-" f"{package_json_data['version']}" ".tgz"
-            package_json_file.close()
-
-            # using tar:
-            pack_command = ["tar", "--auto-compress", "--create", "--file", f"{CTX.build_output_path.joinpath(tgz_filename)}", "--directory", f"{target_package_json_path.parent}", "-s", "/./package/", "." ]
-
-            CTX.printer.MessageWithContext("Project package.json path: ", f"{target_package_json_path}", CTX.printer.Indent(1))
-            CTX.printer.MessageWithContext("Pack command: ", f"{(' '.join(pack_command))}", CTX.printer.Indent(1))
-            
-            pack_command_output = utility.RunCommand(pack_command)
-            
-            if pack_command_output.returncode != 0:
-                CTX.printer.WarningMessage(f"Pack command completed with non-zero return code.\n\nSTDOUT:\n{pack_command_output.stdout}")
-            else:
-                CTX.printer.StatusMessage(f"Pack completed.")
+                    slices_succeeded = False
+
+                shutil.rmtree(staging_path)
+                try:
+                    staging_path.parent.rmdir()
+                except OSError:
+                    pass # Other plug-ins are still staging slices
 
-            if dest_demo_path.exists():
-                utility.RunCommand(["mv", dest_demo_path, curr_demo_path])
-                utility.RunCommand(["mv", dest_demo_meta_path, curr_demo_meta_path])
+        return slices_succeeded
+
+    # Prints the size of each plug-in's full package beside its slices, and writes the same report as JSON to the build output folder.
+    def PrintPackageSizeReport(self) -> None:
+        report = dict()
+        for plugin_id, native_plugin in self.native_unity_plugin_table.items():
+            if native_plugin.package_path is None or not native_plugin.package_path.is_file():
+                continue
+
+            package_size = native_plugin.package_path.stat().st_size
+            slice_sizes = {slice_name : slice_path.stat().st_size for slice_name, slice_path in native_plugin.slice_package_paths.items() if slice_path.is_file()}
+            report[plugin_id] = {"package" : package_size, "slices" : slice_sizes}
+
+            self.ctx.printer.MessageWithContext(f"{plugin_id}: ", f"full package {package_size / 1024:.1f} KiB", "\n")
+            for slice_name, slice_size in sorted(slice_sizes.items()):
+                self.ctx.printer.MessageWithContext(f"{slice_name}: ", f"{slice_size / 1024:.1f} KiB ({slice_size / package_size:.0%} of full package)", self.ctx.printer.Indent(1))
+
+        if len(report) == 0:
+            self.ctx.printer.Message("No packages were created.", "\n")
+            return
 
-        os.chdir(working_dir)
+        # Totals for a project which targets one platform: every full package, against the slices for that platform in one config
+        slice_names = sorted({slice_name for plugin_report in report.values() for slice_name in plugin_report["slices"]})
+        total_package_size = sum(plugin_report["package"] for plugin_report in report.values())
+        self.ctx.printer.MessageWithContext("All full packages: ", f"{total_package_size / 1024:.1f} KiB", "\n")
+        for slice_name in slice_names:
+            total_slice_size = sum(plugin_report["slices"].get(slice_name, 0) for plugin_report in report.values())
+            self.ctx.printer.MessageWithContext(f"All {slice_name} slices: ", f"{total_slice_size / 1024:.1f} KiB ({total_slice_size / total_package_size:.0%} of full packages)", self.ctx.printer.Indent(1))
+
+        report_path = self.ctx.build_output_path.joinpath("PackageSizeReport.json")
+        report_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+        self.ctx.printer.MessageWithContext("Package size report written to: ", f"{report_path}", "\n")
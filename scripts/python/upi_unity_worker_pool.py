@@ -0,0 +1,320 @@
+#! /usr/bin/env python3
+# Requirements: python3
+
+import atexit, json, select, shutil, signal, socket, subprocess, threading, time
+
+import scripts.python.upi_utility as utility
+
+from pathlib import Path
+
+from scripts.python.upi_host_locks import HostSemaphore, HostSemaphoreLease
+from scripts.python.upi_utility import CommandLimits, CommandResult, Printer
+
+# Sources of the Editor side of the command loop, copied into a project's Assets folder while a worker has it open (See: scripts/unity/UnityPluginBuildWorker.cs)
+WORKER_SOURCE_PATHS = [Path(__file__).resolve().parents[1].joinpath("unity", "UnityPluginBuildWorker.cs"), Path(__file__).resolve().parents[1].joinpath("unity", "UnityPluginBuildWorker.asmdef")]
+WORKER_FOLDER_NAME = "UnityPluginBuildWorker"
+WORKER_METHOD = "Apple.UnityPlugins.BuildWorker.UnityPluginBuildWorker.Run"
+
+# Commands understood by the worker's command loop
+class UnityWorkerCommandID:
+    TOUCH = "touch"
+    SWITCH_PLATFORM = "switch_platform"
+    BUILD_TESTS = "build_tests"
+    QUIT = "quit"
+
+# Raised when a worker stops answering, exits, or exceeds its limits. The worker is stopped and the command can be run again with a fresh Unity process.
+class UnityWorkerError(Exception):
+    pass
+
+# A batch mode Unity Editor which keeps one project open and runs commands sent over a loopback socket, so the Editor start-up and project load are paid once.
+#   build.py listens on the socket; the Editor connects to it when the worker script starts, and again after each domain reload.
+class UnityWorker:
+    def __init__(self, executable_path : Path, project_path : Path, unity_version : str) -> None:
+        self.executable_path = executable_path
+        self.project_path = project_path
+        self.unity_version = unity_version
+        self.log_path = project_path.joinpath("Logs", "upi_worker.log")
+
+        self.process : subprocess.Popen = None
+        self.listener : socket.socket = None
+        self.connection : socket.socket = None
+        self.received = b""
+        self.next_command_id = 1
+        self.startup_time = 0.0
+
+        # License seat held for the Editor's lifetime, when seats are shared by the builds on the host
+        self.seat_lease : HostSemaphoreLease = None
+        self.stopped = False
+
+        # One command at a time
+        self.lock = threading.Lock()
+
+    def GetInstallPath(self) -> Path:
+        return self.project_path.joinpath("Assets", WORKER_FOLDER_NAME)
+
+    # Copies the worker script into the project, starts Unity and waits for the worker to report that it is ready
+    def Start(self, limits : CommandLimits) -> None:
+        editor_install_path = self.GetInstallPath().joinpath("Editor")
+        editor_install_path.mkdir(parents=True, exist_ok=True)
+        for source_path in WORKER_SOURCE_PATHS:
+            shutil.copy2(source_path, editor_install_path.joinpath(source_path.name))
+
+        self.listener = socket.create_server(("127.0.0.1", 0))
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        self.log_path.unlink(missing_ok=True)
+
+        start_time = time.monotonic()
+        self.process = subprocess.Popen([f"{self.executable_path}", "-batchmode", "-nographics", "-projectPath", f"{self.project_path}", "-logFile", f"{self.log_path}",
+                                         "-executeMethod", WORKER_METHOD, "-buildWorkerPort", f"{self.listener.getsockname()[1]}"],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        self.WaitForReply(0, limits)
+        self.startup_time = time.monotonic() - start_time
+
+    # Sends a command and waits for its reply.
+    # Returns (succeeded, message)
+    def Run(self, command : dict, limits : CommandLimits) -> tuple[bool, str]:
+        if self.connection is None:
+            raise UnityWorkerError("Unity worker is not connected")
+
+        command_id = self.next_command_id
+        self.next_command_id += 1
+        try:
+            self.connection.sendall((json.dumps(dict(command, id=command_id)) + "\n").encode())
+        except OSError as send_error:
+            raise UnityWorkerError(f"Cannot send command to Unity worker: {send_error}")
+
+        reply = self.WaitForReply(command_id, limits)
+        return reply.get("succeeded", False), reply.get("message", "")
+
+    # Waits for the reply with 'command_id', accepting the worker's new connection after a domain reload.
+    #   Growth of the Editor log counts as activity for the inactivity timeout, as it does for one-shot Unity commands.
+    def WaitForReply(self, command_id : int, limits : CommandLimits) -> dict:
+        start_time = time.monotonic()
+        last_activity_time = start_time
+        log_size = -1
+
+        while True:
+            line_end = self.received.find(b"\n")
+            if line_end >= 0:
+                line, self.received = self.received[:line_end], self.received[line_end + 1:]
+                try:
+                    reply = json.loads(line)
+                except ValueError:
+                    continue
+                if reply.get("id") == command_id:
+                    return reply
+                continue
+
+            sockets = [self.listener] + ([self.connection] if self.connection is not None else [])
+            readable, _, _ = select.select(sockets, [], [], 1.0)
+            if self.listener in readable:
+                if self.connection is not None:
+                    self.connection.close()
+                self.connection, _ = self.listener.accept()
+                self.received = b""
+                last_activity_time = time.monotonic()
+            elif self.connection is not None and self.connection in readable:
+                data = self.connection.recv(65536)
+                if len(data) == 0:
+                    # The Editor closes the connection when it reloads its scripting domain; it connects again once the reload has finished
+                    self.connection.close()
+                    self.connection = None
+                else:
+                    self.received += data
+                    last_activity_time = time.monotonic()
+
+            if self.process.poll() is not None:
+                raise UnityWorkerError(f"Unity worker exited with return code {self.process.returncode}")
+
+            now = time.monotonic()
+            if self.log_path.exists() and self.log_path.stat().st_size != log_size:
+                log_size = self.log_path.stat().st_size
+                last_activity_time = now
+
+            if limits.timeout is not None and now - start_time > limits.timeout:
+                raise UnityWorkerError(f"exceeded timeout of {limits.timeout:.0f}s")
+            if limits.inactivity_timeout is not None and now - last_activity_time > limits.inactivity_timeout:
+                raise UnityWorkerError(f"no output for {limits.inactivity_timeout:.0f}s")
+
+    # Asks the worker to quit, kills it if it does not, removes the worker script from the project and gives up its license seat
+    def Stop(self, kill_grace_period : float = 30.0) -> None:
+        self.stopped = True
+        if self.process is not None and self.process.poll() is None:
+            if self.connection is not None:
+                try:
+                    self.Run({"command" : UnityWorkerCommandID.QUIT}, CommandLimits(timeout=kill_grace_period))
+                except (UnityWorkerError, OSError):
+                    pass
+            try:
+                self.process.wait(kill_grace_period)
+            except subprocess.TimeoutExpired:
+                utility.SignalProcessGroup(self.process, signal.SIGKILL)
+                self.process.wait()
+
+        for open_socket in [self.connection, self.listener]:
+            if open_socket is not None:
+                open_socket.close()
+        self.connection = None
+        self.listener = None
+
+        shutil.rmtree(self.GetInstallPath(), ignore_errors=True)
+        self.GetInstallPath().with_name(f"{WORKER_FOLDER_NAME}.meta").unlink(missing_ok=True)
+
+        if self.seat_lease is not None:
+            self.seat_lease.Release()
+            self.seat_lease = None
+
+# Long-lived Unity Editors, one per project and Unity version, which run the touch and test build commands of the project in place of one Unity process per command.
+#   A worker is started by the first command for its project and stopped when the project is released, or when the pool is shut down at the end of the build. Two Editors
+#   cannot open the same project, so a command for a project with a worker of another Unity version (e.g. after an upgrade) stops that worker first.
+#
+#   A project whose worker cannot be started, or which stops answering, is left to one-shot Unity commands for the rest of the build: Run returns None and the caller
+#   runs the command as it would without the pool.
+#
+#   With 'seats', each worker holds a license seat while its Editor runs. A worker which is not running a command gives up its seat, and stops, when another Unity
+#   command of the build is waiting for one; it is started again by its project's next command.
+class UnityWorkerPool:
+    def __init__(self, limits : CommandLimits, seats : HostSemaphore = None) -> None:
+        self.limits = limits
+        self.seats = seats
+        self.workers : dict[Path, UnityWorker] = dict()
+        self.unavailable_projects : set[Path] = set()
+
+        self.lock = threading.Lock()
+        self.started = 0
+        self.commands_run = 0
+        self.failures = 0
+        self.startup_time = 0.0
+
+        # Workers run in their own session and do not see the terminal's Ctrl-C, so they are stopped when build.py exits for any reason
+        atexit.register(self.Shutdown)
+
+    # Runs 'commands' in order in the project's worker, stopping at the first which fails, in place of one Unity command. The part of the worker's log written
+    # meanwhile is copied to 'log_path'.
+    # Returns a CommandResult with return code 0 if every command succeeded, or None if the project has no usable worker
+    def Run(self, executable_path : Path, project_path : Path, unity_version : str, commands : list[dict], log_path : Path, printer : Printer, indent : str = "") -> CommandResult:
+        while True:
+            worker = self.GetWorker(executable_path, project_path, unity_version, printer, indent)
+            if worker is None:
+                return None
+
+            with worker.lock:
+                # The worker may have given up its seat between being returned and being locked; the project's next worker is started
+                if worker.stopped:
+                    continue
+                return self.RunCommands(worker, commands, log_path, printer, indent)
+
+    # Runs 'commands' in a worker locked by the caller
+    def RunCommands(self, worker : UnityWorker, commands : list[dict], log_path : Path, printer : Printer, indent : str = "") -> CommandResult:
+        log_offset = worker.log_path.stat().st_size if worker.log_path.exists() else 0
+        messages = list()
+        succeeded = True
+        try:
+            for command in commands:
+                printer.MessageWithContext("Unity worker command: ", f"{command['command']} {command.get('platform', '')}".rstrip(), indent)
+                succeeded, message = worker.Run(command, self.limits)
+                messages.append(message)
+                if not succeeded:
+                    break
+        except UnityWorkerError as worker_error:
+            printer.WarningMessage(f"Unity worker for {worker.project_path.name} stopped: {worker_error}. Falling back to one Unity process per command.\nCheck Unity log for details: {worker.log_path}")
+            self.Discard(worker, available=False)
+            return None
+        finally:
+            self.CopyLog(worker.log_path, log_offset, log_path)
+
+        with self.lock:
+            self.commands_run += 1
+        return CommandResult([f"{worker.executable_path}", WORKER_METHOD] + [command["command"] for command in commands], 0 if succeeded else 1, '\n'.join(messages))
+
+    # Returns the running worker for a project, starting one if needed, or None if the project has no usable worker
+    def GetWorker(self, executable_path : Path, project_path : Path, unity_version : str, printer : Printer, indent : str = "") -> UnityWorker:
+        project_path = project_path.resolve()
+        with self.lock:
+            if project_path in self.unavailable_projects:
+                return None
+            worker = self.workers.get(project_path)
+
+        if worker is not None and worker.unity_version == unity_version:
+            return worker
+        if worker is not None:
+            self.Discard(worker)
+
+        worker = UnityWorker(executable_path, project_path, unity_version)
+        if self.seats is not None:
+            worker.seat_lease = self.seats.Acquire(f"Unity worker {project_path.name}", on_wait=self.StopIdleWorkers, printer=printer, indent=indent)
+
+        printer.MessageWithContext("Starting Unity worker: ", f"{project_path.name} ({unity_version})", indent)
+        try:
+            worker.Start(self.limits)
+        except (UnityWorkerError, OSError) as worker_error:
+            printer.WarningMessage(f"Unity worker for {project_path.name} did not start: {worker_error}. Falling back to one Unity process per command.\nCheck Unity log for details: {worker.log_path}")
+            self.Discard(worker, available=False)
+            return None
+
+        printer.MessageWithContext("Unity worker ready after: ", f"{worker.startup_time:.1f}s", indent)
+        with self.lock:
+            self.workers[project_path] = worker
+            self.started += 1
+            self.startup_time += worker.startup_time
+        return worker
+
+    def IsRunning(self, project_path : Path) -> bool:
+        with self.lock:
+            return project_path.resolve() in self.workers
+
+    # Stops the worker which has the project open, if any, so that the project's Library can be saved or the project opened by another Unity process
+    def Release(self, project_path : Path) -> None:
+        with self.lock:
+            worker = self.workers.get(project_path.resolve())
+        if worker is not None:
+            self.Discard(worker)
+
+    # Stops the workers which are not running a command, giving up their license seats
+    def StopIdleWorkers(self) -> None:
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            if worker.lock.acquire(blocking=False):
+                try:
+                    self.Discard(worker)
+                finally:
+                    worker.lock.release()
+
+    def Discard(self, worker : UnityWorker, available : bool = True) -> None:
+        with self.lock:
+            if self.workers.get(worker.project_path) is worker:
+                del self.workers[worker.project_path]
+            if not available:
+                self.unavailable_projects.add(worker.project_path)
+                self.failures += 1
+        worker.Stop()
+
+    def Shutdown(self) -> None:
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            self.Discard(worker)
+        atexit.unregister(self.Shutdown)
+
+    @staticmethod
+    def CopyLog(worker_log_path : Path, offset : int, log_path : Path) -> None:
+        if not worker_log_path.exists():
+            return
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(worker_log_path, "rb") as worker_log_file, open(log_path, "wb") as log_file:
+            worker_log_file.seek(offset)
+            shutil.copyfileobj(worker_log_file, log_file)
+
+    def PrintConfiguration(self, printer : Printer) -> None:
+        printer.MessageWithContext("Unity worker command timeout: ", f"{self.limits.timeout:.0f}s" if self.limits.timeout is not None else "None", printer.Indent(1))
+
+    # Reports the Editor start-ups the pool avoided, estimated from the average start-up time of its workers
+    def PrintSummary(self, printer : Printer) -> None:
+        printer.MessageWithContext("Workers started: ", f"{self.started} ({self.startup_time:.1f}s total start-up)", printer.Indent(1))
+        printer.MessageWithContext("Unity commands run in workers: ", f"{self.commands_run}", printer.Indent(1))
+        if self.started > 0:
+            avoided_startups = max(self.commands_run - self.started, 0)
+            printer.MessageWithContext("Editor start-ups avoided: ", f"{avoided_startups} (about {avoided_startups * self.startup_time / self.started:.1f}s)", printer.Indent(1))
+        if self.failures > 0:
+            printer.MessageWithContext("Projects left to one-shot commands: ", f"{self.failures}", printer.Indent(1))
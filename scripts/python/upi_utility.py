@@ -1,7 +1,7 @@
 #! /usr/bin/env python3
 # Requirements: python3
 
-import subprocess
+import codecs, os, resource, select, signal, subprocess, sys, threading, time
 
 from pathlib import Path
 
@@ -216,9 +216,206 @@ def SelectionPrompt(printer: Printer, prompt : str, options : list[any], display
 #-------------------
 # Subprocess Helpers
 
-# Helper runs command with standard set of arguments, returning result from underlying subprocess.run() call.
-def RunCommand(command : list[str]) -> subprocess.CompletedProcess[str]:
-    return subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+# Time limits and retry policy applied to a command by RunCommand
+class CommandLimits:
+    def __init__(self, timeout : float = None, inactivity_timeout : float = None, retries : int = 0, retry_backoff : float = 30.0, retry_on_failure : bool = False) -> None:
+        # Maximum total run time in seconds, or None for no limit
+        self.timeout = timeout
+
+        # Maximum time in seconds without new output (or growth of the watched log file), or None for no limit
+        self.inactivity_timeout = inactivity_timeout
+
+        # Number of additional attempts after a command is killed by the watchdog; the wait before attempt n is retry_backoff * 2^(n-1) seconds
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+        # Also retry commands which exit with a non-zero return code, e.g. for transient license or network failures
+        self.retry_on_failure = retry_on_failure
+
+# Resource usage of a reaped child process, as reported by wait4.
+#   ru_maxrss is the child's own peak; when usages are combined the peak is the largest of them rather than a sum.
+class ResourceUsage:
+    def __init__(self, user_cpu_time : float = 0.0, system_cpu_time : float = 0.0, max_rss_bytes : int = 0, block_input_ops : int = 0, block_output_ops : int = 0) -> None:
+        self.user_cpu_time = user_cpu_time
+        self.system_cpu_time = system_cpu_time
+        self.max_rss_bytes = max_rss_bytes
+        self.block_input_ops = block_input_ops
+        self.block_output_ops = block_output_ops
+
+    @staticmethod
+    def FromRusage(rusage : resource.struct_rusage) -> 'ResourceUsage':
+        # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+        max_rss_bytes = rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024
+        return ResourceUsage(rusage.ru_utime, rusage.ru_stime, max_rss_bytes, rusage.ru_inblock, rusage.ru_oublock)
+
+    # Accumulates 'other' into this usage
+    def Add(self, other : 'ResourceUsage') -> None:
+        self.user_cpu_time += other.user_cpu_time
+        self.system_cpu_time += other.system_cpu_time
+        self.max_rss_bytes = max(self.max_rss_bytes, other.max_rss_bytes)
+        self.block_input_ops += other.block_input_ops
+        self.block_output_ops += other.block_output_ops
+
+# Collects the resource usage of every command RunCommand reaps on the current thread while the collector is active.
+#   Collectors nest; a command's usage is added to every active collector on its thread.
+class ResourceUsageCollector:
+    _active = threading.local()
+
+    def __init__(self) -> None:
+        self.usage = ResourceUsage()
+        self.command_count = 0
+
+    def Start(self) -> None:
+        if not hasattr(ResourceUsageCollector._active, "collectors"):
+            ResourceUsageCollector._active.collectors = list()
+        ResourceUsageCollector._active.collectors.append(self)
+
+    def Stop(self) -> None:
+        collectors = getattr(ResourceUsageCollector._active, "collectors", list())
+        if self in collectors:
+            collectors.remove(self)
+
+    @staticmethod
+    def Record(usage : ResourceUsage) -> None:
+        for collector in getattr(ResourceUsageCollector._active, "collectors", list()):
+            collector.usage.Add(usage)
+            collector.command_count += 1
+
+# Result of RunCommand; a CompletedProcess which also records whether the watchdog killed the command and the resources the command used.
+class CommandResult(subprocess.CompletedProcess):
+    def __init__(self, args : list[str], returncode : int, stdout : str, timed_out : str = "", attempts : int = 1, resource_usage : ResourceUsage = None) -> None:
+        super().__init__(args, returncode, stdout)
+
+        # Empty when the command exited by itself, otherwise a description of the limit which was exceeded
+        self.timed_out = timed_out
+        self.attempts = attempts
+
+        # Usage of the command and the descendants it waited for; summed over all attempts
+        self.resource_usage = resource_usage if resource_usage is not None else ResourceUsage()
+
+# Sends 'kill_signal' to the command's whole process group, so children (e.g. Unity's helper processes) are signalled too.
+def SignalProcessGroup(process : subprocess.Popen, kill_signal : signal.Signals) -> None:
+    try:
+        os.killpg(process.pid, kill_signal)
+    except ProcessLookupError:
+        pass
+
+# Runs a command once, enforcing the limits in 'limits'. Output is collected on a reader thread so that the inactivity watchdog can observe it.
+#   The child is reaped with wait4 so its resource usage can be reported. When a limit is exceeded the process group is sent SIGTERM,
+#   then SIGKILL if it has not exited after 'kill_grace_period' seconds.
+#   Once the child has exited, output is read until the pipe closes or for at most 'drain_period' seconds: a background process the command started may hold
+#   the pipe open for much longer, and is left running.
+def RunCommandOnce(command : list[str], cwd : Path, limits : CommandLimits, watch_path : Path, kill_grace_period : float = 10.0, drain_period : float = 0.5) -> CommandResult:
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=cwd, start_new_session=True)
+
+    output_chunks = list()
+    last_activity_time = [time.monotonic()]
+
+    # Set once the child has exited; the reader stops at this time even if the pipe is still open
+    drain_deadline : list[float] = [None]
+
+    def ReadOutput() -> None:
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        output_fd = process.stdout.fileno()
+        while drain_deadline[0] is None or time.monotonic() < drain_deadline[0]:
+            if len(select.select([output_fd], [], [], 0.05)[0]) == 0:
+                continue
+            output_bytes = os.read(output_fd, 65536)
+            if len(output_bytes) == 0:
+                break
+            output_chunks.append(decoder.decode(output_bytes))
+            last_activity_time[0] = time.monotonic()
+        output_chunks.append(decoder.decode(b"", final=True))
+
+    def StopReading() -> None:
+        drain_deadline[0] = time.monotonic() + drain_period
+        reader_thread.join()
+        process.stdout.close()
+
+    reader_thread = threading.Thread(target=ReadOutput, daemon=True)
+    reader_thread.start()
+
+    start_time = time.monotonic()
+    watch_size = -1
+    timed_out = ""
+    terminate_time : float = None
+    killed = False
+
+    # Most commands are short; start polling quickly and back off to once a second
+    poll_interval = 0.005
+    try:
+        while True:
+            pid, wait_status, rusage = os.wait4(process.pid, os.WNOHANG)
+            if pid != 0:
+                break
+
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, 1.0)
+
+            now = time.monotonic()
+            if terminate_time is not None:
+                if not killed and now - terminate_time > kill_grace_period:
+                    SignalProcessGroup(process, signal.SIGKILL)
+                    killed = True
+                continue
+
+            if watch_path is not None and watch_path.exists():
+                curr_watch_size = watch_path.stat().st_size
+                if curr_watch_size != watch_size:
+                    watch_size = curr_watch_size
+                    last_activity_time[0] = now
+
+            if limits.timeout is not None and now - start_time > limits.timeout:
+                timed_out = f"exceeded timeout of {limits.timeout:.0f}s"
+            elif limits.inactivity_timeout is not None and now - last_activity_time[0] > limits.inactivity_timeout:
+                timed_out = f"no output for {limits.inactivity_timeout:.0f}s"
+
+            if len(timed_out) > 0:
+                SignalProcessGroup(process, signal.SIGTERM)
+                terminate_time = now
+    except BaseException:
+        # Children run in their own session and will not see the terminal's Ctrl-C, so take them down explicitly.
+        SignalProcessGroup(process, signal.SIGKILL)
+        process.wait()
+        StopReading()
+        raise
+
+    # The child was reaped here rather than by Popen, so record its exit status on the Popen object as well
+    process.returncode = os.waitstatus_to_exitcode(wait_status)
+
+    StopReading()
+    output = ''.join(output_chunks).replace("\r\n", "\n").replace("\r", "\n")
+    return CommandResult(command, process.returncode, output, timed_out, resource_usage=ResourceUsage.FromRusage(rusage))
+
+# Helper runs command with standard set of arguments, returning a CommandResult (a subprocess.CompletedProcess).
+#   The command runs in 'cwd' when provided, otherwise in the current working directory.
+#   When 'limits' is provided, the command is killed, along with its children, if it exceeds its timeout or stops producing output, and is then retried as configured.
+#   Only pass limits with retries for idempotent commands. 'watch_path' names a log file whose growth also counts as activity.
+#   The resource usage of every attempt is attached to the result and added to any active ResourceUsageCollector.
+def RunCommand(command : list[str], cwd : Path = None, limits : CommandLimits = None, watch_path : Path = None, printer : Printer = None) -> CommandResult:
+    if limits is None:
+        limits = CommandLimits()
+
+    total_usage = ResourceUsage()
+    attempt = 1
+    while True:
+        result = RunCommandOnce(command, cwd, limits, watch_path)
+        result.attempts = attempt
+
+        ResourceUsageCollector.Record(result.resource_usage)
+        total_usage.Add(result.resource_usage)
+        result.resource_usage = total_usage
+
+        should_retry = len(result.timed_out) > 0 or (limits.retry_on_failure and result.returncode != 0)
+        if not should_retry or attempt > limits.retries:
+            return result
+
+        backoff = limits.retry_backoff * (2 ** (attempt - 1))
+        if printer is not None:
+            failure_description = f"was killed: {result.timed_out}" if len(result.timed_out) > 0 else f"failed with return code {result.returncode}"
+            printer.WarningMessage(f"Command {failure_description}.\n{' '.join(str(part) for part in command)}\nRetrying in {backoff:.0f}s (attempt {attempt + 1} of {limits.retries + 1}).")
+        time.sleep(backoff)
+        attempt += 1
 
 #-------------------------
 # Folder Structure Helpers
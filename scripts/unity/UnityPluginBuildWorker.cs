@@ -0,0 +1,282 @@
+// Command loop for a long-lived batch mode Unity Editor driven by build.py (See: scripts/python/upi_unity_worker_pool.py)
+//
+// build.py copies this file into Assets/UnityPluginBuildWorker/Editor of a Unity project, listens on a loopback port, and starts the Editor with:
+//   Unity -batchmode -nographics -projectPath <project> -logFile <log> -executeMethod Apple.UnityPlugins.BuildWorker.UnityPluginBuildWorker.Run -buildWorkerPort <port>
+//
+// The Editor connects to the port and sends a ready message, then runs one command at a time. Messages are single lines of JSON in both directions:
+//   Command: {"id": 1, "command": "touch" | "switch_platform" | "build_tests" | "quit", "platform": "iOS", "assemblies": ["Apple.Core.Tests"]}
+//   Reply:   {"id": 1, "succeeded": true, "message": "..."}
+//
+// Script compilation and platform switches reload the Editor's scripting domain, which drops the connection and every static field. The port and the command in
+// progress are kept in SessionState, which survives the reload, so the worker reconnects and replies once the reload has finished.
+
+using System;
+using System.IO;
+using System.Net.Sockets;
+using System.Text;
+using UnityEditor;
+using UnityEditor.Build;
+using UnityEditor.Build.Reporting;
+using UnityEditor.TestTools.TestRunner.Api;
+using UnityEngine;
+
+namespace Apple.UnityPlugins.BuildWorker
+{
+    [Serializable]
+    public class WorkerCommand
+    {
+        public int id;
+        public string command;
+        public string platform;
+        public string[] assemblies;
+    }
+
+    [Serializable]
+    public class WorkerReply
+    {
+        public int id;
+        public bool succeeded;
+        public string message;
+    }
+
+    [InitializeOnLoad]
+    public static class UnityPluginBuildWorker
+    {
+        const string PortKey = "Apple.UnityPlugins.BuildWorker.Port";
+        const string PendingCommandKey = "Apple.UnityPlugins.BuildWorker.PendingCommand";
+
+        static TcpClient s_Client;
+        static NetworkStream s_Stream;
+        static readonly StringBuilder s_ReceivedText = new StringBuilder();
+
+        static UnityPluginBuildWorker()
+        {
+            var port = SessionState.GetInt(PortKey, 0);
+            if (port != 0)
+            {
+                EditorApplication.delayCall += () => Connect(port);
+            }
+        }
+
+        // Entry point passed to -executeMethod. Returns straight away; without -quit the Editor keeps running and polls for commands on its update loop.
+        public static void Run()
+        {
+            var args = Environment.GetCommandLineArgs();
+            var portIndex = Array.IndexOf(args, "-buildWorkerPort");
+            if (portIndex < 0 || portIndex + 1 >= args.Length || !int.TryParse(args[portIndex + 1], out var port))
+            {
+                Debug.LogError("UnityPluginBuildWorker: -buildWorkerPort <port> is required.");
+                EditorApplication.Exit(1);
+                return;
+            }
+
+            SessionState.SetInt(PortKey, port);
+            SessionState.EraseString(PendingCommandKey);
+            Connect(port);
+        }
+
+        static void Connect(int port)
+        {
+            try
+            {
+                s_Client = new TcpClient("127.0.0.1", port) { NoDelay = true };
+                s_Stream = s_Client.GetStream();
+            }
+            catch (Exception exception)
+            {
+                // build.py is gone; nothing will send further commands
+                Debug.LogError($"UnityPluginBuildWorker: cannot connect to port {port}: {exception.Message}");
+                EditorApplication.Exit(1);
+                return;
+            }
+
+            EditorApplication.update -= Poll;
+            EditorApplication.update += Poll;
+
+            // A command which reloaded the domain is finished once the worker is running again
+            var pendingCommand = GetPendingCommand();
+            if (pendingCommand == null)
+            {
+                Send(new WorkerReply { id = 0, succeeded = true, message = Application.unityVersion });
+            }
+            else if (pendingCommand.command != "build_tests")
+            {
+                Complete(pendingCommand, !EditorUtility.scriptCompilationFailed, EditorUtility.scriptCompilationFailed ? "Script compilation failed" : "Finished after domain reload");
+            }
+        }
+
+        static void Poll()
+        {
+            if (s_Client == null)
+            {
+                return;
+            }
+
+            if (!s_Client.Connected)
+            {
+                EditorApplication.Exit(0);
+                return;
+            }
+
+            if (GetPendingCommand() != null)
+            {
+                return;
+            }
+
+            while (s_Stream.DataAvailable)
+            {
+                var buffer = new byte[4096];
+                var count = s_Stream.Read(buffer, 0, buffer.Length);
+                if (count <= 0)
+                {
+                    break;
+                }
+                s_ReceivedText.Append(Encoding.UTF8.GetString(buffer, 0, count));
+            }
+
+            var text = s_ReceivedText.ToString();
+            var lineEnd = text.IndexOf('\n');
+            if (lineEnd < 0)
+            {
+                return;
+            }
+
+            s_ReceivedText.Remove(0, lineEnd + 1);
+            Execute(JsonUtility.FromJson<WorkerCommand>(text.Substring(0, lineEnd)));
+        }
+
+        static void Execute(WorkerCommand command)
+        {
+            Debug.Log($"UnityPluginBuildWorker: running command {command.id}: {command.command} {command.platform}");
+            SessionState.SetString(PendingCommandKey, JsonUtility.ToJson(command));
+
+            try
+            {
+                switch (command.command)
+                {
+                    case "touch":
+                        AssetDatabase.Refresh(ImportAssetOptions.ForceSynchronousImport);
+                        AssetDatabase.SaveAssets();
+                        CompleteWhenIdle(command);
+                        break;
+
+                    case "switch_platform":
+                        var target = ParseBuildTarget(command.platform);
+                        if (EditorUserBuildSettings.activeBuildTarget == target)
+                        {
+                            Complete(command, true, "Platform already active");
+                        }
+                        else if (!EditorUserBuildSettings.SwitchActiveBuildTarget(BuildPipeline.GetBuildTargetGroup(target), target))
+                        {
+                            Complete(command, false, $"Cannot switch to {command.platform}");
+                        }
+                        else
+                        {
+                            CompleteWhenIdle(command);
+                        }
+                        break;
+
+                    case "build_tests":
+                        // Test players are written to TestPlayers by the project's ITestPlayerBuildModifier; the reply is sent by TestPlayerBuildCallbacks
+                        var testRunner = ScriptableObject.CreateInstance<TestRunnerApi>();
+                        testRunner.RegisterCallbacks(new TestPlayerBuildCallbacks());
+                        testRunner.Execute(new ExecutionSettings(new Filter
+                        {
+                            testMode = TestMode.PlayMode,
+                            targetPlatform = ParseBuildTarget(command.platform),
+                            assemblyNames = command.assemblies
+                        }));
+                        break;
+
+                    case "quit":
+                        Complete(command, true, "Quitting");
+                        EditorApplication.Exit(0);
+                        break;
+
+                    default:
+                        Complete(command, false, $"Unknown command: {command.command}");
+                        break;
+                }
+            }
+            catch (Exception exception)
+            {
+                Debug.LogException(exception);
+                Complete(command, false, exception.Message);
+            }
+        }
+
+        static BuildTarget ParseBuildTarget(string platform)
+        {
+            if (!Enum.TryParse(platform, out BuildTarget target))
+            {
+                throw new ArgumentException($"Unknown build target: {platform}");
+            }
+            return target;
+        }
+
+        // Replies once imports and compilation triggered by the command are done, unless a domain reload replies first (See: Connect)
+        static void CompleteWhenIdle(WorkerCommand command)
+        {
+            void WaitForIdle()
+            {
+                if (EditorApplication.isCompiling || EditorApplication.isUpdating)
+                {
+                    return;
+                }
+                EditorApplication.update -= WaitForIdle;
+                Complete(command, !EditorUtility.scriptCompilationFailed, EditorUtility.scriptCompilationFailed ? "Script compilation failed" : "Finished");
+            }
+            EditorApplication.update += WaitForIdle;
+        }
+
+        internal static WorkerCommand GetPendingCommand()
+        {
+            var pendingCommandJson = SessionState.GetString(PendingCommandKey, "");
+            return string.IsNullOrEmpty(pendingCommandJson) ? null : JsonUtility.FromJson<WorkerCommand>(pendingCommandJson);
+        }
+
+        internal static void Complete(WorkerCommand command, bool succeeded, string message)
+        {
+            SessionState.EraseString(PendingCommandKey);
+            Debug.Log($"UnityPluginBuildWorker: command {command.id} {(succeeded ? "succeeded" : "failed")}: {message}");
+            Send(new WorkerReply { id = command.id, succeeded = succeeded, message = message });
+        }
+
+        static void Send(WorkerReply reply)
+        {
+            var bytes = Encoding.UTF8.GetBytes(JsonUtility.ToJson(reply) + "\n");
+            s_Stream?.Write(bytes, 0, bytes.Length);
+            s_Stream?.Flush();
+        }
+    }
+
+    // Completes a pending build_tests command when its test player has been built, or when the test run ends without one
+    public class TestPlayerBuildCallbacks : ICallbacks, IPostprocessBuildWithReport
+    {
+        public int callbackOrder => int.MaxValue;
+
+        public void OnPostprocessBuild(BuildReport report)
+        {
+            var pendingCommand = UnityPluginBuildWorker.GetPendingCommand();
+            if (pendingCommand != null && pendingCommand.command == "build_tests")
+            {
+                UnityPluginBuildWorker.Complete(pendingCommand, report.summary.result != BuildResult.Failed, $"Player build {report.summary.result}: {report.summary.outputPath}");
+            }
+        }
+
+        public void RunStarted(ITestAdaptor testsToRun) { }
+
+        public void RunFinished(ITestResultAdaptor result)
+        {
+            var pendingCommand = UnityPluginBuildWorker.GetPendingCommand();
+            if (pendingCommand != null && pendingCommand.command == "build_tests")
+            {
+                UnityPluginBuildWorker.Complete(pendingCommand, false, $"Test run ended before a player was built: {result.Message}");
+            }
+        }
+
+        public void TestStarted(ITestAdaptor test) { }
+
+        public void TestFinished(ITestResultAdaptor result) { }
+    }
+}